@@ -107,11 +107,21 @@ export async function syncGmailMessages() {
     throw new Error(err.detail || "Failed to sync Gmail messages");
   }
 
-  return res.json(); 
+  return res.json(); // { status, job_id, coalesced, jobs }
 }
 
-export async function fetchGmailMessages({ limit = 50, offset = 0 } = {}) {
-  const params = new URLSearchParams({ limit, offset });
+export async function fetchSyncJob(jobId) {
+  const res = await fetch(`${API_URL}/gmail/sync/${jobId}`, {
+    credentials: "include",
+  });
+
+  if (!res.ok) throw new Error("Failed to fetch sync status");
+  return res.json();
+}
+
+export async function fetchGmailMessages({ limit = 50, cursor = "", category } = {}) {
+  const params = new URLSearchParams({ limit, cursor });
+  if (category) params.set("category", category);
 
   const res = await fetch(
     `${API_URL}/gmail/messages?${params.toString()}`,
@@ -119,6 +129,24 @@ export async function fetchGmailMessages({ limit = 50, offset = 0 } = {}) {
   );
 
   if (!res.ok) throw new Error("Failed to fetch Gmail messages");
-  return res.json();
+  return res.json(); // { messages, next_cursor }
 }
 
+export async function fetchGmailMessage(id) {
+  const res = await fetch(`${API_URL}/gmail/messages/${encodeURIComponent(id)}`, {
+    credentials: "include",
+  });
+
+  if (!res.ok) throw new Error("Failed to fetch Gmail message");
+  return res.json(); // { id, subject, from, to, date, body_text, body_html, attachments, ... }
+}
+
+// Live sync progress and message deltas (server-sent events)
+export function openGmailEvents() {
+  return new EventSource(`${API_URL}/gmail/events`, { withCredentials: true });
+}
+
+// Download link; the body is fetched from Gmail on first use, then served locally
+export function gmailAttachmentUrl(id) {
+  return `${API_URL}/gmail/attachments/${id}`;
+}
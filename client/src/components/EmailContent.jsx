@@ -1,6 +1,7 @@
 import React from "react";
-import { ArrowLeft, Reply, Share2, Trash2 } from "lucide-react";
+import { ArrowLeft, Paperclip, Reply, Share2, Trash2 } from "lucide-react";
 import { format } from "date-fns";
+import { gmailAttachmentUrl } from "../api";
 
 const EmailContent = ({ email }) => {
   if (!email)
@@ -49,9 +50,34 @@ const EmailContent = ({ email }) => {
         </div>
       </div>
 
-      <div className="px-6 py-4 overflow-y-auto flex-1 whitespace-pre-line text-neutral-800">
-        {email.body}
-      </div>
+      {email.body_html ? (
+        // Sanitized server-side at ingest (mime_utils.sanitize_html)
+        <div
+          className="px-6 py-4 overflow-y-auto flex-1 text-neutral-800"
+          dangerouslySetInnerHTML={{ __html: email.body_html }}
+        />
+      ) : (
+        <div className="px-6 py-4 overflow-y-auto flex-1 whitespace-pre-line text-neutral-800">
+          {email.body_text ?? email.body}
+        </div>
+      )}
+
+      {email.attachments?.some((a) => a.id) && (
+        <div className="px-6 py-3 border-t border-neutral-200 flex flex-wrap gap-2">
+          {email.attachments
+            .filter((a) => a.id)
+            .map((a) => (
+              <a
+                key={a.id}
+                href={gmailAttachmentUrl(a.id)}
+                className="flex items-center gap-1 px-2 py-1 rounded border border-neutral-200 text-sm text-neutral-800 hover:bg-neutral-100"
+              >
+                <Paperclip className="w-4 h-4" />
+                {a.filename || "attachment"}
+              </a>
+            ))}
+        </div>
+      )}
     </div>
   );
 };
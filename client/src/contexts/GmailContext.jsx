@@ -1,8 +1,10 @@
-import { createContext, useContext, useEffect, useState } from "react";
+import { createContext, useContext, useEffect, useRef, useState } from "react";
 import {
   fetchGmailStatus,
   fetchGmailMessages,
   syncGmailMessages,
+  fetchSyncJob,
+  openGmailEvents,
 } from "../api";
 import { useAuth } from "./AuthContext";
 
@@ -15,8 +17,12 @@ export function GmailProvider({ children }) {
   const [connected, setConnected] = useState(false);
   const [email, setEmail] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [syncing, setSyncing] = useState(false);
+  const [syncProgress, setSyncProgress] = useState(null);
+  // Callbacks waiting on sync job updates, fed by the event stream
+  const jobListeners = useRef(new Set());
 
   // ---- Status ----
   const refreshStatus = async () => {
@@ -31,22 +37,82 @@ export function GmailProvider({ children }) {
   };
 
   // ---- Fetch stored messages ----
-  const loadMessages = async ({ limit = 50, offset = 0 } = {}) => {
+  const loadMessages = async ({ limit = 50 } = {}) => {
     setLoading(true);
     try {
-      const data = await fetchGmailMessages({ limit, offset });
-      setMessages(data);
+      const data = await fetchGmailMessages({ limit });
+      setMessages(data.messages);
+      setNextCursor(data.next_cursor);
     } finally {
       setLoading(false);
     }
   };
 
+  // ---- Fetch the next page of stored messages ----
+  const loadMoreMessages = async ({ limit = 50 } = {}) => {
+    if (!nextCursor) return;
+    setLoading(true);
+    try {
+      const data = await fetchGmailMessages({ limit, cursor: nextCursor });
+      setMessages((prev) => [...prev, ...data.messages]);
+      setNextCursor(data.next_cursor);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  // ---- Apply a job status update ----
+  const applyJobStatus = (job) => {
+    setSyncProgress((prev) => {
+      const others = (prev || []).filter((j) => j.job_id !== job.job_id);
+      return [...others, job].sort((a, b) => a.job_id - b.job_id);
+    });
+    jobListeners.current.forEach((listener) => listener(job));
+  };
+
+  // ---- Merge newly stored messages into the loaded list ----
+  const applyNewMessages = (added) => {
+    setMessages((prev) => {
+      const seen = new Set(prev.map((m) => m.id));
+      // Older than the loaded window: leave them to loadMoreMessages
+      const oldest = nextCursor && prev.length ? prev[prev.length - 1].date : null;
+      const fresh = added.filter((m) => !seen.has(m.id) && (!oldest || m.date >= oldest));
+      if (fresh.length === 0) return prev;
+      return [...fresh, ...prev].sort((a, b) => (a.date < b.date ? 1 : a.date > b.date ? -1 : 0));
+    });
+  };
+
   // ---- Sync Gmail inbox ----
   const syncMessages = async () => {
     setSyncing(true);
     try {
-      await syncGmailMessages();
-      await loadMessages(); // refresh after sync
+      const { jobs } = await syncGmailMessages();
+
+      // Each connected account syncs as its own background job; progress and
+      // new messages arrive on the event stream, so only wait for completion
+      const pending = new Set(jobs.map((job) => job.job_id));
+      const failed = [];
+      await new Promise((resolve) => {
+        const onJob = (job) => {
+          if (!pending.has(job.job_id) || job.status === "queued" || job.status === "running") return;
+          pending.delete(job.job_id);
+          if (job.status === "failed") failed.push(job);
+          if (pending.size === 0) {
+            jobListeners.current.delete(onJob);
+            clearInterval(fallback);
+            resolve();
+          }
+        };
+        jobListeners.current.add(onJob);
+        // Jobs can finish before the stream reports them, or while it reconnects
+        const check = () => Promise.all([...pending].map(fetchSyncJob)).then((s) => s.forEach(applyJobStatus));
+        const fallback = setInterval(check, 10000);
+        check();
+      });
+
+      if (failed.length > 0) {
+        throw new Error(failed[0].error || "Gmail sync failed");
+      }
     } finally {
       setSyncing(false);
     }
@@ -58,9 +124,27 @@ export function GmailProvider({ children }) {
       setConnected(false);
       setEmail(null);
       setMessages([]);
+      setNextCursor(null);
     }
   }, [authenticated, checking]);
 
+  // ---- Live updates ----
+  const handlers = useRef({});
+  handlers.current = { applyJobStatus, applyNewMessages, loadMessages };
+
+  useEffect(() => {
+    if (checking || !authenticated || !connected) return;
+    const source = openGmailEvents();
+    source.addEventListener("sync_progress", (e) => handlers.current.applyJobStatus(JSON.parse(e.data)));
+    source.addEventListener("messages", (e) => handlers.current.applyNewMessages(JSON.parse(e.data).messages));
+    source.addEventListener("messages_deleted", (e) => {
+      const ids = new Set(JSON.parse(e.data).ids);
+      setMessages((prev) => prev.filter((m) => !ids.has(m.id)));
+    });
+    source.addEventListener("resync", () => handlers.current.loadMessages());
+    return () => source.close();
+  }, [authenticated, checking, connected]);
+
   // ---- Load Gmail status after auth ----
   useEffect(() => {
     if (!checking && authenticated) {
@@ -74,10 +158,13 @@ export function GmailProvider({ children }) {
         connected,
         email,
         messages,
+        hasMoreMessages: nextCursor !== null,
         loading,
         syncing,
+        syncProgress,
         refreshStatus,
         loadMessages,
+        loadMoreMessages,
         syncMessages,
       }}
     >
@@ -0,0 +1,127 @@
+"""Compare the per-row ORM message insert against the set-based bulk path.
+
+Both paths run against a table pre-seeded with --seed rows and store the
+same pages of 50 message IDs, half of which already exist.
+
+    python -m bench.bench_bulk_insert --seed 100000 --pages 200
+    python -m bench.bench_bulk_insert --url postgresql+psycopg2://.../bench_db
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PAGE_SIZE = 50
+
+
+def _row(account_id: int, index: int) -> dict:
+    return {
+        "gmail_account_id": account_id,
+        "gmail_message_id": f"{index:016x}",
+        "thread_id": f"{index // 3:016x}",
+        "snippet": f"Synthetic message {index}",
+        "internal_date": datetime(2024, 1, 1) + timedelta(minutes=index),
+        "payload": {"id": f"{index:016x}", "snippet": f"Synthetic message {index}"},
+    }
+
+
+def _pages(seed: int, pages: int) -> list[list[int]]:
+    # Each page overlaps the seeded range by half, like a resync over known mail
+    half = PAGE_SIZE // 2
+    return [
+        list(range(seed - (p + 1) * half, seed - p * half)) + list(range(seed + p * half, seed + (p + 1) * half))
+        for p in range(pages)
+    ]
+
+
+def legacy_store(db, GmailMessage, account_id: int, indexes: list[int]) -> int:
+    stored = 0
+    for index in indexes:
+        row = _row(account_id, index)
+        exists = db.query(GmailMessage).filter(
+            GmailMessage.gmail_account_id == account_id,
+            GmailMessage.gmail_message_id == row["gmail_message_id"],
+        ).first()
+        if exists:
+            continue
+        db.add(GmailMessage(**row))
+        stored += 1
+    db.commit()
+    return stored
+
+
+def bulk_store(db, GmailMessage, insert_gmail_messages, account_id: int, indexes: list[int]) -> int:
+    rows = [_row(account_id, index) for index in indexes]
+    existing = {
+        r[0] for r in db.query(GmailMessage.gmail_message_id).filter(
+            GmailMessage.gmail_account_id == account_id,
+            GmailMessage.gmail_message_id.in_([r["gmail_message_id"] for r in rows]),
+        )
+    }
+    inserted = insert_gmail_messages(db, [r for r in rows if r["gmail_message_id"] not in existing])
+    db.commit()
+    return len(inserted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="database URL (defaults to a temporary SQLite file)")
+    parser.add_argument("--seed", type=int, default=100_000, help="rows already in the table")
+    parser.add_argument("--pages", type=int, default=200, help="pages of 50 IDs to store")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if not args.url:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.url
+
+    from db import Base, engine, SessionLocal, User, GmailAccount, GmailMessage, insert_gmail_messages
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    user = User(name="bench", email="bench@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    accounts = {}
+    for name in ("legacy", "bulk"):
+        account = GmailAccount(user_id=user.id, google_email=f"{name}@example.com")
+        db.add(account)
+        db.flush()
+        accounts[name] = account.id
+    db.commit()
+
+    print(f"Seeding {args.seed} rows per account ...")
+    for account_id in accounts.values():
+        for start in range(0, args.seed, 5000):
+            db.execute(GmailMessage.__table__.insert(), [_row(account_id, i) for i in range(start, min(start + 5000, args.seed))])
+        db.commit()
+
+    pages = _pages(args.seed, args.pages)
+    results = {}
+    for name, store in (
+        ("legacy", lambda ids: legacy_store(db, GmailMessage, accounts["legacy"], ids)),
+        ("bulk", lambda ids: bulk_store(db, GmailMessage, insert_gmail_messages, accounts["bulk"], ids)),
+    ):
+        started = time.perf_counter()
+        stored = sum(store(ids) for ids in pages)
+        elapsed = time.perf_counter() - started
+        results[name] = (stored, elapsed)
+
+    db.close()
+    processed = len(pages) * PAGE_SIZE
+    print(f"{'path':<8} {'stored':>8} {'seconds':>9} {'IDs/s':>10} {'rows/s':>10}")
+    for name, (stored, elapsed) in results.items():
+        print(f"{name:<8} {stored:>8} {elapsed:>9.3f} {processed / elapsed:>10.0f} {stored / elapsed:>10.0f}")
+    print(f"speedup: {results['legacy'][1] / results['bulk'][1]:.1f}x")
+
+    if tmpdir:
+        engine.dispose()
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Throughput of the message classifier on synthetic mail.
+
+Generates labelled messages from per-category templates mixed with filler
+words, then times utils.classifier.classify_texts for each batch size and
+worker count, reporting messages/s and agreement with the template labels.
+
+    python -m bench.bench_classifier --messages 100000 --batch-sizes 128,512,2048 --workers 0,1,2,4
+"""
+import argparse
+import os
+import random
+import time
+
+TEMPLATES = {
+    "primary": [
+        ("Re: {topic}", "{name}@example.com", "Hi, thanks for the notes on {topic}. Can we talk tomorrow?"),
+        ("Lunch on {day}?", "{name}@example.com", "Are you free on {day}? Let me know what works for you."),
+        ("Draft for review", "{name}@example.org", "Attached is the draft of {topic}, please send comments."),
+    ],
+    "promotions": [
+        ("{pct}% off {topic} this weekend", "deals@shop{n}.com", "Shop now, limited time offer. Free shipping on orders."),
+        ("Exclusive deal for you", "offers@store{n}.com", "Use coupon code SAVE{pct} at checkout and save big."),
+        ("Flash sale ends tonight", "hello@brand{n}.com", "Last chance: lowest prices of the season, buy now."),
+    ],
+    "newsletters": [
+        ("The Weekly Digest #{n}", "newsletter@news{n}.com", "Top stories this week on {topic}. Read more inside."),
+        ("{day} briefing", "digest@media{n}.com", "Headlines and analysis: the week in review on {topic}."),
+        ("Issue {n}: {topic}", "updates@blog{n}.com", "In this edition: articles, a podcast episode and more."),
+    ],
+    "notifications": [
+        ("Your verification code", "no-reply@accounts{n}.com", "Your code is {n}. Do not share this code with anyone."),
+        ("Security alert", "alerts@bank{n}.com", "New sign-in to your account from a new device."),
+        ("Your order has shipped", "noreply@orders{n}.com", "Track your package; delivery expected {day}."),
+    ],
+}
+TOPICS = ["the budget", "q3 planning", "the launch", "hiring", "the offsite", "pricing", "design review"]
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday"]
+NAMES = ["alice", "bob", "carol", "dave", "erin", "frank"]
+FILLER = "the of and to in for on with as at by from this that it is be are was".split()
+
+
+def synthetic_messages(count: int, seed: int = 7) -> tuple[list[tuple], list[str]]:
+    rng = random.Random(seed)
+    messages, labels = [], []
+    for _ in range(count):
+        label = rng.choice(list(TEMPLATES))
+        subject, sender, snippet = rng.choice(TEMPLATES[label])
+        fields = {
+            "topic": rng.choice(TOPICS), "day": rng.choice(DAYS), "name": rng.choice(NAMES),
+            "n": rng.randint(1, 999), "pct": rng.choice([10, 20, 30, 50, 70]),
+        }
+        body = snippet.format(**fields) + " " + " ".join(rng.choices(FILLER, k=rng.randint(20, 200)))
+        messages.append((subject.format(**fields), sender.format(**fields), snippet.format(**fields), body))
+        labels.append(label)
+    return messages, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--batch-sizes", default="128,512,2048")
+    parser.add_argument("--workers", default="0,1,2,4", help="comma-separated pool sizes; 0 scores inline")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    from utils import classifier
+
+    messages, labels = synthetic_messages(args.messages)
+    texts = [classifier.message_text(*m) for m in messages]
+    print(f"messages={args.messages} features={classifier.NUM_FEATURES} cpus={os.cpu_count()}")
+    print(f"{'workers':>7} {'batch':>6} {'seconds':>8} {'msgs/s':>9} {'accuracy':>9}")
+
+    for workers in (int(w) for w in args.workers.split(",")):
+        for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+            # A fresh pool per configuration; worker start-up is timed too
+            classifier._pool = None
+            classifier.CLASSIFY_WORKERS = workers
+            started = time.perf_counter()
+            predicted = classifier.classify_texts(texts, batch_size=batch_size)
+            seconds = time.perf_counter() - started
+            if classifier._pool is not None:
+                classifier._pool.shutdown()
+            accuracy = sum(p == label for p, label in zip(predicted, labels)) / len(labels)
+            print(f"{workers:>7} {batch_size:>6} {seconds:>8.2f} {len(texts) / seconds:>9.0f} {accuracy:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Concurrent Gmail-bound requests against a single API worker.
+
+Runs the app under uvicorn (one process, one event loop) next to the fake
+Gmail server with a high simulated latency, fires ``--concurrency`` OAuth
+callbacks at once (each waits on two Google calls) and meanwhile measures
+/me latency. With the async routes the callbacks finish in roughly two
+round trips regardless of the threadpool size, and /me stays fast.
+
+The driver, the fake and the API share one process (and one GIL), so on a
+small machine throughput is CPU-bound well before the event loop is; the
+numbers are a lower bound. Size ASYNC_DB_POOL_SIZE for the concurrency.
+
+    python -m bench.bench_concurrency --concurrency 200 --latency-ms 500
+    python -m bench.bench_concurrency --concurrency 2000 --url postgresql://...
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from urllib.parse import parse_qs, urlparse
+
+from bench.bench_e2e import _free_port, _peak_rss_mib, _percentile
+
+
+async def _drive(base_url: str, concurrency: int, probes: int) -> None:
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency + 10)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        credentials = {"email": "bench@example.com", "password": "benchmark-password"}
+        (await client.post("/signup", json={"name": "bench", **credentials})).raise_for_status()
+        auth_url = (await client.post("/gmail/connect")).json()["auth_url"]
+        state = parse_qs(urlparse(auth_url).query)["state"][0]
+
+        async def callback() -> float:
+            started = time.perf_counter()
+            res = await client.get("/gmail/callback", params={"code": "bench", "state": state})
+            res.raise_for_status()
+            return time.perf_counter() - started
+
+        async def probe_me() -> list[float]:
+            latencies = []
+            for _ in range(probes):
+                started = time.perf_counter()
+                (await client.get("/me")).raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(0.01)
+            return latencies
+
+        started = time.perf_counter()
+        callbacks = asyncio.gather(*(callback() for _ in range(concurrency)))
+        me_latencies = await probe_me()
+        durations = await callbacks
+        wall = time.perf_counter() - started
+
+    print(f"callbacks    {concurrency} concurrent in {wall:.2f}s ({concurrency / wall:.0f}/s), "
+          f"p50 {statistics.median(durations) * 1000:.0f} ms, p99 {_percentile(durations, 99) * 1000:.0f} ms")
+    print(f"/me under load  p50 {statistics.median(me_latencies):.1f} ms, p99 {_percentile(me_latencies, 99):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="database URL (defaults to a temporary SQLite file)")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="mean simulated Google API latency")
+    parser.add_argument("--probes", type=int, default=50, help="/me requests issued during the load")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if not args.url:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    from dev.fake_gmail import create_app, fake_gmail_env, serve_in_thread
+
+    fake_port = _free_port()
+    serve_in_thread(create_app(10, latency_ms=args.latency_ms), port=fake_port)
+
+    os.environ.update(fake_gmail_env(f"http://127.0.0.1:{fake_port}"))
+    os.environ["DATABASE_URL"] = args.url
+    os.environ["HTTP_POOL_SIZE"] = str(args.concurrency * 2)
+    for name in ("GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "GOOGLE_REDIRECT_URI"):
+        os.environ.setdefault(name, "bench")
+
+    from db import Base, engine
+    Base.metadata.drop_all(bind=engine)
+    import main as api
+
+    api_port = _free_port()
+    server = serve_in_thread(api.app, port=api_port)
+    print(f"concurrency={args.concurrency} latency={args.latency_ms}ms db={engine.dialect.name}")
+    asyncio.run(_drive(f"http://127.0.0.1:{api_port}", args.concurrency, args.probes))
+    print(f"peak RSS {_peak_rss_mib():.1f} MiB")
+
+    server.should_exit = True
+    if tmpdir:
+        engine.dispose()
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
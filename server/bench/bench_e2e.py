@@ -0,0 +1,208 @@
+"""End-to-end benchmark of the API against the offline Gmail/OAuth stand-in.
+
+Starts dev.fake_gmail in a background thread, points the server at it and
+drives the real FastAPI app through its HTTP interface: signup/login, /me,
+the OAuth connect + callback, a full sync, an incremental sync after new
+mail arrives, token refresh and cursor-paged listing. Prints per-scenario
+throughput and p50/p99 latency, plus peak RSS of the process.
+
+    python -m bench.bench_e2e --messages 2000 --latency-ms 20 --body-kb 4
+    python -m bench.bench_e2e --url postgresql://... --json results.json
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+PAGE_SIZE = 50
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _peak_rss_mib() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Results:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, name: str, latencies_ms: list[float], items: int | None = None, seconds: float | None = None):
+        seconds = seconds if seconds is not None else sum(latencies_ms) / 1000
+        row = {
+            "scenario": name,
+            "calls": len(latencies_ms),
+            "p50_ms": round(statistics.median(latencies_ms), 2),
+            "p99_ms": round(_percentile(latencies_ms, 99), 2),
+            "per_sec": round((items if items is not None else len(latencies_ms)) / seconds, 1) if seconds else None,
+            "unit": "messages" if items is not None else "requests",
+        }
+        self.rows.append(row)
+        print(
+            f"{name:<18} {row['calls']:>6} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+            f"{row['per_sec'] or 0:>10.1f} {row['unit']}/s"
+        )
+
+
+def _timed(fn, repeat: int) -> list[float]:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="database URL (defaults to a temporary SQLite file)")
+    parser.add_argument("--messages", type=int, default=1000, help="synthetic mailbox size")
+    parser.add_argument("--new-messages", type=int, default=100, help="mail delivered before the incremental sync")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="mean simulated Gmail API latency")
+    parser.add_argument("--body-kb", type=int, default=2, help="extra body text per message")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Gmail calls answered with 429")
+    parser.add_argument(
+        "--quota", type=float, default=250.0,
+        help="Gmail quota units/s per account; the real limit of 250 caps sync at ~50 messages/s",
+    )
+    parser.add_argument("--requests", type=int, default=100, help="calls per request/response scenario")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if not args.url:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    from dev.fake_gmail import create_app, fake_gmail_env, serve_in_thread
+
+    port = _free_port()
+    fake = create_app(args.messages, args.error_rate, args.latency_ms, args.body_kb)
+    server = serve_in_thread(fake, port=port)
+
+    # Configuration is read at import time, so the environment goes first
+    os.environ.update(fake_gmail_env(f"http://127.0.0.1:{port}"))
+    os.environ["DATABASE_URL"] = args.url
+    os.environ["GMAIL_QUOTA_UNITS_PER_SECOND"] = str(args.quota)
+    for name in ("GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "GOOGLE_REDIRECT_URI"):
+        os.environ.setdefault(name, "bench")
+
+    from fastapi.testclient import TestClient
+
+    from db import Base, engine, SessionLocal, GmailToken
+    from utils.token_manager import token_manager
+
+    Base.metadata.drop_all(bind=engine)
+    import main as api
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    client = TestClient(api.app)
+    results = Results()
+    print(
+        f"mailbox={args.messages} latency={args.latency_ms}ms body={args.body_kb}KB "
+        f"error_rate={args.error_rate} quota={args.quota}/s db={engine.dialect.name}"
+    )
+    print(f"{'scenario':<18} {'calls':>6} {'p50 ms':>9} {'p99 ms':>9} {'throughput':>10}")
+
+    # ---------- Auth ----------
+    credentials = {"email": "bench@example.com", "password": "benchmark-password"}
+    client.post("/signup", json={"name": "bench", **credentials}).raise_for_status()
+    results.add("login", _timed(lambda: client.post("/login", json=credentials).raise_for_status(), args.requests))
+    results.add("me", _timed(lambda: client.get("/me").raise_for_status(), args.requests))
+
+    # ---------- OAuth connect ----------
+    def connect():
+        auth_url = client.post("/gmail/connect").json()["auth_url"]
+        state = parse_qs(urlparse(auth_url).query)["state"][0]
+        client.get("/gmail/callback", params={"code": "bench", "state": state}).raise_for_status()
+
+    results.add("oauth_connect", _timed(connect, 1))
+
+    # ---------- Sync ----------
+    def run_sync() -> tuple[float, dict]:
+        started = time.perf_counter()
+        job_id = client.post("/gmail/sync").json()["job_id"]
+        while True:
+            job = client.get(f"/gmail/sync/{job_id}").json()
+            if job["status"] in ("done", "failed"):
+                break
+            time.sleep(0.05)
+        if job["status"] == "failed":
+            raise RuntimeError(f"Sync failed: {job.get('error')}")
+        return time.perf_counter() - started, job
+
+    seconds, job = run_sync()
+    results.add("full_sync", [seconds * 1000], items=job["messages_stored"], seconds=seconds)
+
+    fake.state.mailbox.deliver(args.new_messages)
+    seconds, job = run_sync()
+    results.add("incremental_sync", [seconds * 1000], items=job["messages_stored"], seconds=seconds)
+
+    # ---------- Token refresh ----------
+    db = SessionLocal()
+    token = db.query(GmailToken).first()
+    account_id = token.gmail_account_id
+
+    def refresh():
+        token_manager.invalidate(account_id)
+        db.query(GmailToken).filter(GmailToken.gmail_account_id == account_id).update(
+            {"expires_at": datetime.utcnow() - timedelta(minutes=1)}
+        )
+        db.commit()
+        token_manager.get_access_token(account_id)
+
+    results.add("token_refresh", _timed(refresh, min(args.requests, 20)))
+    db.close()
+
+    # ---------- Listing ----------
+    def page_through() -> int:
+        pages, cursor = 0, None
+        while True:
+            params = {"limit": PAGE_SIZE, "cursor": cursor or ""}
+            body = client.get("/gmail/messages", params=params).json()
+            pages += 1
+            cursor = body.get("next_cursor")
+            if not cursor:
+                return pages
+
+    started = time.perf_counter()
+    pages = page_through()
+    seconds = time.perf_counter() - started
+    results.add("list_pages", [seconds * 1000 / pages] * pages, seconds=seconds)
+    results.add("list_first_page", _timed(lambda: client.get("/gmail/messages", params={"limit": PAGE_SIZE, "cursor": ""}), args.requests))
+
+    peak = _peak_rss_mib()
+    print(f"peak RSS {peak:.1f} MiB")
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"config": vars(args), "peak_rss_mib": round(peak, 1), "results": results.rows}, fh, indent=2)
+
+    client.close()
+    server.should_exit = True
+    engine.dispose()
+    if tmpdir:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Per-page latency and memory of /gmail/messages for mailboxes with large payloads.
+
+Compares the old listing (full GmailMessage rows, payload included, encoded
+with FastAPI's default JSONResponse) against the current column-projected,
+orjson-encoded route.
+
+    python -m bench.bench_list_messages --messages 2000 --payload-kb 64
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+PAGE_SIZE = 50
+
+
+def _html_payload(index: int, size_kb: int) -> dict:
+    html = "<html><body>" + ("<p>Lorem ipsum dolor sit amet, consectetur adipiscing.</p>" * (size_kb * 18)) + "</body></html>"
+    return {
+        "id": f"{index:016x}",
+        "snippet": f"Synthetic message {index}",
+        "payload": {"mimeType": "text/html", "body": {"data": html}},
+    }
+
+
+def _measure(fn, pages: int) -> tuple[list[float], list[int]]:
+    latencies, peaks = [], []
+    for page in range(pages):
+        tracemalloc.start()
+        started = time.perf_counter()
+        fn(page * PAGE_SIZE)
+        latencies.append((time.perf_counter() - started) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return latencies, peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="database URL (defaults to a temporary SQLite file)")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--payload-kb", type=int, default=64, help="approximate HTML payload size per message")
+    parser.add_argument("--pages", type=int, default=20, help="pages of 50 to list")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if not args.url:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.url
+    for name in ("GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "GOOGLE_REDIRECT_URI"):
+        os.environ.setdefault(name, "bench")
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    from db import Base, engine, SessionLocal, User, GmailAccount, GmailMessage
+    from routes.gmail_routes import _list_messages
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    user = User(name="bench", email="bench@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    account = GmailAccount(user_id=user.id, google_email="bench@example.com")
+    db.add(account)
+    db.commit()
+
+    print(f"Seeding {args.messages} messages with ~{args.payload_kb} KB payloads ...")
+    for start in range(0, args.messages, 200):
+        db.execute(GmailMessage.__table__.insert(), [
+            {
+                "gmail_account_id": account.id,
+                "gmail_message_id": f"{i:016x}",
+                "thread_id": f"{i // 3:016x}",
+                "snippet": f"Synthetic message {i}",
+                "internal_date": datetime(2024, 1, 1) + timedelta(minutes=i),
+                "payload": _html_payload(i, args.payload_kb),
+            }
+            for i in range(start, min(start + 200, args.messages))
+        ])
+        db.commit()
+
+    account_id = account.id
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+
+    def legacy_page(offset: int) -> bytes:
+        db = SessionLocal()
+        messages = db.query(GmailMessage).filter(
+            GmailMessage.gmail_account_id == account_id
+        ).order_by(GmailMessage.internal_date.desc()).offset(offset).limit(PAGE_SIZE).all()
+        items = [
+            {"id": m.gmail_message_id, "thread_id": m.thread_id, "snippet": m.snippet, "date": m.internal_date}
+            for m in messages
+        ]
+        body = JSONResponse(jsonable_encoder(items)).body
+        db.close()
+        return body
+
+    def projected_page(offset: int) -> bytes:
+        db = SessionLocal()
+        body = _list_messages(db, user, None, PAGE_SIZE, offset, None).body
+        db.close()
+        return body
+
+    pages = min(args.pages, max(args.messages // PAGE_SIZE, 1))
+    print(f"{'path':<10} {'p50 ms':>8} {'mean ms':>8} {'peak MiB':>9}")
+    for name, fn in (("legacy", legacy_page), ("projected", projected_page)):
+        latencies, peaks = _measure(fn, pages)
+        print(
+            f"{name:<10} {statistics.median(latencies):>8.2f} {statistics.mean(latencies):>8.2f} "
+            f"{max(peaks) / 2**20:>9.2f}"
+        )
+
+    if tmpdir:
+        engine.dispose()
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Space and hot-table scan time before and after payload archiving.
+
+Seeds a temporary SQLite mailbox with synthetic ``format=full`` messages
+(dev.fake_gmail), then archives the oldest ``--archive-fraction`` of them
+with each codec. Reports database size after VACUUM, a full scan of
+gmail_messages over the parsed columns, and the cost of rehydrating every
+archived payload.
+
+    python -m bench.bench_payload_tiering --messages 20000 --body-kb 8 --archive-fraction 0.8
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Touches every row without an index: the shape of search rebuilds and
+# unindexed filters
+SCAN_SQL = "SELECT count(*) FROM gmail_messages WHERE sender LIKE '%@example.org' OR length(subject) > 200"
+
+
+def _seed(db, account_id: int, count: int, body_kb: int) -> None:
+    from db import GmailMessage
+    from dev.fake_gmail import build_message
+    from utils.mime_utils import parse_message
+
+    for start in range(0, count, 500):
+        rows = []
+        for i in range(start, min(start + 500, count)):
+            detail = build_message(i, body_kb)
+            rows.append({
+                "gmail_account_id": account_id,
+                "gmail_message_id": detail["id"],
+                "thread_id": detail["threadId"],
+                "snippet": detail["snippet"],
+                "internal_date": datetime(2024, 1, 1) + timedelta(minutes=i),
+                "payload": detail,
+                **parse_message(detail),
+            })
+        db.execute(GmailMessage.__table__.insert(), rows)
+        db.commit()
+
+
+def _scan_ms(engine, repeats: int = 5) -> float:
+    from sqlalchemy import text
+
+    timings = []
+    with engine.connect() as conn:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            conn.execute(text(SCAN_SQL)).scalar()
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def _vacuum(engine, path: str) -> float:
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    return os.path.getsize(path) / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--body-kb", type=int, default=8, help="plain-text body size per message")
+    parser.add_argument("--archive-fraction", type=float, default=0.8, help="share of messages old enough to archive")
+    parser.add_argument("--codecs", default="zstd,gzip")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    path = os.path.join(tmpdir.name, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    for name in ("GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "GOOGLE_REDIRECT_URI"):
+        os.environ.setdefault(name, "bench")
+
+    from db import Base, engine, SessionLocal, User, GmailAccount, GmailMessage
+    from utils.payload_archive import archive_payloads, payload_query, row_payload, zstandard
+
+    cutoff = datetime(2024, 1, 1) + timedelta(minutes=int(args.messages * args.archive_fraction))
+    print(f"messages={args.messages} body_kb={args.body_kb} archived<{cutoff:%Y-%m-%d %H:%M}")
+    print(f"{'tier':<8} {'db MiB':>8} {'scan ms':>8} {'archived':>9} {'ratio':>6} {'archive s':>9} {'rehydrate s':>11}")
+
+    for codec in ["none"] + args.codecs.split(","):
+        if codec == "zstd" and zstandard is None:
+            print(f"{codec:<8} skipped: zstandard is not installed")
+            continue
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        db = SessionLocal()
+        user = User(name="bench", email="bench@example.com", password_hash="x")
+        db.add(user)
+        db.flush()
+        account = GmailAccount(user_id=user.id, google_email="bench@example.com")
+        db.add(account)
+        db.commit()
+        _seed(db, account.id, args.messages, args.body_kb)
+
+        stats, archive_s, rehydrate_s = None, 0.0, 0.0
+        if codec != "none":
+            started = time.perf_counter()
+            stats = archive_payloads(db, cutoff, codec=codec)
+            archive_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            query = payload_query(db, GmailMessage.id).filter(GmailMessage.payload_archived_at.isnot(None))
+            assert all(row_payload(row) for row in query.yield_per(500))
+            rehydrate_s = time.perf_counter() - started
+        db.close()
+
+        size = _vacuum(engine, path)
+        scan = _scan_ms(engine)
+        if stats:
+            ratio = stats["raw_bytes"] / stats["stored_bytes"]
+            print(f"{codec:<8} {size:>8.1f} {scan:>8.2f} {stats['messages']:>9} {ratio:>5.1f}x {archive_s:>9.2f} {rehydrate_s:>11.2f}")
+        else:
+            print(f"{codec:<8} {size:>8.1f} {scan:>8.2f} {0:>9} {'-':>6} {'-':>9} {'-':>11}")
+
+    engine.dispose()
+    tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
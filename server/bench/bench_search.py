@@ -0,0 +1,147 @@
+"""First-page latency of /gmail/search on a large multi-user corpus.
+
+Seeds ``--users`` mailboxes sharing ``--messages`` indexed messages, then
+runs search_messages for one user at a time with a term every message
+contains, a prefix matching 10% of messages, a 1% term and a rare term.
+Because every mailbox uses the same vocabulary, a query that is not
+scoped by account before ranking gets slower as other users' mail grows.
+Reports p50/p95 per query against ``--target-ms``.
+
+    python -m bench.bench_search --messages 1000000 --users 200
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PAGE_SIZE = 50
+# Filler vocabulary; query terms are planted at fixed rates below
+WORDS = [f"w{n}" for n in range(5000)]
+QUERIES = {
+    "common": "report",      # every message
+    "10%": "sched",          # prefix of "schedule"
+    "1%": "invoice",
+    "rare": "zephyr",        # one in 5000
+}
+
+
+def _document(rng: random.Random, index: int) -> dict:
+    words = rng.choices(WORDS, k=40)
+    draw = rng.random()
+    if draw < 0.1:
+        words.append("schedule")
+    if draw < 0.01:
+        words.append("invoice")
+    if draw < 0.0002:
+        words.append("zephyr")
+    body = " ".join(words)
+    return {
+        "subject": f"{' '.join(words[:4])} report",
+        "sender": f"sender{index % 997}@example.com",
+        "snippet": body[:120],
+        "body": body,
+    }
+
+
+def _seed(db, account_ids: list[int], count: int) -> None:
+    from db import GmailMessage
+    from utils.search_utils import index_messages
+
+    rng = random.Random(8)
+    batch = 2000
+    for start in range(0, count, batch):
+        stop = min(start + batch, count)
+        rows = [
+            {
+                "gmail_account_id": account_ids[i % len(account_ids)],
+                "gmail_message_id": f"{i:016x}",
+                "thread_id": f"{i // 3:016x}",
+                "snippet": f"Synthetic message {i}",
+                "internal_date": datetime(2024, 1, 1) + timedelta(seconds=i),
+            }
+            for i in range(start, stop)
+        ]
+        ids = db.execute(GmailMessage.__table__.insert().returning(GmailMessage.id), rows).scalars().all()
+        documents: dict[int, dict[int, dict]] = {}
+        for message_id, row in zip(ids, rows):
+            documents.setdefault(row["gmail_account_id"], {})[message_id] = _document(rng, message_id)
+        for account_id, docs in documents.items():
+            index_messages(db, account_id, docs)
+        db.commit()
+        if stop % 100_000 == 0 or stop == count:
+            print(f"  seeded {stop}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="database URL (defaults to a temporary SQLite file)")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=200, help="mailboxes the messages are spread over")
+    parser.add_argument("--queries", type=int, default=50, help="searches per query term, each for a random user")
+    parser.add_argument("--target-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    tmpdir = None
+    if not args.url:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    os.environ["DATABASE_URL"] = args.url
+    for name in ("GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "GOOGLE_REDIRECT_URI"):
+        os.environ.setdefault(name, "bench")
+
+    from sqlalchemy import text
+
+    from db import Base, engine, SessionLocal, User, GmailAccount
+    from utils.search_utils import ensure_search_index, search_messages
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS gmail_message_search"))
+        conn.execute(text("DROP TABLE IF EXISTS gmail_message_fts"))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    ensure_search_index(engine)
+
+    db = SessionLocal()
+    account_ids = []
+    for n in range(args.users):
+        user = User(name=f"bench{n}", email=f"bench{n}@example.com", password_hash="x")
+        db.add(user)
+        db.flush()
+        account = GmailAccount(user_id=user.id, google_email=f"bench{n}@example.com")
+        db.add(account)
+        db.flush()
+        account_ids.append(account.id)
+    db.commit()
+
+    print(f"Seeding {args.messages} messages over {args.users} mailboxes ...")
+    started = time.perf_counter()
+    _seed(db, account_ids, args.messages)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(25)
+    print(f"{'query':<8} {'p50 ms':>8} {'p95 ms':>8} {'rows':>5} {'target':>7}")
+    failed = False
+    for name, q in QUERIES.items():
+        latencies, rows = [], 0
+        for _ in range(args.queries):
+            account_id = rng.choice(account_ids)
+            started = time.perf_counter()
+            rows = len(search_messages(db, [account_id], q, PAGE_SIZE + 1))
+            latencies.append((time.perf_counter() - started) * 1000)
+        p95 = statistics.quantiles(latencies, n=20)[18] if len(latencies) > 1 else latencies[0]
+        ok = p95 <= args.target_ms
+        failed |= not ok
+        print(f"{name:<8} {statistics.median(latencies):>8.2f} {p95:>8.2f} {rows:>5} {'ok' if ok else 'MISS':>7}")
+    db.close()
+
+    if tmpdir:
+        engine.dispose()
+        tmpdir.cleanup()
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
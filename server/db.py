@@ -1,32 +1,114 @@
+import logging
 import os
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 
 from sqlalchemy import (
     create_engine,
     Column,
+    BigInteger,
     Integer,
+    LargeBinary,
     String,
     Boolean,
     DateTime,
     ForeignKey,
     UniqueConstraint,
+    Index,
     Text,
     JSON,
+    event,
+    inspect,
+    text,
 )
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, relationship, sessionmaker
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+from utils.metrics import DB_COMMIT_SECONDS, DB_QUERY_SECONDS, record_stage
 
 load_dotenv()
 
+logger = logging.getLogger("db")
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL not set")
 
+# Async drivers for the same database, used by the async routes
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_database_url(url: str) -> str:
+    """Rewrite a sync SQLAlchemy URL to use the dialect's async driver."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver configured for {parsed.get_backend_name()}; set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
 engine = create_engine(DATABASE_URL, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+# Async routes can have far more requests in flight than the sync threadpool,
+# so their pool is sized separately
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "20"))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20"))
+ASYNC_DB_POOL_TIMEOUT = float(os.getenv("ASYNC_DB_POOL_TIMEOUT", "30"))
+
+# In-memory SQLite uses a single static connection, which takes no pool sizing
+_async_pool_args = {} if make_url(ASYNC_DATABASE_URL).database in (None, "", ":memory:") else {
+    "pool_size": ASYNC_DB_POOL_SIZE,
+    "max_overflow": ASYNC_DB_MAX_OVERFLOW,
+    "pool_timeout": ASYNC_DB_POOL_TIMEOUT,
+}
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_async_pool_args)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
+# ---------- Instrumentation ----------
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_started", time.perf_counter())
+    operation = statement.lstrip()[:7].split(None, 1)[0].upper() if statement.strip() else ""
+    DB_QUERY_SECONDS.observe(elapsed, operation=operation if operation in SQL_OPERATIONS else "OTHER")
+    record_stage("db", elapsed)
+
+
+# Async engines emit these events through their underlying sync engine
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# Registered on Session itself so AsyncSession commits are timed as well
+@event.listens_for(Session, "before_commit")
+def _before_commit(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        DB_COMMIT_SECONDS.observe(elapsed)
+        record_stage("commit", elapsed)
+
+
 # ---------- DB session dependency ----------
 def get_db():
     db = SessionLocal()
@@ -36,6 +118,46 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Async counterpart of get_db, for ``async def`` routes.
+
+    Existing query code written against Session can run unchanged on the
+    event loop through ``await db.run_sync(fn, ...)``.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ---------- Bulk helpers ----------
+def insert_gmail_messages(db, rows: list[dict]) -> list[tuple[int, str]]:
+    """Bulk insert GmailMessage rows, skipping any that already exist.
+
+    Uses INSERT ... ON CONFLICT DO NOTHING on uq_gmail_message where the
+    dialect supports it. Returns ``(id, gmail_message_id)`` for the rows
+    actually inserted.
+    """
+    if not rows:
+        return []
+
+    table = GmailMessage.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        # Callers pre-filter existing IDs, so a plain insert is safe here
+        result = db.execute(table.insert().returning(table.c.id, table.c.gmail_message_id), rows)
+        return [tuple(row) for row in result]
+
+    stmt = (
+        insert(table)
+        .on_conflict_do_nothing(index_elements=["gmail_account_id", "gmail_message_id"])
+        .returning(table.c.id, table.c.gmail_message_id)
+    )
+    return [tuple(row) for row in db.execute(stmt, rows)]
+
+
 # ---------- User ----------
 class User(Base):
     __tablename__ = "users"
@@ -67,6 +189,10 @@ class GmailAccount(Base):
     )
     google_email = Column(String, nullable=False)
     connected_at = Column(DateTime, default=datetime.utcnow)
+    # Gmail historyId as of the last completed sync, used for incremental syncs
+    history_id = Column(String, nullable=True)
+    # Bumped whenever sync adds or removes messages; drives listing ETags
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="gmail_accounts")
 
@@ -123,7 +249,25 @@ class GmailMessage(Base):
     thread_id = Column(String, nullable=False)
     internal_date = Column(DateTime, index=True)
     snippet = Column(Text)
-    payload = Column(JSON, nullable=False)
+    # NULL once moved to gmail_payload_archive (utils.payload_archive)
+    payload = Column(JSON(none_as_null=True))
+    payload_archived_at = Column(DateTime)
+
+    # Parsed from the payload at ingest (utils.mime_utils.parse_message)
+    subject = Column(Text)
+    sender = Column(Text)
+    recipients = Column(Text)
+    body_text = Column(Text)
+    body_html = Column(Text)
+    attachments = Column(JSON)
+
+    # utils.classifier.CATEGORIES; NULL until classified after the page commits
+    category = Column(String)
+
+    # utils.similarity: MinHash signature and near-duplicate cluster
+    # (the representative's id); NULL until indexed
+    minhash = Column(LargeBinary)
+    cluster_id = Column(Integer)
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -138,5 +282,290 @@ class GmailMessage(Base):
             "gmail_message_id",
             name="uq_gmail_message",
         ),
+        # Backs keyset pagination ordered by (internal_date, id) per account
+        Index(
+            "ix_gmail_messages_account_date_id",
+            "gmail_account_id",
+            internal_date.desc(),
+            id.desc(),
+        ),
+        # Category-filtered listings, same keyset order
+        Index(
+            "ix_gmail_messages_account_category_date_id",
+            "gmail_account_id",
+            "category",
+            internal_date.desc(),
+            id.desc(),
+        ),
+        # Cluster members newest first, for /similar and collapsed listings
+        Index(
+            "ix_gmail_messages_cluster_date_id",
+            "cluster_id",
+            internal_date.desc(),
+            id.desc(),
+        ),
+        # Fetches one conversation's messages in date order
+        Index(
+            "ix_gmail_messages_account_thread_date",
+            "gmail_account_id",
+            "thread_id",
+            internal_date,
+        ),
+    )
+
+
+# ---------- Gmail attachments ----------
+class GmailAttachment(Base):
+    """Attachment of a stored message.
+
+    Indexed at ingest from the parsed metadata; the body is fetched from
+    Gmail on first download and kept in the content-addressed store
+    (utils.attachment_store) under ``sha256``.
+    """
+
+    __tablename__ = "gmail_attachments"
+
+    id = Column(Integer, primary_key=True)
+    message_id = Column(
+        Integer,
+        ForeignKey("gmail_messages.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    part_id = Column(String, nullable=False)
+    attachment_id = Column(Text, nullable=False)
+    filename = Column(Text)
+    mime_type = Column(String)
+    size = Column(Integer)
+
+    # NULL until the body has been fetched
+    sha256 = Column(String(64), index=True)
+    fetched_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("message_id", "part_id", name="uq_gmail_attachment"),
+    )
+
+
+# ---------- Archived payloads ----------
+class GmailPayloadArchive(Base):
+    """Compressed ``format=full`` payload of an old message (utils.payload_archive)."""
+
+    __tablename__ = "gmail_payload_archive"
+
+    message_id = Column(
+        Integer,
+        ForeignKey("gmail_messages.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # "zstd" or "gzip"
+    codec = Column(String(8), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    raw_size = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ---------- Near-duplicate index ----------
+class GmailLshBucket(Base):
+    """LSH band bucket of a near-duplicate cluster representative (utils.similarity)."""
+
+    __tablename__ = "gmail_lsh_buckets"
+
+    id = Column(Integer, primary_key=True)
+    gmail_account_id = Column(
+        Integer,
+        ForeignKey("gmail_accounts.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    message_id = Column(
+        Integer,
+        ForeignKey("gmail_messages.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
     )
+    bucket = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index("ix_gmail_lsh_buckets_account_bucket", "gmail_account_id", "bucket"),
+    )
+
+
+# ---------- Gmail threads ----------
+class GmailThread(Base):
+    """Per-conversation summary, maintained incrementally by the sync path."""
+
+    __tablename__ = "gmail_threads"
+
+    id = Column(Integer, primary_key=True)
+    gmail_account_id = Column(
+        Integer,
+        ForeignKey("gmail_accounts.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    thread_id = Column(String, nullable=False)
+    last_message_date = Column(DateTime)
+    message_count = Column(Integer, nullable=False, default=0)
+    participants = Column(JSON, nullable=False, default=list)
+    snippet = Column(Text)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("gmail_account_id", "thread_id", name="uq_gmail_thread"),
+        Index(
+            "ix_gmail_threads_account_date_id",
+            "gmail_account_id",
+            last_message_date.desc(),
+            id.desc(),
+        ),
+    )
+
+
+
+# ---------- Sync jobs ----------
+class SyncJob(Base):
+    __tablename__ = "sync_jobs"
+
+    id = Column(Integer, primary_key=True)
+    gmail_account_id = Column(
+        Integer,
+        ForeignKey("gmail_accounts.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    # queued -> running -> done | failed
+    status = Column(String, nullable=False, default="queued")
+    mode = Column(String)
+    pages_done = Column(Integer, nullable=False, default=0)
+    messages_seen = Column(Integer, nullable=False, default=0)
+    messages_stored = Column(Integer, nullable=False, default=0)
+    messages_total = Column(Integer)
+    error = Column(Text)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    # Written periodically by the worker while the job runs; see utils.sync_jobs
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    gmail_account = relationship("GmailAccount")
+
+    __table_args__ = (
+        # At most one active job per account; concurrent requests coalesce onto it
+        Index(
+            "uq_sync_job_active",
+            "gmail_account_id",
+            unique=True,
+            sqlite_where=text("status IN ('queued', 'running')"),
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+
+# ---------- Sync checkpoints ----------
+class GmailSyncCheckpoint(Base):
+    """Where an unfinished full sync of an account stopped.
+
+    Written in the same transaction as each stored page and deleted when
+    the walk completes, so a restarted sync resumes after the last
+    committed page.
+    """
+
+    __tablename__ = "gmail_sync_checkpoints"
+
+    gmail_account_id = Column(
+        Integer,
+        ForeignKey("gmail_accounts.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # Token of the next messages.list page; NULL before the first page
+    page_token = Column(Text)
+    # Mailbox historyId taken before the walk started; becomes the account's when it completes
+    history_id = Column(String)
+    pages_done = Column(Integer, nullable=False, default=0)
+    messages_seen = Column(Integer, nullable=False, default=0)
+    messages_stored = Column(Integer, nullable=False, default=0)
+    messages_total = Column(Integer)
+
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class GmailSyncRetry(Base):
+    """A message whose details could not be fetched, retried by later syncs."""
+
+    __tablename__ = "gmail_sync_retries"
+
+    id = Column(Integer, primary_key=True)
+    gmail_account_id = Column(
+        Integer,
+        ForeignKey("gmail_accounts.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    gmail_message_id = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=1)
+    last_error = Column(Text)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("gmail_account_id", "gmail_message_id", name="uq_gmail_sync_retry"),
+    )
+
+
+# ---------- Schema upgrades ----------
+def _rebuild_sqlite_table(conn, table, existing: set[str]) -> None:
+    """Recreate ``table`` from the model and copy its rows over.
+
+    SQLite cannot change a column's nullability in place; this is its
+    documented twelve-step rebuild, minus triggers and views (there are none).
+    """
+    preparer = conn.dialect.identifier_preparer
+    name = preparer.format_table(table)
+    new_name = preparer.quote(f"{table.name}_new")
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect))
+    conn.execute(text(ddl.replace(f"CREATE TABLE {name} ", f"CREATE TABLE {new_name} ", 1)))
+    columns = ", ".join(preparer.quote(c.name) for c in table.columns if c.name in existing)
+    conn.execute(text(f"INSERT INTO {new_name} ({columns}) SELECT {columns} FROM {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+    conn.execute(text(f"ALTER TABLE {new_name} RENAME TO {name}"))
+
+
+def upgrade_schema(bind: Engine) -> None:
+    """Bring tables created by an older release up to the current models.
+
+    ``create_all`` only creates missing tables, so columns and indexes added
+    to existing tables are applied here: missing columns are added, columns
+    that became nullable lose NOT NULL, and missing indexes are created.
+    Columns are never dropped or tightened. Run it before ``create_all``.
+    """
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        preparer = conn.dialect.identifier_preparer
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            name = preparer.format_table(table)
+            existing = {c["name"]: c for c in inspector.get_columns(table.name)}
+            missing = [c for c in table.columns if c.name not in existing]
+            relaxed = [c for c in table.columns if c.name in existing and c.nullable and not existing[c.name]["nullable"]]
+
+            if relaxed and conn.dialect.name == "sqlite":
+                logger.info("Rebuilding %s to allow NULL in %s", table.name, ", ".join(c.name for c in relaxed))
+                _rebuild_sqlite_table(conn, table, set(existing))
+            else:
+                for column in missing:
+                    logger.info("Adding column %s.%s", table.name, column.name)
+                    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                    conn.execute(text(f"ALTER TABLE {name} ADD COLUMN {ddl}"))
+                for column in relaxed:
+                    logger.info("Dropping NOT NULL on %s.%s", table.name, column.name)
+                    conn.execute(text(f"ALTER TABLE {name} ALTER COLUMN {preparer.quote(column.name)} DROP NOT NULL"))
 
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
@@ -0,0 +1,351 @@
+"""Local stand-in for the Gmail API and Google OAuth, for running offline.
+
+Implements every endpoint utils/gmail_utils.py calls: messages list/get,
+batch, profile, history, token, userinfo and revoke. The mailbox is
+synthetic, with configurable size, body size, latency and error rate.
+
+Run with:
+    python -m dev.fake_gmail --port 8765 --messages 500 --latency-ms 20
+
+and point the server at it with fake_gmail_env(...), i.e.:
+    GMAIL_API_BASE=http://127.0.0.1:8765/gmail/v1
+    GMAIL_BATCH_URL=http://127.0.0.1:8765/batch/gmail/v1
+    GOOGLE_TOKEN_URL=http://127.0.0.1:8765/token
+    GOOGLE_USERINFO_URL=http://127.0.0.1:8765/oauth2/v2/userinfo
+    GOOGLE_REVOKE_URL=http://127.0.0.1:8765/revoke
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email import policy
+from email.parser import BytesParser
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, HTTPException, Request, Response
+
+API_PREFIX = "/gmail/v1"
+PAGE_SIZE_DEFAULT = 100
+
+
+# ---------- Synthetic mailbox ----------
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+FAKE_EMAIL = "me@example.com"
+FILLER = "The quick brown fox jumps over the lazy dog. "
+
+
+def attachment_data(message_id: str, part_id: str) -> bytes:
+    """Deterministic attachment bytes for a message part."""
+    return (f"Attachment {part_id} of message {message_id}\n" * 64).encode("utf-8")
+
+
+def build_message(index: int, body_kb: int = 0) -> dict:
+    sent = datetime(2024, 1, 1) + timedelta(minutes=index)
+    message_id = f"{index:016x}"
+    body = f"Hello,\n\nThis is synthetic message number {index}.\n"
+    body += FILLER * (body_kb * 1024 // len(FILLER))
+    markup = (
+        f"<html><head><style>p {{ color: red; }}</style></head><body>"
+        f"<p>Hello,</p><p>This is <b>synthetic</b> message number {index}.</p>"
+        f"<p>{FILLER * (body_kb * 1024 // len(FILLER))}</p>"
+        f'<a href="https://example.com/{index}" onclick="track()">Link</a></body></html>'
+    )
+    parts = [{
+        "partId": "0",
+        "mimeType": "multipart/alternative",
+        "filename": "",
+        "body": {"size": 0},
+        "parts": [
+            {"partId": "0.0", "mimeType": "text/plain", "filename": "", "body": {"size": len(body), "data": _b64(body)}},
+            {"partId": "0.1", "mimeType": "text/html", "filename": "", "body": {"size": len(markup), "data": _b64(markup)}},
+        ],
+    }]
+    # Every fifth message carries a small attachment, fetched separately
+    if index % 5 == 0:
+        parts.append({
+            "partId": "1",
+            "mimeType": "text/plain",
+            "filename": f"notes-{index}.txt",
+            "body": {"size": len(attachment_data(message_id, "1")), "attachmentId": f"att-{message_id}-1"},
+        })
+    return {
+        "id": message_id,
+        "threadId": f"{index // 3:016x}",
+        "labelIds": ["INBOX"],
+        "snippet": f"This is synthetic message number {index}",
+        "historyId": str(1000 + index),
+        "internalDate": str(int(sent.timestamp() * 1000)),
+        "sizeEstimate": len(body) + len(markup),
+        "payload": {
+            "mimeType": "multipart/mixed",
+            "headers": [
+                {"name": "Subject", "value": f"Synthetic message {index}"},
+                {"name": "From", "value": f"sender{index % 17}@example.com"},
+                {"name": "To", "value": "me@example.com"},
+            ],
+            "body": {"size": 0},
+            "parts": parts,
+        },
+    }
+
+
+class FakeMailbox:
+    def __init__(self, size: int, body_kb: int = 0):
+        self.body_kb = body_kb
+        # Newest first, the way messages.list returns them
+        self.messages = [build_message(i, body_kb) for i in reversed(range(size))]
+        self.by_id = {m["id"]: m for m in self.messages}
+        self.next_index = size
+        self.history_id = 1000 + size
+        # Change log for users.history.list: (historyId, kind, message ref)
+        self.history: list[tuple[int, str, dict]] = []
+
+    def list_page(self, page_token: str | None, max_results: int) -> dict:
+        start = int(page_token or 0)
+        page = self.messages[start:start + max_results]
+        data = {
+            "messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+            "resultSizeEstimate": len(self.messages),
+        }
+        if start + max_results < len(self.messages):
+            data["nextPageToken"] = str(start + max_results)
+        return data
+
+    def get(self, message_id: str) -> dict | None:
+        return self.by_id.get(message_id)
+
+    def profile(self) -> dict:
+        return {
+            "emailAddress": FAKE_EMAIL,
+            "messagesTotal": len(self.messages),
+            "threadsTotal": len({m["threadId"] for m in self.messages}),
+            "historyId": str(self.history_id),
+        }
+
+    def deliver(self, count: int) -> list[dict]:
+        delivered = []
+        for _ in range(count):
+            message = build_message(self.next_index, self.body_kb)
+            self.next_index += 1
+            self.history_id += 1
+            message["historyId"] = str(self.history_id)
+            self.messages.insert(0, message)
+            self.by_id[message["id"]] = message
+            self.history.append((self.history_id, "messagesAdded", message))
+            delivered.append(message)
+        return delivered
+
+    def delete(self, message_id: str) -> bool:
+        message = self.by_id.pop(message_id, None)
+        if not message:
+            return False
+        self.messages.remove(message)
+        self.history_id += 1
+        self.history.append((self.history_id, "messagesDeleted", message))
+        return True
+
+    def changes_since(self, start_history_id: int) -> list[dict] | None:
+        """History records after ``start_history_id``, or None if it predates the log."""
+        if start_history_id < 1000:
+            return None
+        return [
+            {
+                "id": str(history_id),
+                kind: [{"message": {"id": m["id"], "threadId": m["threadId"]}}],
+            }
+            for history_id, kind, m in self.history
+            if history_id > start_history_id
+        ]
+
+
+def create_app(
+    mailbox_size: int = 200,
+    error_rate: float = 0.0,
+    latency_ms: float = 0.0,
+    body_kb: int = 0,
+) -> FastAPI:
+    app = FastAPI()
+    app.state.mailbox = FakeMailbox(mailbox_size, body_kb)
+    app.state.revoked = set()
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        # Simulated round-trip time, with +/-50% jitter
+        if latency_ms and not request.url.path.startswith("/_fake"):
+            await asyncio.sleep(latency_ms * random.uniform(0.5, 1.5) / 1000)
+
+        # Simulate Gmail throttling on a fraction of API calls
+        if error_rate and not request.url.path.startswith("/_fake") and random.random() < error_rate:
+            return Response(
+                content=json.dumps({"error": {"code": 429, "message": "Rate Limit Exceeded"}}),
+                status_code=429,
+                media_type="application/json",
+                headers={"Retry-After": "0"},
+            )
+        return await call_next(request)
+
+    # ---------- OAuth ----------
+    @app.post("/token")
+    async def token(request: Request):
+        # Form-encoded body, parsed by hand to avoid needing python-multipart
+        form = {k: v[0] for k, v in parse_qs((await request.body()).decode()).items()}
+        grant_type, code, refresh_token = form.get("grant_type"), form.get("code"), form.get("refresh_token")
+        if grant_type == "authorization_code" and code:
+            return {
+                "access_token": f"access-{uuid.uuid4().hex}",
+                "refresh_token": f"refresh-{uuid.uuid4().hex}",
+                "expires_in": 3599,
+                "token_type": "Bearer",
+            }
+        if grant_type == "refresh_token" and refresh_token and refresh_token not in app.state.revoked:
+            return {"access_token": f"access-{uuid.uuid4().hex}", "expires_in": 3599, "token_type": "Bearer"}
+        raise HTTPException(400, "invalid_grant")
+
+    @app.get("/oauth2/v2/userinfo")
+    def userinfo():
+        return {"id": "1", "email": FAKE_EMAIL, "verified_email": True}
+
+    @app.post("/revoke")
+    def revoke(token: str):
+        app.state.revoked.add(token)
+        return {}
+
+    # ---------- Gmail API ----------
+    @app.get(f"{API_PREFIX}/users/me/messages")
+    def list_messages(pageToken: str | None = None, maxResults: int = PAGE_SIZE_DEFAULT):
+        return app.state.mailbox.list_page(pageToken, maxResults)
+
+    @app.get(f"{API_PREFIX}/users/me/messages/{{message_id}}")
+    def get_message(message_id: str):
+        message = app.state.mailbox.get(message_id)
+        if not message:
+            raise HTTPException(404, "Requested entity was not found.")
+        return message
+
+    @app.get(f"{API_PREFIX}/users/me/messages/{{message_id}}/attachments/{{attachment_id}}")
+    def get_attachment(message_id: str, attachment_id: str):
+        prefix = f"att-{message_id}-"
+        if not app.state.mailbox.get(message_id) or not attachment_id.startswith(prefix):
+            raise HTTPException(404, "Requested entity was not found.")
+        data = attachment_data(message_id, attachment_id[len(prefix):])
+        return {"size": len(data), "data": base64.urlsafe_b64encode(data).decode("ascii")}
+
+    @app.get(f"{API_PREFIX}/users/me/profile")
+    def get_profile():
+        return app.state.mailbox.profile()
+
+    @app.get(f"{API_PREFIX}/users/me/history")
+    def list_history(startHistoryId: int, pageToken: str | None = None, maxResults: int = 500):
+        records = app.state.mailbox.changes_since(startHistoryId)
+        if records is None:
+            raise HTTPException(404, "Requested entity was not found.")
+        start = int(pageToken or 0)
+        data = {
+            "history": records[start:start + maxResults],
+            "historyId": str(app.state.mailbox.history_id),
+        }
+        if start + maxResults < len(records):
+            data["nextPageToken"] = str(start + maxResults)
+        return data
+
+    # Test hooks for simulating mailbox activity
+    @app.post("/_fake/deliver")
+    def deliver(count: int = 1):
+        return {"delivered": [m["id"] for m in app.state.mailbox.deliver(count)]}
+
+    @app.post("/_fake/delete/{message_id}")
+    def delete(message_id: str):
+        if not app.state.mailbox.delete(message_id):
+            raise HTTPException(404, "Requested entity was not found.")
+        return {"deleted": message_id}
+
+    @app.post("/batch/gmail/v1")
+    async def batch(request: Request):
+        content_type = request.headers.get("content-type", "")
+        envelope = f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + await request.body()
+        parsed = BytesParser(policy=policy.HTTP).parsebytes(envelope)
+        if not parsed.is_multipart():
+            raise HTTPException(400, "Expected multipart/mixed body")
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part in parsed.iter_parts():
+            content_id = (part.get("Content-ID") or "").strip().strip("<>")
+            request_line = (part.get_payload(decode=True) or b"").decode("utf-8").splitlines()[0]
+            match = re.match(rf"GET {API_PREFIX}/users/me/messages/([^?\s]+)", request_line)
+            message = app.state.mailbox.get(match.group(1)) if match else None
+            if message:
+                status, body = "200 OK", json.dumps(message)
+            else:
+                status, body = "404 Not Found", json.dumps({"error": {"code": 404}})
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n"
+                "\r\n"
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n"
+                "\r\n"
+                f"{body}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+        return Response(
+            content="".join(parts).encode("utf-8"),
+            media_type=f"multipart/mixed; boundary={boundary}",
+        )
+
+    return app
+
+
+def fake_gmail_env(base_url: str) -> dict:
+    """Environment variables that point the API server at a fake instance."""
+    return {
+        "GMAIL_API_BASE": f"{base_url}{API_PREFIX}",
+        "GMAIL_BATCH_URL": f"{base_url}/batch/gmail/v1",
+        "GOOGLE_AUTH_URL": f"{base_url}/auth",
+        "GOOGLE_TOKEN_URL": f"{base_url}/token",
+        "GOOGLE_USERINFO_URL": f"{base_url}/oauth2/v2/userinfo",
+        "GOOGLE_REVOKE_URL": f"{base_url}/revoke",
+    }
+
+
+def serve_in_thread(app: FastAPI, host: str = "127.0.0.1", port: int = 8765):
+    """Run the fake under uvicorn in a daemon thread; returns the server."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True, name="fake-gmail")
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Fake Gmail server failed to start on {host}:{port}")
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Gmail API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--messages", type=int, default=200, help="synthetic mailbox size")
+    parser.add_argument("--body-kb", type=int, default=0, help="extra body text per message, in KB")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean simulated latency per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.messages, args.error_rate, args.latency_ms, args.body_kb),
+        host=args.host,
+        port=args.port,
+    )
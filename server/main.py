@@ -1,9 +1,29 @@
+import logging
+import os
+import time
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 from routes import auth_routes, gmail_routes
-from db import Base, engine
+from db import Base, engine, upgrade_schema
+from utils.metrics import (
+    CONTENT_TYPE,
+    HTTP_REQUEST_SECONDS,
+    finish_request_profile,
+    render,
+    server_timing,
+    start_request_profile,
+)
+from utils.search_utils import ensure_search_index
+from utils.sync_jobs import recover_jobs
+
+# Per-request stage profiling: "off", "header" (requests sending
+# X-Profile: 1) or "all"
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "off").lower()
+
+logger = logging.getLogger("main")
 
 app = FastAPI()
 
@@ -18,11 +38,47 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+upgrade_schema(engine)
 Base.metadata.create_all(bind=engine)
+ensure_search_index(engine)
+recover_jobs()
 
 app.include_router(auth_routes.router)
 app.include_router(gmail_routes.router)
 
+# ---------- Instrumentation ----------
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    profiled = PROFILE_REQUESTS == "all" or (
+        PROFILE_REQUESTS == "header" and request.headers.get("x-profile") == "1"
+    )
+    token = start_request_profile() if profiled else None
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        elapsed = time.perf_counter() - started
+        stages = finish_request_profile(token) if profiled else None
+
+    # Label by route template, not raw path, to keep cardinality bounded
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    if profiled:
+        response.headers["Server-Timing"] = server_timing(stages, elapsed)
+        logger.info("Profile %s %s: %s", request.method, request.url.path, response.headers["Server-Timing"])
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/")
 def root():
     return {"message": "Mailwise API is running"}
@@ -8,9 +8,11 @@ from utils.auth_utils import (
     verify_password,
     create_jwt_token,
     get_current_user,
+    invalidate_cached_user,
     normalize_email,
     set_auth_cookie,
 )
+from utils.metrics import AUTH_FAILURES
 
 router = APIRouter()
 
@@ -61,6 +63,7 @@ def login(payload: LoginRequest, response: Response, db: Session = Depends(get_d
 
     user = db.query(User).filter(User.email == email).first()
     if not user or not verify_password(payload.password, user.password_hash):
+        AUTH_FAILURES.inc(reason="bad_credentials")
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     token = create_jwt_token(user.id)
@@ -91,18 +94,21 @@ def update_user(payload: UpdateUserRequest, db: Session = Depends(get_db), curre
     if existing:
         raise HTTPException(status_code=400, detail="Email already in use")
 
-    current_user.name = payload.name.strip()
-    current_user.email = email
+    # current_user may be a detached cached instance; update the session's copy
+    user = db.query(User).filter(User.id == current_user.id).first()
+    user.name = payload.name.strip()
+    user.email = email
 
     db.commit()
-    db.refresh(current_user)
+    db.refresh(user)
+    invalidate_cached_user(user.id)
 
     return {
         "status": "ok",
         "user": {
-            "id": current_user.id,
-            "name": current_user.name,
-            "email": current_user.email
+            "id": user.id,
+            "name": user.name,
+            "email": user.email
         }
     }
 
@@ -1,154 +1,656 @@
+import asyncio
+import logging
+import os
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-
-from utils.auth_utils import get_current_user
-from utils.gmail_utils import (
-    build_gmail_auth_url,
-    exchange_code_for_tokens,
-    fetch_google_profile,
-    revoke_gmail_token,
-    create_oauth_state,
-    verify_oauth_state,
-    fetch_gmail_messages,
-    fetch_gmail_message_detail,
-    refresh_access_token,
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from starlette.concurrency import run_in_threadpool
+
+from utils import events, gmail_async
+from utils.attachment_store import attachment_ids, blob_lock, blob_path, has_blob, mark_fetched, store_blob
+from utils.auth_utils import get_current_user, get_current_user_async
+from utils.classifier import CATEGORIES
+from utils.export_utils import DEFAULT_EXPORT_FIELDS, EXPORT_FIELDS, gzip_stream, iter_export_lines
+from utils.gmail_utils import GmailApiError, build_gmail_auth_url, create_oauth_state, verify_oauth_state
+from utils.listing_cache import listing_cache, listing_etag, etag_matches, cache_key
+from utils.message_content import CONTENT_COLUMNS, message_cache, parse_stored_message, render_content
+from utils.pagination import encode_cursor, decode_cursor, merge_newest_first
+from utils.responses import FastJSONResponse
+from utils.search_utils import search_messages
+from utils.similarity import similar_messages
+from utils.sync_jobs import enqueue_sync, job_status
+from utils.token_manager import token_manager
+
+from db import (
+    User,
+    GmailAccount,
+    GmailAttachment,
+    GmailToken,
+    GmailMessage,
+    GmailThread,
+    SyncJob,
+    get_async_db,
+    get_db,
 )
 
-from db import User, GmailAccount, GmailToken, GmailMessage, get_db
+logger = logging.getLogger("gmail_routes")
 
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# Routes are async: Google calls go through utils.gmail_async and queries
+# written against Session run on the event loop via AsyncSession.run_sync,
+# so neither holds a threadpool worker while it waits.
 router = APIRouter(prefix="/gmail", tags=["gmail"])
 
 
 # ---------- Connect Gmail ----------
 @router.post("/connect")
-def connect_gmail(current_user: User = Depends(get_current_user)):
+async def connect_gmail(current_user: User = Depends(get_current_user_async)):
     state = create_oauth_state(user_id=current_user.id)
     auth_url = build_gmail_auth_url(state)
-    print(f"[GMAIL] User {current_user.id} initiating OAuth connect")
+    logger.info("User %s initiating OAuth connect", current_user.id)
     return {"auth_url": auth_url}
 
 
 # ---------- OAuth callback ----------
 @router.get("/callback")
-def gmail_callback(code: str, state: str, db: Session = Depends(get_db)):
-    print("[GMAIL] OAuth callback received")
+async def gmail_callback(code: str, state: str, db: AsyncSession = Depends(get_async_db)):
+    logger.info("OAuth callback received")
     payload = verify_oauth_state(state)
     user_id = payload.get("user_id")
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    if await db.get(User, user_id) is None:
         raise HTTPException(400, "Invalid OAuth state")
+    # Hand the connection back to the pool while we wait on Google
+    await db.rollback()
 
-    token_data = exchange_code_for_tokens(code)
-    profile = fetch_google_profile(token_data["access_token"])
+    token_data = await gmail_async.exchange_code_for_tokens(code)
+    profile = await gmail_async.fetch_google_profile(token_data["access_token"])
     google_email = profile.get("email")
     if not google_email:
         raise HTTPException(400, "Failed to fetch Google account email")
 
-    existing = db.query(GmailAccount).filter(
+    return await db.run_sync(_store_connected_account, user_id, google_email, token_data)
+
+
+def _store_connected_account(db: Session, user_id: int, google_email: str, token_data: dict) -> dict:
+    existing = db.query(GmailAccount.id).filter(
         GmailAccount.user_id == user_id, GmailAccount.google_email == google_email
     ).first()
     if existing:
-        print(f"[GMAIL] Account {google_email} already connected")
+        logger.info("Account %s already connected", google_email)
         return {"status": "already_connected"}
+    # End the read transaction before writing; upgrading it would deadlock
+    # concurrent callbacks on SQLite
+    db.rollback()
 
+    # A callback that raced us to the same mailbox fails on uq_user_gmail.
+    # Account and token commit together.
     gmail_account = GmailAccount(user_id=user_id, google_email=google_email)
     db.add(gmail_account)
-    db.commit()
-    db.refresh(gmail_account)
-
-    gmail_token = GmailToken(
-        gmail_account_id=gmail_account.id,
-        access_token=token_data["access_token"],
-        refresh_token=token_data["refresh_token"],
-        expires_at=token_data["expires_at"],
-    )
-    db.add(gmail_token)
-    db.commit()
+    try:
+        db.flush()
+        db.add(GmailToken(
+            gmail_account_id=gmail_account.id,
+            access_token=token_data["access_token"],
+            refresh_token=token_data["refresh_token"],
+            expires_at=token_data["expires_at"],
+        ))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.info("Account %s already connected", google_email)
+        return {"status": "already_connected"}
 
-    print(f"[GMAIL] Connected Gmail account {google_email} for user {user_id}")
+    logger.info("Connected Gmail account %s for user %s", google_email, user_id)
     return {"status": "connected", "email": google_email}
 
 
+# ---------- Accounts ----------
+def _connected_accounts(db: Session, user: User) -> list[GmailAccount]:
+    accounts = db.query(GmailAccount).filter(
+        GmailAccount.user_id == user.id
+    ).order_by(GmailAccount.id).all()
+    if not accounts:
+        logger.info("No Gmail account found for user %s", user.id)
+        raise HTTPException(400, "Gmail not connected")
+    return accounts
+
+
 # ---------- Sync Gmail messages ----------
-@router.post("/sync")
-def sync_gmail_messages(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    gmail = db.query(GmailAccount).filter(GmailAccount.user_id == current_user.id).first()
-    if not gmail or not gmail.gmail_token:
+@router.post("/sync", status_code=202)
+async def sync_gmail_messages(
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(_enqueue_user_syncs, current_user)
+
+
+def _enqueue_user_syncs(db: Session, current_user: User) -> dict:
+    accounts = [a for a in _connected_accounts(db, current_user) if a.gmail_token]
+    if not accounts:
         raise HTTPException(400, "Gmail not connected")
 
-    token = gmail.gmail_token
+    # One job per account; the worker pool syncs them in parallel
+    jobs = []
+    for gmail in accounts:
+        job, created = enqueue_sync(db, gmail)
+        jobs.append({
+            "job_id": job.id,
+            "gmail_account_id": gmail.id,
+            "email": gmail.google_email,
+            "status": job.status,
+            "coalesced": not created,
+        })
+    logger.info("Sync requested for user %s, jobs %s", current_user.id, [j["job_id"] for j in jobs])
+    return {
+        "status": jobs[0]["status"],
+        "job_id": jobs[0]["job_id"],
+        "coalesced": jobs[0]["coalesced"],
+        "jobs": jobs,
+    }
 
-    # Refresh token if expired
-    if token.expires_at < datetime.utcnow():
-        print(f"[GMAIL] Access token expired, refreshing...")
-        new_token = refresh_access_token(token.refresh_token)
-        token.access_token = new_token["access_token"]
-        token.expires_at = new_token["expires_at"]
-        db.commit()
 
-    page_token = None
-    stored = 0
-    print(f"[GMAIL] Starting sync for user {current_user.id}, account {gmail.google_email}")
-
-    while True:
-        data = fetch_gmail_messages(token.access_token, page_token)
-        messages = data.get("messages", [])
-        print(f"[GMAIL] Fetched {len(messages)} messages from Gmail API")
-
-        for msg_ref in messages:
-            exists = db.query(GmailMessage).filter(
-                GmailMessage.gmail_account_id == gmail.id,
-                GmailMessage.gmail_message_id == msg_ref["id"]
-            ).first()
-            if exists:
-                continue
-
-            detail = fetch_gmail_message_detail(token.access_token, msg_ref["id"])
-            internal_date = datetime.utcfromtimestamp(int(detail.get("internalDate", 0)) / 1000)
-
-            message = GmailMessage(
-                gmail_account_id=gmail.id,
-                gmail_message_id=detail["id"],
-                thread_id=detail["threadId"],
-                snippet=detail.get("snippet"),
-                internal_date=internal_date,
-                payload=detail,
-            )
-            db.add(message)
-            stored += 1
-            print(f"[GMAIL] Stored message {detail['id']}")
+@router.get("/sync/{job_id}")
+async def get_sync_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(_sync_job_status, current_user, job_id)
 
-        db.commit()
-        print(f"[GMAIL] Committed batch of messages, total stored so far: {stored}")
 
-        page_token = data.get("nextPageToken")
-        if not page_token:
-            break
+def _sync_job_status(db: Session, current_user: User, job_id: int) -> dict:
+    job = db.query(SyncJob).join(GmailAccount).filter(
+        SyncJob.id == job_id,
+        GmailAccount.user_id == current_user.id,
+    ).first()
+    if not job:
+        raise HTTPException(404, "Sync job not found")
+    return job_status(job)
 
-    print(f"[GMAIL] Sync complete for {gmail.google_email}, total new messages: {stored}")
-    return {"status": "synced", "stored": stored}
 
-@router.get("/messages")
-def list_gmail_messages(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), limit: int = 50, offset: int = 0):
-    print(f"[GMAIL] list_gmail_messages called for user {current_user.id}")
-    gmail = db.query(GmailAccount).filter(GmailAccount.user_id == current_user.id).first()
-    if not gmail:
-        print("[GMAIL] No Gmail account found for user")
-        raise HTTPException(400, "Gmail not connected")
+# ---------- Live events ----------
+@router.get("/events")
+async def gmail_events(
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Server-sent events for the current user.
+
+    ``sync_progress`` carries a job status (as GET /sync/{id}) whenever a
+    sync commits a page or finishes, ``messages`` the summaries of newly
+    stored messages, ``messages_deleted`` their ids. ``resync`` means
+    events were dropped and the client should refetch.
+    """
+    # The stream can stay open for hours; don't hold a pooled connection
+    await db.rollback()
+    user_id = current_user.id
+
+    async def stream():
+        async with events.broker.subscribe(user_id) as queue:
+            yield b"retry: 5000\n\n"
+            # Starlette cancels this generator when the client disconnects
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line; keeps proxies from closing an idle stream
+                    yield b": keep-alive\n\n"
+                    continue
+                yield events.format_sse(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    messages = db.query(GmailMessage).filter(
-        GmailMessage.gmail_account_id == gmail.id
-    ).order_by(GmailMessage.internal_date.desc()).offset(offset).limit(limit).all()
 
-    print(f"[GMAIL] Returning {len(messages)} messages for user {current_user.id}")
-    return [
+@router.get("/messages", response_class=FastJSONResponse)
+async def list_gmail_messages(
+    request: Request,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    cursor: str | None = None,
+    category: str | None = None,
+    collapse: bool = False,
+):
+    """List stored messages, newest first.
+
+    Passing ``cursor`` (empty for the first page) switches to keyset
+    pagination and returns ``{"messages": [...], "next_cursor": ...}``;
+    without it the legacy offset listing is returned as a plain list.
+    ``category`` keeps only messages the classifier put in that category.
+    ``collapse`` shows only the newest message of each near-duplicate
+    cluster; the rest are available from /messages/{id}/similar.
+    Responses carry an ETag that only changes when sync stores or removes
+    messages; a matching If-None-Match is answered with 304.
+    """
+    if category is not None and category not in CATEGORIES:
+        raise HTTPException(400, f"Unknown category: {category}")
+    return await db.run_sync(
+        _list_messages, current_user, request.headers.get("if-none-match"), limit, offset, cursor, category, collapse
+    )
+
+
+def _list_messages(
+    db: Session,
+    current_user: User,
+    if_none_match: str | None,
+    limit: int,
+    offset: int,
+    cursor: str | None,
+    category: str | None = None,
+    collapse: bool = False,
+) -> Response:
+    logger.debug("list_gmail_messages called for user %s", current_user.id)
+    accounts = _connected_accounts(db, current_user)
+    emails = {a.id: a.google_email for a in accounts}
+
+    etag = listing_etag("messages", accounts, limit=limit, offset=offset, cursor=cursor, category=category, collapse=collapse)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    key = cache_key(etag, list(emails))
+    body = listing_cache.get(key)
+    if body is not None:
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, datetime, int)
+    # In offset mode every account must supply enough rows to cover the offset
+    per_account = limit + 1 if cursor is not None else offset + limit
+
+    # One keyset-ordered query per account, merged on (internal_date, id)
+    streams = []
+    for gmail in accounts:
+        # Project only the listed columns; loading GmailMessage would also
+        # deserialize the full payload JSON of every row
+        query = db.query(
+            GmailMessage.id,
+            GmailMessage.gmail_account_id,
+            GmailMessage.gmail_message_id,
+            GmailMessage.thread_id,
+            GmailMessage.snippet,
+            GmailMessage.internal_date,
+            GmailMessage.category,
+        ).filter(
+            GmailMessage.gmail_account_id == gmail.id
+        ).order_by(GmailMessage.internal_date.desc(), GmailMessage.id.desc())
+        if category:
+            query = query.filter(GmailMessage.category == category)
+        if collapse:
+            # Skip rows with a newer member in the same cluster (and category,
+            # or a cluster whose newest member is elsewhere would vanish)
+            newer = aliased(GmailMessage)
+            conditions = [
+                newer.cluster_id == GmailMessage.cluster_id,
+                or_(
+                    newer.internal_date > GmailMessage.internal_date,
+                    and_(newer.internal_date == GmailMessage.internal_date, newer.id > GmailMessage.id),
+                ),
+            ]
+            if category:
+                conditions.append(newer.category == category)
+            query = query.filter(~exists().where(*conditions))
+        if after:
+            last_date, last_id = after
+            query = query.filter(or_(
+                GmailMessage.internal_date < last_date,
+                and_(GmailMessage.internal_date == last_date, GmailMessage.id < last_id),
+            ))
+        streams.append(query.limit(per_account).all())
+
+    if cursor is None:
+        messages = merge_newest_first(streams, offset + limit)[offset:]
+    else:
+        # One extra row tells us whether another page exists
+        messages = merge_newest_first(streams, limit + 1)
+
+    logger.debug("Returning %d messages for user %s", min(len(messages), limit), current_user.id)
+    items = [
         {
             "id": m.gmail_message_id,
             "thread_id": m.thread_id,
             "snippet": m.snippet,
             "date": m.internal_date,
+            "category": m.category,
+            "account": emails[m.gmail_account_id],
+        }
+        for m in messages[:limit]
+    ]
+    if cursor is None:
+        response = FastJSONResponse(items, headers=headers)
+    else:
+        next_cursor = None
+        if len(messages) > limit:
+            last = messages[limit - 1]
+            next_cursor = encode_cursor(last.internal_date, last.id)
+        response = FastJSONResponse({"messages": items, "next_cursor": next_cursor}, headers=headers)
+
+    listing_cache.set(key, response.body)
+    return response
+
+
+@router.get("/messages/{message_id}", response_class=FastJSONResponse)
+async def get_gmail_message(
+    message_id: str,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Parsed content of one message: headers, text and sanitized HTML bodies, attachments."""
+    return await db.run_sync(_message_content, current_user, message_id)
+
+
+@router.get("/messages/{message_id}/similar", response_class=FastJSONResponse)
+async def get_similar_messages(
+    message_id: str,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Near-duplicates of a message (same template or bulk mailing), most similar first."""
+    return await db.run_sync(_similar, current_user, message_id, limit)
+
+
+def _similar(db: Session, current_user: User, message_id: str, limit: int) -> Response:
+    accounts = _connected_accounts(db, current_user)
+    emails = {a.id: a.google_email for a in accounts}
+
+    row = db.query(GmailMessage.id, GmailMessage.gmail_account_id).filter(
+        GmailMessage.gmail_account_id.in_(list(emails)),
+        GmailMessage.gmail_message_id == message_id,
+    ).first()
+    if not row:
+        raise HTTPException(404, "Message not found")
+
+    ranked = similar_messages(db, row.id, row.gmail_account_id, limit)
+    rows = {m.id: m for m in db.query(
+        GmailMessage.id,
+        GmailMessage.gmail_message_id,
+        GmailMessage.thread_id,
+        GmailMessage.snippet,
+        GmailMessage.internal_date,
+        GmailMessage.category,
+    ).filter(GmailMessage.id.in_([similar_id for similar_id, _ in ranked])).all()} if ranked else {}
+
+    items = [
+        {
+            "id": rows[similar_id].gmail_message_id,
+            "thread_id": rows[similar_id].thread_id,
+            "snippet": rows[similar_id].snippet,
+            "date": rows[similar_id].internal_date,
+            "category": rows[similar_id].category,
+            "similarity": round(score, 3),
+        }
+        for similar_id, score in ranked
+        if similar_id in rows
+    ]
+    return FastJSONResponse({"id": message_id, "account": emails[row.gmail_account_id], "similar": items})
+
+
+def _message_content(db: Session, current_user: User, message_id: str) -> Response:
+    accounts = _connected_accounts(db, current_user)
+    emails = {a.id: a.google_email for a in accounts}
+
+    for account_id in emails:
+        body = message_cache.get((account_id, message_id))
+        if body is not None:
+            return Response(content=body, media_type="application/json")
+
+    row = db.query(*CONTENT_COLUMNS).filter(
+        GmailMessage.gmail_account_id.in_(list(emails)),
+        GmailMessage.gmail_message_id == message_id,
+    ).first()
+    if not row:
+        raise HTTPException(404, "Message not found")
+
+    # Stored before ingest-time parsing; parsed once here and written back
+    parsed = parse_stored_message(db, row.id) if row.body_text is None else None
+    ids = attachment_ids(db, row.id, parsed["attachments"] if parsed else row.attachments)
+
+    response = FastJSONResponse(render_content(row, emails[row.gmail_account_id], parsed, ids))
+    message_cache.set((row.gmail_account_id, message_id), response.body)
+    return response
+
+
+# ---------- Attachments ----------
+@router.get("/attachments/{attachment_id}")
+async def download_attachment(
+    attachment_id: int,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Attachment body, fetched from Gmail on first download and served from the local store after.
+
+    FileResponse streams the blob from disk in chunks (or hands the path to
+    servers that support pathsend) and answers Range requests itself.
+    """
+    attachment = await db.run_sync(_find_attachment, current_user, attachment_id)
+    sha256 = attachment.sha256
+    if not has_blob(sha256):
+        # Hand the connection back to the pool while we wait on Google
+        await db.rollback()
+        access_token = await run_in_threadpool(token_manager.get_access_token, attachment.gmail_account_id)
+        try:
+            data = await gmail_async.fetch_gmail_attachment(
+                access_token,
+                attachment.gmail_message_id,
+                attachment.gmail_attachment_id,
+                account_id=attachment.gmail_account_id,
+            )
+        except GmailApiError as e:
+            logger.warning("Attachment %s fetch failed: %s", attachment_id, e)
+            raise HTTPException(502, "Failed to fetch attachment from Gmail")
+        # Held until the row is committed, so prune_blobs cannot remove the blob in between
+        lock = await run_in_threadpool(blob_lock)
+        with lock:
+            sha256 = await run_in_threadpool(store_blob, data)
+            await db.run_sync(mark_fetched, attachment.id, sha256)
+
+    # Always a download: an HTML attachment must not render on our origin
+    return FileResponse(
+        blob_path(sha256),
+        media_type=attachment.mime_type or "application/octet-stream",
+        filename=attachment.filename or None,
+        content_disposition_type="attachment",
+        headers={"Cache-Control": "private, max-age=31536000, immutable"},
+    )
+
+
+def _find_attachment(db: Session, current_user: User, attachment_id: int):
+    attachment = db.query(
+        GmailAttachment.id,
+        GmailAttachment.attachment_id.label("gmail_attachment_id"),
+        GmailAttachment.filename,
+        GmailAttachment.mime_type,
+        GmailAttachment.sha256,
+        GmailMessage.gmail_message_id,
+        GmailMessage.gmail_account_id,
+    ).join(
+        GmailMessage, GmailMessage.id == GmailAttachment.message_id,
+    ).join(
+        GmailAccount, GmailAccount.id == GmailMessage.gmail_account_id,
+    ).filter(
+        GmailAttachment.id == attachment_id,
+        GmailAccount.user_id == current_user.id,
+    ).first()
+    if not attachment:
+        raise HTTPException(404, "Attachment not found")
+    return attachment
+
+
+# ---------- Search ----------
+@router.get("/search", response_class=FastJSONResponse)
+async def search_gmail_messages(
+    q: str = Query(..., min_length=1, max_length=500),
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+):
+    return await db.run_sync(_search, current_user, q, limit, cursor)
+
+
+def _search(db: Session, current_user: User, q: str, limit: int, cursor: str | None) -> Response:
+    accounts = _connected_accounts(db, current_user)
+    emails = {a.id: a.google_email for a in accounts}
+
+    after = tuple(decode_cursor(cursor, float, int)) if cursor else None
+    rows = search_messages(db, list(emails), q, limit + 1, after)
+
+    items = [
+        {
+            "id": r.gmail_message_id,
+            "thread_id": r.thread_id,
+            "snippet": r.snippet,
+            "date": r.internal_date,
+            "score": r.score,
+            "account": emails[r.gmail_account_id],
+        }
+        for r in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.score, last.id)
+    return FastJSONResponse({"messages": items, "next_cursor": next_cursor})
+
+
+# ---------- Threads ----------
+@router.get("/threads", response_class=FastJSONResponse)
+async def list_gmail_threads(
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+):
+    """List conversations by latest activity, with keyset pagination."""
+    return await db.run_sync(_list_threads, current_user, limit, cursor)
+
+
+def _list_threads(db: Session, current_user: User, limit: int, cursor: str | None) -> Response:
+    accounts = _connected_accounts(db, current_user)
+    emails = {a.id: a.google_email for a in accounts}
+    after = decode_cursor(cursor, datetime, int) if cursor else None
+
+    streams = []
+    for gmail in accounts:
+        query = db.query(GmailThread).filter(
+            GmailThread.gmail_account_id == gmail.id
+        ).order_by(GmailThread.last_message_date.desc(), GmailThread.id.desc())
+        if after:
+            last_date, last_id = after
+            query = query.filter(or_(
+                GmailThread.last_message_date < last_date,
+                and_(GmailThread.last_message_date == last_date, GmailThread.id < last_id),
+            ))
+        streams.append(query.limit(limit + 1).all())
+
+    threads = merge_newest_first(streams, limit + 1, date_field="last_message_date")
+    items = [
+        {
+            "id": t.thread_id,
+            "snippet": t.snippet,
+            "date": t.last_message_date,
+            "message_count": t.message_count,
+            "participants": t.participants,
+            "account": emails[t.gmail_account_id],
         }
-        for m in messages
+        for t in threads[:limit]
     ]
+    next_cursor = None
+    if len(threads) > limit:
+        last = threads[limit - 1]
+        next_cursor = encode_cursor(last.last_message_date, last.id)
+    return FastJSONResponse({"threads": items, "next_cursor": next_cursor})
 
+
+@router.get("/threads/{thread_id}", response_class=FastJSONResponse)
+async def get_gmail_thread(
+    thread_id: str,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(_thread_messages, current_user, thread_id)
+
+
+def _thread_messages(db: Session, current_user: User, thread_id: str) -> Response:
+    accounts = _connected_accounts(db, current_user)
+    emails = {a.id: a.google_email for a in accounts}
+
+    messages = db.query(
+        GmailMessage.gmail_account_id,
+        GmailMessage.gmail_message_id,
+        GmailMessage.snippet,
+        GmailMessage.internal_date,
+    ).filter(
+        GmailMessage.gmail_account_id.in_(list(emails)),
+        GmailMessage.thread_id == thread_id,
+    ).order_by(GmailMessage.internal_date, GmailMessage.id).all()
+    if not messages:
+        raise HTTPException(404, "Thread not found")
+
+    return FastJSONResponse({
+        "id": thread_id,
+        "messages": [
+            {
+                "id": m.gmail_message_id,
+                "snippet": m.snippet,
+                "date": m.internal_date,
+                "account": emails[m.gmail_account_id],
+            }
+            for m in messages
+        ],
+    })
+
+
+# ---------- Export ----------
+@router.get("/export")
+def export_gmail_messages(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    since: datetime | None = None,
+    until: datetime | None = None,
+    fields: str | None = None,
+    cursor: str | None = None,
+    gzip: bool = False,
+):
+    """Stream every stored message as NDJSON, optionally gzip-compressed.
+
+    ``fields`` is a comma-separated subset of EXPORT_FIELDS. Pass the
+    ``cursor`` of the last line received to resume an interrupted export.
+    Kept sync: the body is a blocking generator with its own session,
+    which StreamingResponse already iterates in the threadpool.
+    """
+    accounts = _connected_accounts(db, current_user)
+    emails = {a.id: a.google_email for a in accounts}
+
+    selected = fields.split(",") if fields else DEFAULT_EXPORT_FIELDS
+    unknown = [f for f in selected if f not in EXPORT_FIELDS]
+    if unknown:
+        raise HTTPException(400, f"Unknown export fields: {', '.join(unknown)}")
+    after_id = decode_cursor(cursor, int)[0] if cursor else None
+
+    logger.info("Export started for user %s, fields=%s, gzip=%s", current_user.id, selected, gzip)
+    lines = iter_export_lines(emails, selected, since, until, after_id)
+    if gzip:
+        return StreamingResponse(
+            gzip_stream(lines),
+            media_type="application/gzip",
+            headers={"Content-Disposition": 'attachment; filename="mailbox.ndjson.gz"'},
+        )
+    return StreamingResponse(
+        lines,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="mailbox.ndjson"'},
+    )
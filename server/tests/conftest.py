@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+# Modules read their configuration at import; point them at throwaway settings
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+for _name in ("GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "GOOGLE_REDIRECT_URI"):
+    os.environ.setdefault(_name, "test")
+
+
+@pytest.fixture
+def db():
+    from db import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
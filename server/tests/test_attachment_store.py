@@ -0,0 +1,65 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from db import GmailAccount, GmailAttachment, GmailMessage, User
+from utils import attachment_store
+
+
+@pytest.fixture
+def message_id(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(attachment_store, "ATTACHMENT_DIR", str(tmp_path))
+    user = User(name="a", email="a@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    account = GmailAccount(user_id=user.id, google_email="a@example.com")
+    db.add(account)
+    db.flush()
+    message = GmailMessage(gmail_account_id=account.id, gmail_message_id="m1", thread_id="t1",
+                           internal_date=datetime(2024, 1, 1))
+    db.add(message)
+    db.commit()
+    return message.id
+
+
+def _index(db, message_id: int, part_ids: list[str]) -> None:
+    attachment_store.index_attachments(db, {message_id: [
+        {"part_id": part_id, "attachment_id": f"att-{part_id}", "filename": f"{part_id}.txt"} for part_id in part_ids
+    ]})
+    db.commit()
+
+
+def test_index_attachments_skips_existing_parts(db, message_id):
+    _index(db, message_id, ["1"])
+    _index(db, message_id, ["1", "2"])
+    assert sorted(p for (p,) in db.query(GmailAttachment.part_id)) == ["1", "2"]
+
+
+def test_prune_keeps_referenced_blobs(db, message_id):
+    _index(db, message_id, ["1"])
+    attachment = db.query(GmailAttachment).one()
+    kept = attachment_store.store_blob(b"kept")
+    attachment_store.mark_fetched(db, attachment.id, kept)
+    orphan = attachment_store.store_blob(b"orphan")
+
+    assert attachment_store.prune_blobs(db) == 1
+    assert attachment_store.has_blob(kept)
+    assert not attachment_store.has_blob(orphan)
+    assert os.path.exists(os.path.join(attachment_store.ATTACHMENT_DIR, ".lock"))
+
+
+def test_prune_rechecks_blobs_marked_after_the_walk(db, message_id, monkeypatch):
+    _index(db, message_id, ["1"])
+    attachment_pk = db.query(GmailAttachment.id).scalar()
+    sha256 = attachment_store.store_blob(b"late")
+    lock = attachment_store.blob_lock
+
+    def lock_after_download(exclusive=False):
+        # A download commits its row between the prune's walk and its lock
+        attachment_store.mark_fetched(db, attachment_pk, sha256)
+        return lock(exclusive)
+
+    monkeypatch.setattr(attachment_store, "blob_lock", lock_after_download)
+    assert attachment_store.prune_blobs(db) == 0
+    assert attachment_store.has_blob(sha256)
@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import pytest
+
+from db import User
+from routes.auth_routes import UpdateUserRequest, update_user
+from utils.auth_utils import create_jwt_token, get_current_user, user_cache
+
+
+@pytest.fixture
+def user(db):
+    user_cache.clear()
+    user = User(name="Erin", email="erin@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    yield user
+    user_cache.clear()
+
+
+def _request(user_id: int):
+    return SimpleNamespace(cookies={"token": create_jwt_token(user_id)})
+
+
+def test_cached_user_is_served_without_the_database(db, user):
+    loaded = get_current_user(_request(user.id), db)
+    assert get_current_user(_request(user.id), db=None) is loaded
+
+
+def test_update_user_evicts_the_cached_user(db, user):
+    cached = get_current_user(_request(user.id), db)
+
+    update_user(UpdateUserRequest(name="Erin Moss", email="Erin.Moss@example.com"), db, cached)
+
+    current = get_current_user(_request(user.id), db)
+    assert (current.name, current.email) == ("Erin Moss", "erin.moss@example.com")
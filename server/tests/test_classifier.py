@@ -0,0 +1,30 @@
+import pytest
+
+from utils import classifier
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(classifier, "CLASSIFY_WORKERS", 2)
+    monkeypatch.setattr(classifier, "_pool", None)
+    yield
+    if classifier._pool is not None:
+        classifier._pool.shutdown()
+
+
+def test_pool_is_spawned_once_at_the_configured_size(pool):
+    first = classifier._get_pool()
+    assert first._mp_context.get_start_method() == "spawn"
+    assert first._max_workers == 2
+    assert classifier._get_pool() is first
+
+
+def test_pool_and_inline_scoring_agree(pool, monkeypatch):
+    texts = [
+        classifier.message_text("Your invoice is ready", "billing@example.com", "Amount due", None),
+        classifier.message_text("Weekly digest", "newsletter@example.com", "Top stories", None),
+        classifier.message_text("Lunch tomorrow?", "friend@example.com", "Are you free", None),
+    ] * 4
+    pooled = classifier.classify_texts(texts, batch_size=3)
+    monkeypatch.setattr(classifier, "CLASSIFY_WORKERS", 0)
+    assert classifier.classify_texts(texts, batch_size=3) == pooled
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+from db import GmailAccount, GmailMessage, User
+from routes.gmail_routes import _list_messages
+from utils import gmail_sync
+from utils.listing_cache import listing_cache
+
+
+@pytest.fixture(autouse=True)
+def _empty_listing_cache():
+    # Ids restart with every test database, so cached pages would carry over
+    listing_cache.clear()
+    yield
+    listing_cache.clear()
+
+
+def _listed_ids(db, user, **kwargs) -> list[str]:
+    response = _list_messages(db, user, None, 50, 0, None, **kwargs)
+    return [m["id"] for m in orjson.loads(response.body)]
+
+
+def test_collapsed_category_listing_keeps_clusters_whose_newest_member_is_elsewhere(db):
+    user = User(name="a", email="a@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    account = GmailAccount(user_id=user.id, google_email="a@example.com")
+    db.add(account)
+    db.flush()
+
+    start = datetime(2024, 1, 1)
+    # One cluster: two promotions, then a newer member classified as primary
+    rows = [
+        GmailMessage(gmail_account_id=account.id, gmail_message_id=f"m{i}", thread_id=f"t{i}",
+                     internal_date=start + timedelta(minutes=i), category=category, cluster_id=None)
+        for i, category in enumerate(["promotions", "promotions", "primary"])
+    ]
+    db.add_all(rows)
+    db.flush()
+    for row in rows:
+        row.cluster_id = rows[0].id
+    db.commit()
+
+    assert _listed_ids(db, user, category="promotions", collapse=True) == ["m1"]
+    assert _listed_ids(db, user, category="primary", collapse=True) == ["m2"]
+    assert _listed_ids(db, user, collapse=True) == ["m2"]
+
+
+def test_cursor_pages_do_not_skip_or_repeat_messages_with_equal_dates(db):
+    user = User(name="b", email="b@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    account = GmailAccount(user_id=user.id, google_email="b@example.com")
+    db.add(account)
+    db.flush()
+
+    # Five messages in the same second, so only the id breaks ties at the page boundary
+    same_time = datetime(2024, 3, 1, 9, 0)
+    db.add_all([
+        GmailMessage(gmail_account_id=account.id, gmail_message_id=f"m{i}", thread_id=f"t{i}",
+                     internal_date=same_time)
+        for i in range(5)
+    ] + [
+        GmailMessage(gmail_account_id=account.id, gmail_message_id="old", thread_id="old",
+                     internal_date=same_time - timedelta(days=1)),
+    ])
+    db.commit()
+
+    pages, cursor = [], ""
+    while cursor is not None:
+        page = orjson.loads(_list_messages(db, user, None, 2, 0, cursor).body)
+        pages.append([m["id"] for m in page["messages"]])
+        cursor = page["next_cursor"]
+
+    assert pages == [["m4", "m3"], ["m2", "m1"], ["m0", "old"]]
+
+
+def test_listing_etag_answers_304_until_sync_bumps_the_version(db):
+    user = User(name="c", email="c@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    account = GmailAccount(user_id=user.id, google_email="c@example.com")
+    db.add(account)
+    db.flush()
+    db.add(GmailMessage(gmail_account_id=account.id, gmail_message_id="m0", thread_id="t0",
+                        internal_date=datetime(2024, 1, 1)))
+    db.commit()
+
+    first = _list_messages(db, user, None, 50, 0, None)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert _list_messages(db, user, etag, 50, 0, None).status_code == 304
+
+    # Sync stores a message and bumps the account version in the same commit
+    db.add(GmailMessage(gmail_account_id=account.id, gmail_message_id="m1", thread_id="t1",
+                        internal_date=datetime(2024, 1, 2)))
+    gmail_sync._bump_version(db, account)
+    gmail_sync._commit(db, account)
+
+    second = _list_messages(db, user, etag, 50, 0, None)
+    assert second.status_code == 200
+    assert second.headers["ETag"] != etag
+    assert [m["id"] for m in orjson.loads(second.body)] == ["m1", "m0"]
+    assert _list_messages(db, user, second.headers["ETag"], 50, 0, None).status_code == 304
@@ -0,0 +1,21 @@
+import pytest
+
+from db import GmailAccount, GmailSyncCheckpoint, User
+from utils import gmail_sync
+from utils.gmail_utils import GmailApiError
+
+
+def test_full_sync_fails_without_history_id(db, monkeypatch):
+    user = User(name="a", email="a@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    gmail = GmailAccount(user_id=user.id, google_email="a@example.com")
+    db.add(gmail)
+    db.commit()
+
+    monkeypatch.setattr(gmail_sync.token_manager, "get_access_token", lambda account_id: "token")
+    monkeypatch.setattr(gmail_sync, "fetch_gmail_profile", lambda token, account_id=None: {"messagesTotal": 3})
+
+    with pytest.raises(GmailApiError):
+        gmail_sync._start_checkpoint(db, gmail)
+    assert db.get(GmailSyncCheckpoint, gmail.id) is None
@@ -0,0 +1,85 @@
+import urllib.parse
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+from dev.fake_gmail import create_app
+from utils import gmail_utils
+from utils.gmail_utils import GmailApiError, build_batch_body, fetch_gmail_message_details, parse_batch_response
+
+
+@pytest.fixture
+def fake_gmail():
+    with TestClient(create_app(mailbox_size=3)) as client:
+        yield client
+
+
+def _post_batch(client, message_ids: list[str]) -> dict[str, dict]:
+    boundary = "batch_test"
+    res = client.post(
+        "/batch/gmail/v1",
+        headers={"Content-Type": f"multipart/mixed; boundary={boundary}"},
+        content=build_batch_body(message_ids, boundary),
+    )
+    assert res.status_code == 200
+    return parse_batch_response(res.headers["Content-Type"], res.content)
+
+
+def test_batch_round_trip_maps_each_part_to_its_message(fake_gmail):
+    mailbox = fake_gmail.app.state.mailbox
+    ids = [m["id"] for m in mailbox.messages]
+
+    items = _post_batch(fake_gmail, [ids[0], "missing", ids[2]])
+
+    assert items == {"item0": mailbox.get(ids[0]), "item1": {}, "item2": mailbox.get(ids[2])}
+
+
+def test_batch_refetches_failed_parts_one_by_one(fake_gmail, monkeypatch):
+    def request(method, url, headers=None, data=None, **kwargs):
+        return fake_gmail.request(method, urllib.parse.urlsplit(url).path, headers=headers, content=data)
+
+    refetched = []
+
+    def fetch_detail(access_token, message_id, account_id=None):
+        refetched.append(message_id)
+        return {"id": message_id}
+
+    monkeypatch.setattr(gmail_utils.http_client, "request", request)
+    monkeypatch.setattr(gmail_utils, "fetch_gmail_message_detail", fetch_detail)
+    ids = [m["id"] for m in fake_gmail.app.state.mailbox.messages]
+
+    details = gmail_utils.fetch_gmail_message_details_batch("token", [ids[1], "gone"], 1)
+
+    assert [d["id"] for d in details] == [ids[1], "gone"]
+    assert refetched == ["gone"]
+
+
+def test_failed_batch_only_costs_its_own_messages(monkeypatch):
+    def fake_batch(access_token, chunk, account_id=None, errors=None):
+        if "m2" in chunk:
+            raise GmailApiError("Gmail API error on message batch: 503", 503)
+        if "m4" in chunk:
+            raise requests.ConnectionError("connection reset")
+        return [{"id": message_id} for message_id in chunk]
+
+    monkeypatch.setattr(gmail_utils, "GMAIL_BATCH_SIZE", 2)
+    monkeypatch.setattr(gmail_utils, "fetch_gmail_message_details_batch", fake_batch)
+
+    errors = {}
+    details = fetch_gmail_message_details("token", [f"m{i}" for i in range(6)], 1, mode="batch", errors=errors)
+
+    assert details == [{"id": "m0"}, {"id": "m1"}, {}, {}, {}, {}]
+    assert sorted(errors) == ["m2", "m3", "m4", "m5"]
+    assert "503" in errors["m2"]
+
+
+def test_profile_errors_are_raised(monkeypatch):
+    response = requests.Response()
+    response.status_code = 503
+    response._content = b"backend error"
+    monkeypatch.setattr(gmail_utils, "_gmail_get", lambda *args, **kwargs: response)
+
+    with pytest.raises(GmailApiError) as exc:
+        gmail_utils.fetch_gmail_profile("token", 1)
+    assert exc.value.status_code == 503
@@ -0,0 +1,95 @@
+import pytest
+import requests
+
+from utils import http_client
+
+
+def _response(status: int, headers: dict | None = None) -> requests.Response:
+    res = requests.Response()
+    res.status_code = status
+    res.headers.update(headers or {})
+    res._content = b"{}"
+    return res
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """Replays scripted outcomes for the shared session; records each attempt's method."""
+    class Script:
+        def __init__(self):
+            self.outcomes = []
+            self.calls = []
+
+        def request(self, method, url, **kwargs):
+            self.calls.append(method)
+            outcome = self.outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+    script = Script()
+    monkeypatch.setattr(http_client, "_session", script)
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: None)
+    return script
+
+
+def test_get_is_retried_on_server_errors(session):
+    session.outcomes = [_response(503), _response(200)]
+    assert http_client.request("GET", "http://x").status_code == 200
+    assert session.calls == ["GET", "GET"]
+
+
+def test_post_is_not_retried_once_the_server_may_have_processed_it(session):
+    session.outcomes = [_response(503)]
+    assert http_client.request("POST", "http://x").status_code == 503
+
+    session.outcomes = [requests.ReadTimeout("read timed out")]
+    with pytest.raises(requests.ReadTimeout):
+        http_client.request("POST", "http://x")
+    assert session.calls == ["POST", "POST"]
+
+
+def test_post_is_retried_when_it_was_never_processed(session):
+    session.outcomes = [_response(429), requests.ConnectTimeout("connect timed out"), _response(200)]
+    assert http_client.request("POST", "http://x").status_code == 200
+    assert len(session.calls) == 3
+
+
+def test_idempotent_post_is_retried_on_server_errors(session):
+    session.outcomes = [_response(502), _response(200)]
+    assert http_client.request("POST", "http://x", idempotent=True).status_code == 200
+    assert len(session.calls) == 2
+
+
+def test_retry_after_is_slept_in_full_up_to_the_cap(session, monkeypatch):
+    slept = []
+    monkeypatch.setattr(http_client.time, "sleep", slept.append)
+    monkeypatch.setattr(http_client, "HTTP_RETRY_AFTER_MAX", 60)
+
+    session.outcomes = [_response(429, {"Retry-After": "7"}), _response(200)]
+    assert http_client.request("GET", "http://x").status_code == 200
+    assert slept == [7.0]
+
+    # A longer wait than the cap ends the retries with the 429
+    session.outcomes = [_response(429, {"Retry-After": "3600"})]
+    assert http_client.request("GET", "http://x").status_code == 429
+    assert slept == [7.0] and len(session.calls) == 3
+
+
+def test_token_bucket_charges_large_calls_as_debt(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(http_client.time, "monotonic", lambda: now[0])
+    bucket = http_client.TokenBucket(rate=10, capacity=10)
+
+    assert bucket.reserve(10) == 0
+    # Worth three seconds of quota beyond an empty bucket
+    assert bucket.reserve(30) == pytest.approx(3.0)
+    # The debt is paid by whoever comes next
+    assert bucket.reserve(5) == pytest.approx(3.5)
+
+    now[0] += 3.5
+    assert bucket.reserve(1) == pytest.approx(0.1)
+    # Idle time refills only up to capacity
+    now[0] += 60
+    assert bucket.reserve(10) == 0
+    assert bucket.reserve(1) == pytest.approx(0.1)
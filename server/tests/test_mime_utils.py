@@ -0,0 +1,10 @@
+from utils.mime_utils import sanitize_html
+
+
+def test_self_closing_dropped_tags_keep_following_text():
+    assert sanitize_html("<iframe/>after") == "after"
+    assert sanitize_html("<p>before</p><svg/><p>after</p>") == "<p>before</p><p>after</p>"
+
+
+def test_dropped_tags_drop_their_content():
+    assert sanitize_html("<script>alert(1)</script><b>kept</b>") == "<b>kept</b>"
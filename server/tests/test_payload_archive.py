@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+from db import GmailAccount, GmailMessage, User
+from utils.payload_archive import archive_payloads, archive_stats, load_payload, payload_query, row_payload
+
+
+def _messages(db) -> list[int]:
+    user = User(name="g", email="g@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    account = GmailAccount(user_id=user.id, google_email="g@example.com")
+    db.add(account)
+    db.flush()
+    messages = [
+        GmailMessage(gmail_account_id=account.id, gmail_message_id=f"m{i}", thread_id="t",
+                     internal_date=datetime(2024, 1, 1 + i),
+                     payload={"id": f"m{i}", "snippet": "résumé attached " * 50, "parts": [{"partId": str(i)}]})
+        for i in range(3)
+    ]
+    db.add_all(messages)
+    db.commit()
+    return [m.id for m in messages]
+
+
+@pytest.mark.parametrize("codec", ["zstd", "gzip"])
+def test_archived_payloads_read_back_unchanged(db, codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    ids = _messages(db)
+
+    # Only the two messages before the cutoff move, one per batch
+    stats = archive_payloads(db, datetime(2024, 1, 3), batch_size=1, codec=codec)
+    assert stats["messages"] == 2 and stats["stored_bytes"] < stats["raw_bytes"]
+    assert archive_stats(db)["hot"] == 1
+
+    hot = dict(db.query(GmailMessage.id, GmailMessage.payload).all())
+    assert hot[ids[0]] is None and hot[ids[2]] is not None
+    rows = payload_query(db, GmailMessage.id).order_by(GmailMessage.id).all()
+    assert [row_payload(row)["id"] for row in rows] == ["m0", "m1", "m2"]
+    assert load_payload(db, ids[1])["snippet"] == "résumé attached " * 50
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import inspect, text
+
+from db import Base, engine, upgrade_schema
+
+# gmail_accounts and gmail_messages as the first release created them
+OLD_LAYOUT = [
+    """CREATE TABLE gmail_accounts (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        google_email VARCHAR NOT NULL,
+        connected_at DATETIME,
+        CONSTRAINT uq_user_gmail UNIQUE (user_id, google_email)
+    )""",
+    """CREATE TABLE gmail_messages (
+        id INTEGER PRIMARY KEY,
+        gmail_account_id INTEGER NOT NULL REFERENCES gmail_accounts (id) ON DELETE CASCADE,
+        gmail_message_id VARCHAR NOT NULL,
+        thread_id VARCHAR NOT NULL,
+        internal_date DATETIME,
+        snippet TEXT,
+        payload JSON NOT NULL,
+        created_at DATETIME,
+        CONSTRAINT uq_gmail_message UNIQUE (gmail_account_id, gmail_message_id)
+    )""",
+    "CREATE INDEX ix_gmail_messages_internal_date ON gmail_messages (internal_date)",
+    "INSERT INTO gmail_accounts (id, user_id, google_email) VALUES (1, 1, 'old@example.com')",
+    """INSERT INTO gmail_messages (id, gmail_account_id, gmail_message_id, thread_id, snippet, payload)
+       VALUES (1, 1, 'm1', 't1', 'hello', '{"id": "m1"}')""",
+]
+
+
+@pytest.fixture
+def old_db():
+    with engine.begin() as conn:
+        for statement in OLD_LAYOUT:
+            conn.execute(text(statement))
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_upgrade_brings_old_tables_up_to_the_models(old_db):
+    upgrade_schema(engine)
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    for table in ("gmail_accounts", "gmail_messages"):
+        columns = {c["name"]: c for c in inspector.get_columns(table)}
+        assert set(columns) == set(Base.metadata.tables[table].columns.keys())
+        indexes = {i["name"] for i in inspector.get_indexes(table)}
+        assert {i.name for i in Base.metadata.tables[table].indexes} <= indexes
+    assert columns["payload"]["nullable"]
+
+    with engine.begin() as conn:
+        assert conn.execute(text("SELECT version FROM gmail_accounts")).scalar_one() == 0
+        row = conn.execute(text("SELECT gmail_message_id, snippet, payload FROM gmail_messages")).one()
+        assert tuple(row) == ("m1", "hello", '{"id": "m1"}')
+        conn.execute(text("UPDATE gmail_messages SET payload = NULL"))
+
+    # A second run finds nothing to do
+    upgrade_schema(engine)
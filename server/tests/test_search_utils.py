@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from db import GmailAccount, GmailMessage, User, engine
+from utils.pagination import decode_cursor, encode_cursor
+from utils.search_utils import ensure_search_index, index_messages, search_messages
+
+
+@pytest.fixture
+def search_db(db):
+    ensure_search_index(engine)
+    yield db
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS gmail_message_fts"))
+
+
+def _account(db, name: str) -> int:
+    user = User(name=name, email=f"{name}@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    account = GmailAccount(user_id=user.id, google_email=f"{name}@example.com")
+    db.add(account)
+    db.flush()
+    return account.id
+
+
+def _message(db, account_id: int, gmail_id: str, subject: str) -> int:
+    message = GmailMessage(gmail_account_id=account_id, gmail_message_id=gmail_id, thread_id=gmail_id,
+                           internal_date=datetime(2024, 1, 1))
+    db.add(message)
+    db.flush()
+    index_messages(db, account_id, {message.id: {"subject": subject, "sender": "", "snippet": "", "body": ""}})
+    return message.id
+
+
+def test_search_only_matches_the_given_accounts(search_db):
+    db = search_db
+    alice, bob = _account(db, "alice"), _account(db, "bob")
+    _message(db, alice, "a1", "Quarterly invoice")
+    _message(db, bob, "b1", "Invoice overdue")
+    _message(db, bob, "b2", "Invoicing run")
+    db.commit()
+
+    assert [r.gmail_message_id for r in search_messages(db, [alice], "invoice", 10)] == ["a1"]
+    assert {r.gmail_message_id for r in search_messages(db, [bob], "invoic", 10)} == {"b1", "b2"}
+    assert {r.gmail_message_id for r in search_messages(db, [alice, bob], "invoice", 10)} == {"a1", "b1"}
+    assert search_messages(db, [], "invoice", 10) == []
+
+
+def test_search_pages_with_score_cursor(search_db):
+    db = search_db
+    account = _account(db, "carol")
+    for i in range(5):
+        _message(db, account, f"c{i}", "weekly report " + "report " * i)
+    db.commit()
+
+    first = search_messages(db, [account], "report", 2)
+    rest = search_messages(db, [account], "report", 10, (first[-1].score, first[-1].id))
+    assert len(first) == 2 and len(rest) == 3
+    assert not {r.id for r in first} & {r.id for r in rest}
+
+
+@pytest.mark.parametrize("values", [("x", 1), (1.5, "2"), (True, 1), (1.0,)])
+def test_decode_cursor_rejects_wrong_types(values):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(encode_cursor(*values), float, int)
+    assert exc.value.status_code == 400
+
+
+def test_decode_cursor_round_trips():
+    when = datetime(2024, 5, 1, 12, 30)
+    assert decode_cursor(encode_cursor(when, 7), datetime, int) == [when, 7]
+    assert decode_cursor(encode_cursor(None, 7), datetime, int) == [None, 7]
+    assert decode_cursor(encode_cursor(2, 7), float, int) == [2, 7]
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from db import GmailAccount, GmailLshBucket, GmailMessage, User
+from utils.similarity import drop_similarity, index_similarity, similar_messages
+
+NOTICE = "Your build #{} failed on main. See the pipeline logs for the failing step and retry when fixed."
+
+
+def _account(db) -> int:
+    user = User(name="dana", email="dana@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    account = GmailAccount(user_id=user.id, google_email="dana@example.com")
+    db.add(account)
+    db.flush()
+    return account.id
+
+
+def _messages(db, account_id: int, count: int) -> list[int]:
+    messages = [
+        GmailMessage(gmail_account_id=account_id, gmail_message_id=f"m{i}", thread_id=f"t{i}",
+                     internal_date=datetime(2024, 1, 1, 0, i))
+        for i in range(count)
+    ]
+    db.add_all(messages)
+    db.flush()
+    return [m.id for m in messages]
+
+
+def _cluster_ids(db, ids: list[int]) -> list[int]:
+    rows = dict(db.query(GmailMessage.id, GmailMessage.cluster_id).filter(GmailMessage.id.in_(ids)).all())
+    return [rows[i] for i in ids]
+
+
+def test_near_duplicates_share_a_cluster(db):
+    account_id = _account(db)
+    ids = _messages(db, account_id, 3)
+    index_similarity(db, account_id, [
+        (ids[0], NOTICE.format(1)),
+        (ids[1], NOTICE.format(1)),
+        (ids[2], "Lunch on Friday at the usual place, bring the slides from the offsite"),
+    ])
+    db.commit()
+
+    assert _cluster_ids(db, ids) == [ids[0], ids[0], ids[2]]
+    assert [message_id for message_id, _ in similar_messages(db, ids[1], account_id)] == [ids[0]]
+
+
+def test_deleting_a_representative_hands_the_cluster_on(db):
+    account_id = _account(db)
+    ids = _messages(db, account_id, 3)
+    index_similarity(db, account_id, [(message_id, NOTICE.format(1)) for message_id in ids])
+    db.commit()
+    assert _cluster_ids(db, ids) == [ids[0]] * 3
+
+    drop_similarity(db, [ids[0]])
+    db.query(GmailMessage).filter(GmailMessage.id == ids[0]).delete()
+    db.commit()
+
+    assert _cluster_ids(db, ids[1:]) == [ids[1]] * 2
+    assert {row.message_id for row in db.query(GmailLshBucket.message_id)} == {ids[1]}
+
+    # The new representative is still found by later duplicates
+    (late,) = _messages(db, account_id, 1)
+    index_similarity(db, account_id, [(late, NOTICE.format(1))])
+    db.commit()
+    assert _cluster_ids(db, [late]) == [ids[1]]
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from db import GmailAccount, SyncJob, User
+from utils import sync_jobs
+
+
+class _RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, job_id):
+        self.submitted.append(job_id)
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    executor = _RecordingExecutor()
+    monkeypatch.setattr(sync_jobs, "_executor", executor)
+    monkeypatch.setattr(sync_jobs, "_pending", 0)
+    monkeypatch.setattr(sync_jobs, "_submitted", set())
+    return executor
+
+
+def _account(db) -> GmailAccount:
+    user = User(name="a", email="a@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    gmail = GmailAccount(user_id=user.id, google_email="a@example.com")
+    db.add(gmail)
+    db.commit()
+    return gmail
+
+
+def test_recover_jobs_submits_a_queued_job_once(db, executor):
+    gmail = _account(db)
+    job = SyncJob(gmail_account_id=gmail.id, status="queued")
+    db.add(job)
+    db.commit()
+
+    for _ in range(3):
+        sync_jobs.recover_jobs()
+
+    assert executor.submitted == [job.id]
+    assert sync_jobs.pending_jobs() == 1
+
+
+def test_job_failed_as_stale_is_not_overwritten_by_its_worker(db, executor, monkeypatch):
+    gmail = _account(db)
+    job = SyncJob(gmail_account_id=gmail.id, status="queued")
+    db.add(job)
+    db.commit()
+    job_id = job.id
+
+    def slow_sync(session, account, progress):
+        # Another request declares the job dead while this worker is mid-sync
+        other = sync_jobs.SessionLocal()
+        other.query(SyncJob).filter(SyncJob.id == job_id).update({"status": "failed", "error": "stale"})
+        other.commit()
+        other.close()
+        return progress
+
+    monkeypatch.setattr(sync_jobs, "sync_account", slow_sync)
+    monkeypatch.setattr(sync_jobs, "_publish_status", lambda job: None)
+    sync_jobs._submit(job_id)
+    sync_jobs._run_job(job_id)
+
+    db.expire_all()
+    job = db.get(SyncJob, job_id)
+    assert (job.status, job.error) == ("failed", "stale")
+    assert sync_jobs.pending_jobs() == 0
+
+
+def test_only_jobs_without_a_recent_heartbeat_are_stale(db):
+    gmail = _account(db)
+    now = datetime.utcnow()
+    old = now - timedelta(seconds=sync_jobs.SYNC_JOB_STALE_SECONDS + 60)
+    # No page progress for a long time, but the worker is still beating
+    slow = SyncJob(gmail_account_id=gmail.id, status="running", updated_at=old, heartbeat_at=now)
+    db.add(slow)
+    db.commit()
+
+    sync_jobs._fail_stale_jobs(db)
+    db.refresh(slow)
+    assert slow.status == "running"
+
+    slow.heartbeat_at = old
+    db.commit()
+    sync_jobs._fail_stale_jobs(db)
+    db.refresh(slow)
+    assert slow.status == "failed"
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from db import GmailAccount, GmailMessage, GmailThread, User
+from utils.thread_utils import apply_new_messages, refresh_threads
+
+
+def _detail(index: int, sender: str, to: str) -> dict:
+    return {
+        "id": f"m{index}",
+        "threadId": "t1",
+        "snippet": f"message {index}",
+        "internalDate": str(int((datetime(2024, 1, 1) + timedelta(minutes=index)).timestamp() * 1000)),
+        "payload": {"headers": [{"name": "From", "value": sender}, {"name": "To", "value": to}]},
+    }
+
+
+def test_refresh_drops_participants_of_deleted_messages(db):
+    user = User(name="a", email="a@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    account = GmailAccount(user_id=user.id, google_email="a@example.com")
+    db.add(account)
+    db.flush()
+
+    details = [
+        _detail(0, "Alice <alice@example.com>", "me@example.com"),
+        _detail(1, "Bob <BOB@example.com>", "me@example.com, carol@example.com"),
+        _detail(2, "Dave <dave@example.com>", "me@example.com"),
+    ]
+    for i, detail in enumerate(details):
+        row = GmailMessage(gmail_account_id=account.id, gmail_message_id=detail["id"], thread_id="t1",
+                           internal_date=datetime(2024, 1, 1) + timedelta(minutes=i), snippet=detail["snippet"])
+        if i != 2:
+            # The last row is stored unparsed, so its payload is read instead
+            row.sender = detail["payload"]["headers"][0]["value"]
+            row.recipients = detail["payload"]["headers"][1]["value"]
+            row.body_text = ""
+        else:
+            row.payload = detail
+        db.add(row)
+    apply_new_messages(db, account.id, details)
+    db.commit()
+    thread = db.query(GmailThread).one()
+    assert set(thread.participants) == {
+        "alice@example.com", "me@example.com", "bob@example.com", "carol@example.com", "dave@example.com",
+    }
+
+    db.query(GmailMessage).filter(GmailMessage.gmail_message_id == "m1").delete()
+    refresh_threads(db, account.id, {"t1"})
+    db.commit()
+
+    db.refresh(thread)
+    assert thread.message_count == 2
+    assert thread.participants == ["alice@example.com", "me@example.com", "dave@example.com"]
@@ -0,0 +1,80 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db import Base, GmailToken
+from utils import gmail_utils, token_manager as token_manager_module
+from utils.token_manager import TokenManager
+
+
+class TokenEndpoint:
+    """Stands in for the OAuth token endpoint, counting refresh POSTs."""
+
+    def __init__(self):
+        self.posts = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        assert (method, url) == ("POST", gmail_utils.GOOGLE_TOKEN_URL)
+        with self._lock:
+            self.posts += 1
+        # Slow enough that every caller arrives while the refresh is in flight
+        time.sleep(0.2)
+        return self
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"access_token": f"fresh-{self.posts}", "expires_in": 3600}
+
+
+@pytest.fixture
+def stored_token(tmp_path, monkeypatch):
+    # A file database, so the caller threads share it
+    engine = create_engine(f"sqlite:///{tmp_path / 'tokens.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add(GmailToken(gmail_account_id=1, access_token="stale", refresh_token="refresh",
+                          expires_at=datetime.utcnow() - timedelta(minutes=1)))
+        db.commit()
+    monkeypatch.setattr(token_manager_module, "SessionLocal", Session)
+    endpoint = TokenEndpoint()
+    monkeypatch.setattr(gmail_utils.http_client, "request", endpoint.request)
+    yield endpoint, Session
+    engine.dispose()
+
+
+def test_concurrent_callers_share_one_refresh(stored_token):
+    endpoint, Session = stored_token
+    manager = TokenManager()
+    start = threading.Barrier(8)
+    results = []
+
+    def call():
+        start.wait()
+        results.append(manager.get_access_token(1))
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert endpoint.posts == 1
+    assert results == ["fresh-1"] * 8
+    with Session() as db:
+        assert db.get(GmailToken, 1).access_token == "fresh-1"
+
+
+def test_fresh_token_is_served_from_memory(stored_token):
+    endpoint, _ = stored_token
+    manager = TokenManager()
+    manager.get_access_token(1)
+    manager.get_access_token(1)
+    assert endpoint.posts == 1 and manager.refreshes == 1
@@ -0,0 +1,189 @@
+"""Content-addressed attachment store.
+
+Attachment bodies are only fetched from Gmail (messages.attachments.get)
+the first time someone downloads them. They are written to disk under
+their SHA-256, ``ATTACHMENT_DIR/ab/cd/abcd...``, so a file received by many
+users or many times is stored once. GmailAttachment rows map message parts
+to blobs and are served straight from disk by GET /gmail/attachments/{id}.
+
+Blobs are shared, so deleting a message only drops its index rows;
+``python -m utils.attachment_store`` removes blobs no row refers to.
+Writers hold a shared lock on ``ATTACHMENT_DIR/.lock`` from writing a
+blob until the row referring to it is committed. The prune re-checks
+references and unlinks under the exclusive lock, so it never removes a
+blob that a download is about to point at.
+"""
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from db import GmailAttachment
+
+try:
+    import fcntl
+except ImportError:  # Windows; the prune then relies on its reference re-check alone
+    fcntl = None
+
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "attachments")
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(ATTACHMENT_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def blob_lock(exclusive: bool = False):
+    """Open and lock ``ATTACHMENT_DIR/.lock``; closing the returned file releases it.
+
+    Shared for store_blob + mark_fetched, exclusive for prune_blobs.
+    """
+    os.makedirs(ATTACHMENT_DIR, exist_ok=True)
+    fh = open(os.path.join(ATTACHMENT_DIR, ".lock"), "a+b")
+    if fcntl is not None:
+        fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    return fh
+
+
+def has_blob(sha256: str | None) -> bool:
+    return bool(sha256) and os.path.exists(blob_path(sha256))
+
+
+def store_blob(data: bytes) -> str:
+    """Write ``data`` to the store unless it is already there; returns its SHA-256."""
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        return sha256
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Written beside the target and renamed so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return sha256
+
+
+# ---------- Index ----------
+def index_attachments(db: Session, attachments_by_message: dict[int, list[dict]]) -> None:
+    """Add index rows for parsed attachment metadata, keyed by GmailMessage.id."""
+    rows = [
+        {
+            "message_id": message_id,
+            "part_id": info["part_id"],
+            "attachment_id": info["attachment_id"],
+            "filename": info.get("filename"),
+            "mime_type": info.get("mime_type"),
+            "size": info.get("size"),
+        }
+        for message_id, attachments in attachments_by_message.items()
+        for info in attachments or []
+        # Parts without an attachmentId carry their data inline in the payload
+        if info.get("attachment_id") and info.get("part_id")
+    ]
+    if not rows:
+        return
+
+    # Two first reads of the same message can index it concurrently; the
+    # loser's rows are skipped on uq_gmail_attachment
+    table = GmailAttachment.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        db.execute(table.insert(), rows)
+        return
+    db.execute(insert(table).on_conflict_do_nothing(index_elements=["message_id", "part_id"]), rows)
+
+
+def attachment_ids(db: Session, message_id: int, attachments: list[dict] | None) -> dict[str, int]:
+    """GmailAttachment ids of a message by part id, indexing it first if needed.
+
+    Messages stored before the index existed get their rows on first read.
+    """
+    if not attachments:
+        return {}
+    ids = dict(db.query(GmailAttachment.part_id, GmailAttachment.id).filter(
+        GmailAttachment.message_id == message_id,
+    ).all())
+    missing = [info for info in attachments if info.get("attachment_id") and info.get("part_id") not in ids]
+    if missing:
+        index_attachments(db, {message_id: missing})
+        db.commit()
+        ids = dict(db.query(GmailAttachment.part_id, GmailAttachment.id).filter(
+            GmailAttachment.message_id == message_id,
+        ).all())
+    return ids
+
+
+def mark_fetched(db: Session, attachment_pk: int, sha256: str) -> None:
+    db.query(GmailAttachment).filter(GmailAttachment.id == attachment_pk).update(
+        {"sha256": sha256, "fetched_at": datetime.utcnow()}, synchronize_session=False
+    )
+    db.commit()
+
+
+def drop_attachments(db: Session, message_ids: list[int]) -> None:
+    """Remove index rows of deleted messages. Postgres also does this via ON DELETE CASCADE."""
+    if message_ids:
+        db.query(GmailAttachment).filter(
+            GmailAttachment.message_id.in_(message_ids),
+        ).delete(synchronize_session=False)
+
+
+def _referenced(db: Session, sha256s: list[str]) -> set[str]:
+    referenced = set()
+    for start in range(0, len(sha256s), 500):
+        referenced.update(sha256 for (sha256,) in db.query(GmailAttachment.sha256).filter(
+            GmailAttachment.sha256.in_(sha256s[start:start + 500]),
+        ).distinct())
+    return referenced
+
+
+def prune_blobs(db: Session) -> int:
+    """Delete blobs that no attachment row refers to; returns how many."""
+    referenced = {
+        sha256 for (sha256,) in db.query(GmailAttachment.sha256).filter(
+            GmailAttachment.sha256.isnot(None),
+        ).distinct()
+    }
+    # Dot files are the lock and in-progress writes
+    candidates = {
+        name: os.path.join(directory, name)
+        for directory, _, files in os.walk(ATTACHMENT_DIR)
+        for name in files
+        if name not in referenced and not name.startswith(".")
+    }
+    if not candidates:
+        return 0
+
+    # Downloads may have stored and marked blobs since the walk; re-check
+    # in a fresh transaction while they are locked out
+    with blob_lock(exclusive=True):
+        db.rollback()
+        referenced = _referenced(db, list(candidates))
+        removed = 0
+        for name, path in candidates.items():
+            if name not in referenced:
+                os.unlink(path)
+                removed += 1
+    return removed
+
+
+if __name__ == "__main__":
+    from db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"[ATTACHMENTS] Removed {prune_blobs(session)} unreferenced blobs from {ATTACHMENT_DIR}")
+    finally:
+        session.close()
@@ -6,15 +6,20 @@ from typing import Optional
 import jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from db import get_db, User
+from db import get_async_db, get_db, User
+from utils.cache import TTLCache
+from utils.metrics import AUTH_FAILURES, register_cache
 
 # ---------- Config ----------
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
 ALGORITHM = "HS256"
 TOKEN_EXPIRE_DAYS = 30
 COOKIE_SECURE = os.getenv("COOKIE_SECURE", "false").lower() == "true"
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
 
 # ---------- Logging ----------
 logging.basicConfig(level=logging.INFO)
@@ -60,32 +65,72 @@ def set_auth_cookie(response: Response, token: str) -> None:
     )
 
 
+# ---------- User cache ----------
+# Detached User rows keyed by id, so authenticated requests skip the lookup
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+register_cache("user", user_cache)
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    user_cache.invalidate(user_id)
+
+
 # ---------- Current user ----------
-def get_current_user(
-    request: Request,
-    db: Session = Depends(get_db),
-) -> User:
+def _token_user_id(request: Request) -> int:
     token: Optional[str] = request.cookies.get("token")
     if not token:
         logger.warning("Authentication failed: No token provided")
+        AUTH_FAILURES.inc(reason="missing_token")
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("user_id")
         if not user_id:
+            AUTH_FAILURES.inc(reason="invalid_token")
             raise HTTPException(status_code=401, detail="Invalid token payload")
     except jwt.ExpiredSignatureError:
         logger.warning("Authentication failed: Token expired")
+        AUTH_FAILURES.inc(reason="expired_token")
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         logger.warning("Authentication failed: Invalid token")
+        AUTH_FAILURES.inc(reason="invalid_token")
         raise HTTPException(status_code=401, detail="Invalid token")
+    return user_id
+
 
+def _load_user(db: Session, user_id: int) -> User:
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         logger.warning(f"Authentication failed: User not found (id={user_id})")
+        AUTH_FAILURES.inc(reason="unknown_user")
         raise HTTPException(status_code=401, detail="User not found")
 
+    # Cached instances are shared between requests, so keep them out of any session
+    db.expunge(user)
+    user_cache.set(user_id, user)
     return user
 
+
+def get_current_user(
+    request: Request,
+    db: Session = Depends(get_db),
+) -> User:
+    user_id = _token_user_id(request)
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    return _load_user(db, user_id)
+
+
+async def get_current_user_async(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+) -> User:
+    """get_current_user for async routes; resolved on the event loop, not in the threadpool."""
+    user_id = _token_user_id(request)
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    return await db.run_sync(_load_user, user_id)
@@ -0,0 +1,145 @@
+"""Per-user event fan-out behind GET /gmail/events.
+
+Sync publishes job progress and summaries of newly stored messages for
+the user that owns the account; every open event stream of that user
+receives them. Publishing is a plain function call that is safe from sync
+worker threads.
+
+By default events stay in this process: each subscriber has a bounded
+asyncio queue on the event loop that serves its stream. Syncs running in
+other processes (worker.py shards, several uvicorn workers) need a shared
+bus; set EVENTS_REDIS_URL to fan out over Redis pub/sub, or any server
+speaking its protocol.
+"""
+import asyncio
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+
+import orjson
+
+logger = logging.getLogger("events")
+
+EVENTS_REDIS_URL = os.getenv("EVENTS_REDIS_URL")
+# Per subscriber; a client that falls this far behind is told to resync
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+
+RESYNC = {"type": "resync", "data": {}}
+
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+
+    def deliver(self, event: dict) -> None:
+        # Runs on the subscriber's loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Dropping events silently would leave the client wrong; make it refetch
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscribers: dict[int, set[_Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def has_subscribers(self, user_id: int) -> bool:
+        return bool(self._subscribers.get(user_id))
+
+    def publish(self, user_id: int, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+            except RuntimeError:
+                # Loop already closed; its stream is gone
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int):
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        try:
+            yield subscriber.queue
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(user_id)
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+
+class RedisBroker:
+    """Fan-out over Redis pub/sub, one channel per user."""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("EVENTS_REDIS_URL is set but the redis package is not installed")
+        self._url = url
+        self._client = redis.Redis.from_url(url)
+        self._async_module = redis.asyncio
+
+    @staticmethod
+    def _channel(user_id: int) -> str:
+        return f"gmail-events:{user_id}"
+
+    def has_subscribers(self, user_id: int) -> bool:
+        # Subscribers may live in any process
+        return True
+
+    def publish(self, user_id: int, event: dict) -> None:
+        try:
+            self._client.publish(self._channel(user_id), orjson.dumps(event))
+        except Exception as e:
+            # Live updates are best effort; never fail a sync over them
+            logger.warning("Publishing event for user %s failed: %s", user_id, e)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int):
+        client = self._async_module.Redis.from_url(self._url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self._channel(user_id))
+        queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        subscriber.queue = queue
+
+        async def pump():
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    subscriber.deliver(orjson.loads(message["data"]))
+
+        task = asyncio.create_task(pump())
+        try:
+            yield queue
+        finally:
+            task.cancel()
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+            await client.aclose()
+
+
+broker = RedisBroker(EVENTS_REDIS_URL) if EVENTS_REDIS_URL else InProcessBroker()
+
+
+def publish(user_id: int, event_type: str, data: dict) -> None:
+    broker.publish(user_id, {"type": event_type, "data": data})
+
+
+def has_subscribers(user_id: int) -> bool:
+    """Whether publishing for ``user_id`` can reach anyone; lets callers skip building events."""
+    return broker.has_subscribers(user_id)
+
+
+def format_sse(event: dict) -> bytes:
+    return b"event: " + event["type"].encode("utf-8") + b"\ndata: " + orjson.dumps(event["data"]) + b"\n\n"
@@ -0,0 +1,95 @@
+"""Async versions of the Google API calls made from ``async def`` routes.
+
+Same endpoints, quota costs, retries and errors as ``utils.gmail_utils``,
+built on ``http_client.arequest`` so routes can wait on Google without
+holding a threadpool worker. Only the calls routes make live here; sync
+and token refresh run in worker threads on the sync module.
+"""
+from datetime import datetime, timedelta
+
+import httpx
+
+from utils import http_client
+from utils.gmail_utils import (
+    GMAIL_API_BASE,
+    GOOGLE_CLIENT_ID,
+    GOOGLE_CLIENT_SECRET,
+    GOOGLE_REDIRECT_URI,
+    GOOGLE_TOKEN_URL,
+    GOOGLE_USERINFO_URL,
+    QUOTA_ATTACHMENTS_GET,
+    _raise_for_gmail_status,
+    decode_attachment,
+)
+
+# ---------- OAuth flow ----------
+async def exchange_code_for_tokens(code: str) -> dict:
+    res = (await http_client.arequest(
+        "POST",
+        GOOGLE_TOKEN_URL,
+        endpoint="oauth.token",
+        data={
+            "client_id": GOOGLE_CLIENT_ID,
+            "client_secret": GOOGLE_CLIENT_SECRET,
+            "code": code,
+            "grant_type": "authorization_code",
+            "redirect_uri": GOOGLE_REDIRECT_URI,
+        },
+    )).json()
+
+    if "access_token" not in res or "refresh_token" not in res:
+        raise RuntimeError("OAuth token exchange failed")
+
+    return {
+        "access_token": res["access_token"],
+        "refresh_token": res["refresh_token"],
+        "expires_at": datetime.utcnow() + timedelta(seconds=res["expires_in"]),
+    }
+
+
+async def fetch_google_profile(access_token: str) -> dict:
+    res = await http_client.arequest(
+        "GET",
+        GOOGLE_USERINFO_URL,
+        endpoint="oauth.userinfo",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    return res.json()
+
+
+# ---------- Gmail API ----------
+async def _gmail_get(
+    access_token: str,
+    path: str,
+    endpoint: str,
+    quota_units: int,
+    account_id: int | None = None,
+    **kwargs,
+) -> httpx.Response:
+    return await http_client.arequest(
+        "GET",
+        f"{GMAIL_API_BASE}{path}",
+        endpoint=endpoint,
+        headers={"Authorization": f"Bearer {access_token}"},
+        quota_key=account_id if account_id is not None else access_token,
+        quota_units=quota_units,
+        **kwargs,
+    )
+
+
+async def fetch_gmail_attachment(
+    access_token: str,
+    message_id: str,
+    attachment_id: str,
+    account_id: int | None = None,
+) -> bytes:
+    res = await _gmail_get(
+        access_token,
+        f"/users/me/messages/{message_id}/attachments/{attachment_id}",
+        "attachments.get",
+        QUOTA_ATTACHMENTS_GET,
+        account_id,
+        timeout=60,
+    )
+    _raise_for_gmail_status(res, f"attachment of message {message_id}")
+    return decode_attachment(res.json())
@@ -0,0 +1,433 @@
+"""Mailbox sync: full listing walks, history-based incremental syncs and page storage."""
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from db import GmailAccount, GmailMessage, GmailSyncCheckpoint, GmailSyncRetry, insert_gmail_messages
+from utils.gmail_utils import (
+    GmailApiError,
+    fetch_gmail_messages,
+    fetch_gmail_message_details,
+    fetch_gmail_profile,
+    fetch_gmail_history,
+    GmailHistoryExpired,
+)
+from utils import events
+from utils.attachment_store import drop_attachments, index_attachments
+from utils.classifier import classify_pending
+from utils.listing_cache import invalidate_account
+from utils.message_content import invalidate_message_content
+from utils.metrics import MESSAGES_STORED, SYNC_STAGE_SECONDS
+from utils.mime_utils import parse_message
+from utils.payload_archive import drop_archived_payloads
+from utils.search_utils import search_document, index_messages, unindex_messages
+from utils.similarity import drop_similarity, index_similarity, similarity_text
+from utils.thread_utils import apply_new_messages, refresh_threads
+from utils.token_manager import token_manager
+
+logger = logging.getLogger("gmail_sync")
+
+# Incremental syncs store added messages in pages of this size
+SYNC_PAGE_SIZE = 50
+# Messages that failed this many fetches are no longer retried
+SYNC_RETRY_MAX_ATTEMPTS = int(os.getenv("SYNC_RETRY_MAX_ATTEMPTS", "5"))
+
+
+class SyncProgress:
+    """Running counters for one sync, reported after every committed page."""
+
+    def __init__(self, on_update: Optional[Callable[["SyncProgress"], None]] = None):
+        self.mode = "full"
+        self.pages_done = 0
+        self.messages_seen = 0
+        self.messages_stored = 0
+        self.messages_deleted = 0
+        self.messages_total: Optional[int] = None
+        self._on_update = on_update
+
+    def page_committed(self, seen: int, stored: int) -> None:
+        self.pages_done += 1
+        self.messages_seen += seen
+        self.messages_stored += stored
+        if self._on_update:
+            self._on_update(self)
+
+    def as_dict(self) -> dict:
+        return {
+            "mode": self.mode,
+            "pages_done": self.pages_done,
+            "messages_seen": self.messages_seen,
+            "messages_stored": self.messages_stored,
+            "messages_deleted": self.messages_deleted,
+            "messages_total": self.messages_total,
+        }
+
+
+# ---------- Storage ----------
+def _bump_version(db: Session, gmail: GmailAccount) -> None:
+    # Done in SQL so concurrent writers cannot lose an increment
+    db.query(GmailAccount).filter(GmailAccount.id == gmail.id).update(
+        {GmailAccount.version: GmailAccount.version + 1},
+        synchronize_session=False,
+    )
+
+
+def _commit(db: Session, gmail: GmailAccount) -> None:
+    """Commit a page and drop cached listings that may now be stale."""
+    with SYNC_STAGE_SECONDS.time(stage="commit"):
+        db.commit()
+    invalidate_account(gmail.id)
+
+
+def _classify_new(db: Session, gmail: GmailAccount) -> None:
+    """Label messages committed without a category yet.
+
+    Runs after the page commit so classification never delays or fails
+    storage; anything left unlabelled is picked up by the next call.
+    """
+    try:
+        with SYNC_STAGE_SECONDS.time(stage="classify"):
+            classified = classify_pending(db, gmail.id)
+        if classified:
+            _bump_version(db, gmail)
+            _commit(db, gmail)
+    except Exception:
+        db.rollback()
+        logger.exception("Classification failed for account %s", gmail.id)
+
+
+def _publish_new_messages(db: Session, gmail: GmailAccount, message_ids: list[int]) -> None:
+    """Push summaries of a committed page to the user's event streams."""
+    if not events.has_subscribers(gmail.user_id):
+        return
+    rows = db.query(
+        GmailMessage.gmail_message_id,
+        GmailMessage.thread_id,
+        GmailMessage.snippet,
+        GmailMessage.internal_date,
+        GmailMessage.category,
+    ).filter(
+        GmailMessage.id.in_(message_ids),
+    ).order_by(GmailMessage.internal_date.desc(), GmailMessage.id.desc()).all()
+    events.publish(gmail.user_id, "messages", {
+        "account": gmail.google_email,
+        "messages": [
+            {
+                "id": row.gmail_message_id,
+                "thread_id": row.thread_id,
+                "snippet": row.snippet,
+                "date": row.internal_date,
+                "category": row.category,
+                "account": gmail.google_email,
+            }
+            for row in rows
+        ],
+    })
+
+
+def _after_page(db: Session, gmail: GmailAccount, stored: list[int]) -> None:
+    # Classified first so the pushed summaries carry their category
+    if stored:
+        _classify_new(db, gmail)
+        _publish_new_messages(db, gmail, stored)
+
+
+def _existing_message_ids(db: Session, gmail: GmailAccount, message_ids: list[str]) -> set[str]:
+    if not message_ids:
+        return set()
+    rows = db.query(GmailMessage.gmail_message_id).filter(
+        GmailMessage.gmail_account_id == gmail.id,
+        GmailMessage.gmail_message_id.in_(message_ids),
+    ).all()
+    return {row[0] for row in rows}
+
+
+def _record_failures(db: Session, gmail: GmailAccount, errors: dict[str, str]) -> None:
+    """Add messages whose fetch failed to the account's retry set; the caller commits."""
+    now = datetime.utcnow()
+    existing = {
+        row.gmail_message_id: row for row in db.query(GmailSyncRetry).filter(
+            GmailSyncRetry.gmail_account_id == gmail.id,
+            GmailSyncRetry.gmail_message_id.in_(list(errors)),
+        )
+    }
+    for message_id, error in errors.items():
+        row = existing.get(message_id)
+        if row:
+            row.attempts += 1
+            row.last_error = error
+            row.updated_at = now
+        else:
+            db.add(GmailSyncRetry(
+                gmail_account_id=gmail.id, gmail_message_id=message_id,
+                last_error=error, created_at=now, updated_at=now,
+            ))
+    # Sessions do not autoflush; later queries in this sync must see these rows
+    db.flush()
+    logger.warning("Could not fetch %d messages of %s, queued for retry", len(errors), gmail.google_email)
+
+
+def store_new_messages(db: Session, gmail: GmailAccount, access_token: str, message_ids: list[str]) -> list[int]:
+    """Fetch, parse and store the messages not stored yet; returns the new row ids.
+
+    Messages that cannot be fetched go to the retry set instead of failing the page.
+    """
+    with SYNC_STAGE_SECONDS.time(stage="dedupe"):
+        existing = _existing_message_ids(db, gmail, message_ids)
+    new_ids = [message_id for message_id in message_ids if message_id not in existing]
+
+    # Details are fetched concurrently but come back in page order
+    errors: dict[str, str] = {}
+    with SYNC_STAGE_SECONDS.time(stage="fetch_details"):
+        details = fetch_gmail_message_details(access_token, new_ids, account_id=gmail.id, errors=errors)
+    if errors:
+        details = [detail for detail in details if detail]
+        _record_failures(db, gmail, errors)
+
+    # Decode bodies and headers once here so reads never walk the payload
+    with SYNC_STAGE_SECONDS.time(stage="parse"):
+        contents = {detail["id"]: parse_message(detail) for detail in details}
+
+    rows = []
+    for detail in details:
+        internal_date = datetime.utcfromtimestamp(int(detail.get("internalDate", 0)) / 1000)
+        rows.append({
+            "gmail_account_id": gmail.id,
+            "gmail_message_id": detail["id"],
+            "thread_id": detail["threadId"],
+            "snippet": detail.get("snippet"),
+            "internal_date": internal_date,
+            "payload": detail,
+            **contents[detail["id"]],
+        })
+
+    with SYNC_STAGE_SECONDS.time(stage="insert"):
+        inserted = insert_gmail_messages(db, rows)
+        index_attachments(db, {
+            message_id: contents[gmail_message_id]["attachments"] for message_id, gmail_message_id in inserted
+        })
+
+    # Keep the full-text index in step with the rows just written
+    details_by_id = {detail["id"]: detail for detail in details}
+    with SYNC_STAGE_SECONDS.time(stage="search_index"):
+        index_messages(db, gmail.id, {
+            message_id: search_document(details_by_id[gmail_message_id], contents[gmail_message_id])
+            for message_id, gmail_message_id in inserted
+        })
+    with SYNC_STAGE_SECONDS.time(stage="similarity"):
+        index_similarity(db, gmail.id, [
+            (message_id, similarity_text(details_by_id[gmail_message_id].get("snippet"),
+                                         contents[gmail_message_id]["body_text"]))
+            for message_id, gmail_message_id in inserted
+        ])
+    with SYNC_STAGE_SECONDS.time(stage="threads"):
+        apply_new_messages(db, gmail.id, [details_by_id[gmail_message_id] for _, gmail_message_id in inserted])
+    if inserted:
+        _bump_version(db, gmail)
+
+    MESSAGES_STORED.inc(len(inserted))
+    logger.debug("Stored %d of %d messages", len(inserted), len(message_ids))
+    return [message_id for message_id, _ in inserted]
+
+
+# ---------- Sync modes ----------
+def _start_checkpoint(db: Session, gmail: GmailAccount) -> GmailSyncCheckpoint:
+    # Take the history checkpoint before listing so changes made during
+    # the walk are picked up by the next incremental sync. Without one the
+    # account could never leave full-sync mode, so fail the job instead.
+    profile = fetch_gmail_profile(token_manager.get_access_token(gmail.id), account_id=gmail.id)
+    if not profile.get("historyId"):
+        raise GmailApiError(f"Mailbox profile for {gmail.google_email} has no historyId")
+    checkpoint = GmailSyncCheckpoint(
+        gmail_account_id=gmail.id,
+        history_id=str(profile["historyId"]),
+        messages_total=profile.get("messagesTotal"),
+        pages_done=0,
+        messages_seen=0,
+        messages_stored=0,
+    )
+    db.add(checkpoint)
+    db.commit()
+    return checkpoint
+
+
+def _full_sync(db: Session, gmail: GmailAccount, progress: SyncProgress) -> None:
+    progress.mode = "full"
+    checkpoint = db.get(GmailSyncCheckpoint, gmail.id)
+    if checkpoint:
+        logger.info("Resuming full sync of %s after %d pages", gmail.google_email, checkpoint.pages_done)
+    else:
+        checkpoint = _start_checkpoint(db, gmail)
+    progress.messages_total = checkpoint.messages_total
+    progress.pages_done = checkpoint.pages_done
+    progress.messages_seen = checkpoint.messages_seen
+    progress.messages_stored = checkpoint.messages_stored
+
+    page_token = resumed_token = checkpoint.page_token
+    while True:
+        # Fetched per page so long syncs pick up proactively refreshed tokens
+        access_token = token_manager.get_access_token(gmail.id)
+        with SYNC_STAGE_SECONDS.time(stage="list"):
+            try:
+                data = fetch_gmail_messages(access_token, page_token, account_id=gmail.id)
+            except GmailApiError as e:
+                # A saved page token can expire; walk again from the top (stored pages dedupe)
+                if not resumed_token or page_token != resumed_token or e.status_code != 400:
+                    raise
+                logger.warning("Saved page token of %s rejected, restarting the walk", gmail.google_email)
+                page_token = resumed_token = None
+                continue
+        messages = data.get("messages", [])
+
+        stored = store_new_messages(db, gmail, access_token, [m["id"] for m in messages])
+        # Saved with the page itself, so a restart resumes right after it
+        page_token = data.get("nextPageToken")
+        checkpoint.page_token = page_token
+        checkpoint.pages_done = progress.pages_done + 1
+        checkpoint.messages_seen = progress.messages_seen + len(messages)
+        checkpoint.messages_stored = progress.messages_stored + len(stored)
+        _commit(db, gmail)
+        progress.page_committed(len(messages), len(stored))
+        logger.debug("Committed page, total stored so far: %d", progress.messages_stored)
+        _after_page(db, gmail, stored)
+
+        if not page_token:
+            break
+
+    if checkpoint.history_id:
+        gmail.history_id = checkpoint.history_id
+    db.delete(checkpoint)
+    db.commit()
+
+
+def _incremental_sync(db: Session, gmail: GmailAccount, progress: SyncProgress) -> None:
+    added: dict[str, None] = {}
+    deleted: set[str] = set()
+    latest_history_id = None
+    page_token = None
+
+    while True:
+        access_token = token_manager.get_access_token(gmail.id)
+        with SYNC_STAGE_SECONDS.time(stage="history"):
+            data = fetch_gmail_history(access_token, gmail.history_id, page_token, account_id=gmail.id)
+        for record in data.get("history", []):
+            for item in record.get("messagesAdded", []):
+                message_id = item["message"]["id"]
+                added[message_id] = None
+                deleted.discard(message_id)
+            for item in record.get("messagesDeleted", []):
+                message_id = item["message"]["id"]
+                added.pop(message_id, None)
+                deleted.add(message_id)
+        latest_history_id = data.get("historyId") or latest_history_id
+
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            break
+
+    logger.info("History since %s: %d added, %d deleted", gmail.history_id, len(added), len(deleted))
+    progress.mode = "incremental"
+    progress.messages_total = len(added)
+
+    if deleted:
+        removed = db.query(GmailMessage.id, GmailMessage.gmail_message_id, GmailMessage.thread_id).filter(
+            GmailMessage.gmail_account_id == gmail.id,
+            GmailMessage.gmail_message_id.in_(deleted),
+        ).all()
+        removed_ids = [row.id for row in removed]
+        unindex_messages(db, removed_ids)
+        drop_attachments(db, removed_ids)
+        drop_similarity(db, removed_ids)
+        drop_archived_payloads(db, removed_ids)
+        db.query(GmailSyncRetry).filter(
+            GmailSyncRetry.gmail_account_id == gmail.id,
+            GmailSyncRetry.gmail_message_id.in_(deleted),
+        ).delete(synchronize_session=False)
+        progress.messages_deleted = db.query(GmailMessage).filter(
+            GmailMessage.id.in_(removed_ids),
+        ).delete(synchronize_session=False)
+        refresh_threads(db, gmail.id, {row.thread_id for row in removed})
+        if removed_ids:
+            _bump_version(db, gmail)
+        _commit(db, gmail)
+        invalidate_message_content(gmail.id, [row.gmail_message_id for row in removed])
+        if removed:
+            events.publish(gmail.user_id, "messages_deleted", {
+                "account": gmail.google_email,
+                "ids": [row.gmail_message_id for row in removed],
+            })
+
+    added_ids = list(added)
+    for start in range(0, len(added_ids), SYNC_PAGE_SIZE):
+        page = added_ids[start:start + SYNC_PAGE_SIZE]
+        stored = store_new_messages(db, gmail, token_manager.get_access_token(gmail.id), page)
+        _commit(db, gmail)
+        progress.page_committed(len(page), len(stored))
+        _after_page(db, gmail, stored)
+
+    # Only advance the checkpoint when Gmail confirmed how far we got
+    if latest_history_id:
+        gmail.history_id = str(latest_history_id)
+    db.commit()
+
+
+def _drain_retries(db: Session, gmail: GmailAccount, progress: SyncProgress, before: datetime) -> None:
+    """Fetch messages that failed in syncs before ``before`` again.
+
+    Messages that fail SYNC_RETRY_MAX_ATTEMPTS times stay in the retry set
+    for inspection but are no longer fetched.
+    """
+    last_id = 0
+    while True:
+        rows = db.query(GmailSyncRetry.id, GmailSyncRetry.gmail_message_id).filter(
+            GmailSyncRetry.gmail_account_id == gmail.id,
+            GmailSyncRetry.id > last_id,
+            GmailSyncRetry.attempts < SYNC_RETRY_MAX_ATTEMPTS,
+            GmailSyncRetry.updated_at < before,
+        ).order_by(GmailSyncRetry.id).limit(SYNC_PAGE_SIZE).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+
+        page = [row.gmail_message_id for row in rows]
+        stored = store_new_messages(db, gmail, token_manager.get_access_token(gmail.id), page)
+        # Rows that failed again were just touched; the rest are stored now
+        db.query(GmailSyncRetry).filter(
+            GmailSyncRetry.id.in_([row.id for row in rows]),
+            GmailSyncRetry.updated_at < before,
+        ).delete(synchronize_session=False)
+        _commit(db, gmail)
+        progress.page_committed(len(page), len(stored))
+        _after_page(db, gmail, stored)
+
+
+def sync_account(db: Session, gmail: GmailAccount, progress: Optional[SyncProgress] = None) -> SyncProgress:
+    """Bring the stored messages of one Gmail account up to date.
+
+    An interrupted full sync resumes from its checkpoint, and messages that
+    failed to fetch in earlier runs are retried at the end.
+    """
+    progress = progress or SyncProgress()
+    started = datetime.utcnow()
+
+    logger.info("Starting sync for account %s", gmail.google_email)
+    if gmail.history_id:
+        try:
+            _incremental_sync(db, gmail, progress)
+        except GmailHistoryExpired:
+            logger.warning("History %s expired, falling back to full sync", gmail.history_id)
+            db.rollback()
+            gmail.history_id = None
+            _full_sync(db, gmail, progress)
+    else:
+        _full_sync(db, gmail, progress)
+    _drain_retries(db, gmail, progress, started)
+
+    logger.info(
+        "Sync (%s) complete for %s, new: %d, deleted: %d",
+        progress.mode, gmail.google_email, progress.messages_stored, progress.messages_deleted,
+    )
+    return progress
@@ -1,9 +1,22 @@
+import base64
+import json
+import logging
 import os
+import re
+import threading
 import urllib.parse
+import uuid
+from email import policy
+from email.parser import BytesParser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import jwt
 import requests
 
+from utils import http_client
+
+logger = logging.getLogger("gmail_utils")
+
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
@@ -16,11 +29,47 @@ GMAIL_SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
     "https://www.googleapis.com/auth/userinfo.email",
 ]
-GMAIL_API_BASE = "https://gmail.googleapis.com/gmail/v1"
+GOOGLE_AUTH_URL = os.getenv("GOOGLE_AUTH_URL", "https://accounts.google.com/o/oauth2/v2/auth")
+GOOGLE_TOKEN_URL = os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+GOOGLE_USERINFO_URL = os.getenv("GOOGLE_USERINFO_URL", "https://www.googleapis.com/oauth2/v2/userinfo")
+GOOGLE_REVOKE_URL = os.getenv("GOOGLE_REVOKE_URL", "https://oauth2.googleapis.com/revoke")
+GMAIL_API_BASE = os.getenv("GMAIL_API_BASE", "https://gmail.googleapis.com/gmail/v1")
+GMAIL_BATCH_URL = os.getenv("GMAIL_BATCH_URL", "https://gmail.googleapis.com/batch/gmail/v1")
 
 STATE_ALGORITHM = "HS256"
 STATE_EXPIRE_MINUTES = 10
 
+# Gmail API quota cost per call, in units
+QUOTA_MESSAGES_LIST = 5
+QUOTA_MESSAGES_GET = 5
+QUOTA_ATTACHMENTS_GET = 5
+QUOTA_HISTORY_LIST = 2
+QUOTA_GET_PROFILE = 1
+
+# Max concurrent messages.get calls per Gmail account
+GMAIL_FETCH_CONCURRENCY = int(os.getenv("GMAIL_FETCH_CONCURRENCY", "8"))
+
+# How message details are fetched: "single" (one messages.get per message)
+# or "batch" (up to GMAIL_BATCH_SIZE messages.get calls per /batch request)
+GMAIL_FETCH_MODE = os.getenv("GMAIL_FETCH_MODE", "single").lower()
+GMAIL_BATCH_MAX_SIZE = 100
+GMAIL_BATCH_SIZE = min(int(os.getenv("GMAIL_BATCH_SIZE", "100")), GMAIL_BATCH_MAX_SIZE)
+
+_in_flight_limiters: dict = {}
+_in_flight_limiters_lock = threading.Lock()
+
+
+class GmailApiError(RuntimeError):
+    """A Gmail API call failed after retries; the caller must not treat it as empty."""
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class GmailHistoryExpired(RuntimeError):
+    """The stored historyId is too old for users.history.list; a full sync is needed."""
+
 
 # ---------- OAuth state ----------
 def create_oauth_state(user_id: int) -> str:
@@ -48,12 +97,14 @@ def build_gmail_auth_url(state: str) -> str:
         "prompt": "consent",
         "state": state,
     }
-    return "https://accounts.google.com/o/oauth2/v2/auth?" + urllib.parse.urlencode(params)
+    return f"{GOOGLE_AUTH_URL}?" + urllib.parse.urlencode(params)
 
 
 def exchange_code_for_tokens(code: str) -> dict:
-    res = requests.post(
-        "https://oauth2.googleapis.com/token",
+    res = http_client.request(
+        "POST",
+        GOOGLE_TOKEN_URL,
+        endpoint="oauth.token",
         data={
             "client_id": GOOGLE_CLIENT_ID,
             "client_secret": GOOGLE_CLIENT_SECRET,
@@ -76,17 +127,20 @@ def exchange_code_for_tokens(code: str) -> dict:
 
 def refresh_access_token(refresh_token: str) -> dict:
     """Exchange refresh token for a new access token."""
-    print("[GMAIL_UTIL] Refreshing access token")
+    logger.info("Refreshing access token")
     data = {
         "client_id": GOOGLE_CLIENT_ID,
         "client_secret": GOOGLE_CLIENT_SECRET,
         "refresh_token": refresh_token,
         "grant_type": "refresh_token",
     }
-    res = requests.post("https://oauth2.googleapis.com/token", data=data, timeout=10)
+    # Refresh grants can be repeated safely, unlike the authorization code exchange
+    res = http_client.request(
+        "POST", GOOGLE_TOKEN_URL, data=data, timeout=10, endpoint="oauth.token", idempotent=True,
+    )
     res.raise_for_status()
     token_data = res.json()
-    print(f"[GMAIL_UTIL] Access token refreshed, expires in {token_data.get('expires_in')} seconds")
+    logger.info("Access token refreshed, expires in %s seconds", token_data.get("expires_in"))
     return {
         "access_token": token_data["access_token"],
         "expires_at": datetime.utcnow() + timedelta(seconds=token_data["expires_in"]),
@@ -94,8 +148,10 @@ def refresh_access_token(refresh_token: str) -> dict:
 
 
 def fetch_google_profile(access_token: str) -> dict:
-    res = requests.get(
-        "https://www.googleapis.com/oauth2/v2/userinfo",
+    res = http_client.request(
+        "GET",
+        GOOGLE_USERINFO_URL,
+        endpoint="oauth.userinfo",
         headers={"Authorization": f"Bearer {access_token}"},
         timeout=10,
     )
@@ -103,59 +159,308 @@ def fetch_google_profile(access_token: str) -> dict:
 
 
 def revoke_gmail_token(refresh_token: str) -> None:
-    requests.post(
-        "https://oauth2.googleapis.com/revoke",
+    http_client.request(
+        "POST",
+        GOOGLE_REVOKE_URL,
+        endpoint="oauth.revoke",
         params={"token": refresh_token},
         timeout=10,
+        idempotent=True,
     )
 
 
 # ---------- Gmail API ----------
-def fetch_gmail_messages(access_token: str, page_token: str | None = None):
+def _gmail_get(
+    access_token: str,
+    path: str,
+    endpoint: str,
+    quota_units: int,
+    account_id: int | None = None,
+    **kwargs,
+) -> requests.Response:
+    return http_client.request(
+        "GET",
+        f"{GMAIL_API_BASE}{path}",
+        endpoint=endpoint,
+        headers={"Authorization": f"Bearer {access_token}"},
+        quota_key=account_id if account_id is not None else access_token,
+        quota_units=quota_units,
+        **kwargs,
+    )
+
+
+def _raise_for_gmail_status(res: requests.Response, what: str) -> None:
+    if res.status_code >= 400:
+        raise GmailApiError(
+            f"Gmail API error {res.status_code} while fetching {what}: {res.text[:200]}", res.status_code
+        )
+
+
+def fetch_gmail_messages(access_token: str, page_token: str | None = None, account_id: int | None = None):
     params = {"maxResults": 50}
     if page_token:
         params["pageToken"] = page_token
 
-    print(f"[GMAIL_UTIL] Fetching messages with pageToken={page_token}")
-    try:
-        res = requests.get(
-            f"{GMAIL_API_BASE}/users/me/messages",
-            headers={"Authorization": f"Bearer {access_token}"},
-            params=params,
-            timeout=10,
-        )
-        print(f"[GMAIL_UTIL] HTTP status: {res.status_code}")
-        res.raise_for_status()
-        data = res.json()
-        print(f"[GMAIL_UTIL] Fetched {len(data.get('messages', []))} messages")
-        if "nextPageToken" in data:
-            print(f"[GMAIL_UTIL] nextPageToken: {data['nextPageToken']}")
-        return data
-    except requests.HTTPError as e:
-        print(f"[GMAIL_UTIL] HTTP error: {e}")
-        return {"messages": []}
-    except Exception as e:
-        print(f"[GMAIL_UTIL] Unexpected error: {e}")
-        return {"messages": []}
-
-
-def fetch_gmail_message_detail(access_token: str, message_id: str):
-    print(f"[GMAIL_UTIL] Fetching details for message {message_id}")
+    res = _gmail_get(
+        access_token, "/users/me/messages", "messages.list", QUOTA_MESSAGES_LIST, account_id, params=params
+    )
+    _raise_for_gmail_status(res, "message list")
+    data = res.json()
+    logger.debug(
+        "Fetched %d message ids (pageToken=%s, next=%s)",
+        len(data.get("messages", [])), page_token, data.get("nextPageToken"),
+    )
+    return data
+
+
+def fetch_gmail_profile(access_token: str, account_id: int | None = None) -> dict:
+    """Return the mailbox profile (emailAddress, messagesTotal, historyId).
+
+    Raises GmailApiError if Gmail does not return it.
+    """
+    res = _gmail_get(access_token, "/users/me/profile", "profile", QUOTA_GET_PROFILE, account_id)
+    _raise_for_gmail_status(res, "mailbox profile")
+    return res.json()
+
+
+def fetch_gmail_history(
+    access_token: str,
+    start_history_id: str,
+    page_token: str | None = None,
+    account_id: int | None = None,
+) -> dict:
+    """Fetch one page of mailbox changes since ``start_history_id``.
+
+    Raises GmailHistoryExpired when Gmail no longer has history that old.
+    """
+    params = {
+        "startHistoryId": start_history_id,
+        "historyTypes": ["messageAdded", "messageDeleted"],
+        "maxResults": 500,
+    }
+    if page_token:
+        params["pageToken"] = page_token
+
+    logger.debug("Fetching history since %s, pageToken=%s", start_history_id, page_token)
+    res = _gmail_get(
+        access_token, "/users/me/history", "history.list", QUOTA_HISTORY_LIST, account_id, params=params
+    )
+    if res.status_code == 404:
+        raise GmailHistoryExpired(f"History {start_history_id} is no longer available")
+    _raise_for_gmail_status(res, "history")
+    return res.json()
+
+
+def fetch_gmail_message_detail(access_token: str, message_id: str, account_id: int | None = None):
+    res = _gmail_get(
+        access_token,
+        f"/users/me/messages/{message_id}",
+        "messages.get",
+        QUOTA_MESSAGES_GET,
+        account_id,
+        params={"format": "full"},
+    )
+    _raise_for_gmail_status(res, f"message {message_id}")
+    return res.json()
+
+
+def fetch_gmail_attachment(
+    access_token: str,
+    message_id: str,
+    attachment_id: str,
+    account_id: int | None = None,
+) -> bytes:
+    """Decoded body of one attachment (users.messages.attachments.get)."""
+    res = _gmail_get(
+        access_token,
+        f"/users/me/messages/{message_id}/attachments/{attachment_id}",
+        "attachments.get",
+        QUOTA_ATTACHMENTS_GET,
+        account_id,
+        timeout=60,
+    )
+    _raise_for_gmail_status(res, f"attachment of message {message_id}")
+    return decode_attachment(res.json())
+
+
+def decode_attachment(body: dict) -> bytes:
+    data = body.get("data", "")
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _in_flight_limiter(account_key, limit: int) -> threading.BoundedSemaphore:
+    """Per-account semaphore so overlapping syncs share one in-flight budget."""
+    with _in_flight_limiters_lock:
+        limiter = _in_flight_limiters.get(account_key)
+        if limiter is None:
+            limiter = threading.BoundedSemaphore(limit)
+            _in_flight_limiters[account_key] = limiter
+        return limiter
+
+
+def fetch_gmail_message_details(
+    access_token: str,
+    message_ids: list[str],
+    account_id: int | None = None,
+    max_in_flight: int = GMAIL_FETCH_CONCURRENCY,
+    mode: str | None = None,
+    errors: dict[str, str] | None = None,
+) -> list[dict]:
+    """Fetch details for many messages.
+
+    Results are returned in the same order as ``message_ids``. In "single"
+    mode each message is one concurrent messages.get call; in "batch" mode
+    the calls are packed into /batch requests of up to GMAIL_BATCH_SIZE.
+
+    Without ``errors`` any failed message raises. With it, a message that
+    fails or comes back empty, on its own or because its whole batch
+    request failed, is recorded there by id and returned as ``{}``.
+    """
+    if not message_ids:
+        return []
+
+    mode = (mode or GMAIL_FETCH_MODE).lower()
+    limiter = _in_flight_limiter(account_id if account_id is not None else access_token, max_in_flight)
+
+    if mode == "batch":
+        chunks = [message_ids[i:i + GMAIL_BATCH_SIZE] for i in range(0, len(message_ids), GMAIL_BATCH_SIZE)]
+
+        def fetch_chunk(chunk: list[str]) -> list[dict]:
+            with limiter:
+                if errors is None:
+                    return fetch_gmail_message_details_batch(access_token, chunk, account_id)
+                # A batch that still fails after retries (5xx, transport)
+                # costs only its own messages, like a failed single get
+                try:
+                    return fetch_gmail_message_details_batch(access_token, chunk, account_id, errors)
+                except (GmailApiError, requests.RequestException) as e:
+                    logger.warning("Batch of %d messages failed: %s", len(chunk), e)
+                    for message_id in chunk:
+                        errors[message_id] = str(e)
+                    return [{} for _ in chunk]
+
+        if len(chunks) == 1:
+            return fetch_chunk(chunks[0])
+        workers = max(1, min(max_in_flight, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gmail-batch") as pool:
+            return [detail for chunk in pool.map(fetch_chunk, chunks) for detail in chunk]
+
+    if mode != "single":
+        raise ValueError(f"Unknown Gmail fetch mode: {mode}")
+
+    def fetch(message_id: str) -> dict:
+        with limiter:
+            return _fetch_detail(access_token, message_id, account_id, errors)
+
+    workers = max(1, min(max_in_flight, len(message_ids)))
+    logger.debug("Fetching %d message details with %d workers", len(message_ids), workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gmail-fetch") as pool:
+        return list(pool.map(fetch, message_ids))
+
+
+def _fetch_detail(access_token: str, message_id: str, account_id: int | None, errors: dict[str, str] | None) -> dict:
+    if errors is None:
+        return fetch_gmail_message_detail(access_token, message_id, account_id)
     try:
-        res = requests.get(
-            f"{GMAIL_API_BASE}/users/me/messages/{message_id}",
-            headers={"Authorization": f"Bearer {access_token}"},
-            params={"format": "full"},
-            timeout=10,
-        )
-        print(f"[GMAIL_UTIL] HTTP status for message {message_id}: {res.status_code}")
-        res.raise_for_status()
-        data = res.json()
-        return data
-    except requests.HTTPError as e:
-        print(f"[GMAIL_UTIL] HTTP error fetching message {message_id}: {e}")
+        detail = fetch_gmail_message_detail(access_token, message_id, account_id)
+    except (GmailApiError, requests.RequestException) as e:
+        errors[message_id] = str(e)
         return {}
-    except Exception as e:
-        print(f"[GMAIL_UTIL] Unexpected error fetching message {message_id}: {e}")
+    if not detail.get("id"):
+        errors[message_id] = "Empty message response"
         return {}
+    return detail
+
+
+# ---------- Gmail batch API ----------
+def build_batch_body(message_ids: list[str], boundary: str) -> bytes:
+    """Pack messages.get calls into a multipart/mixed batch request body."""
+    api_path = urllib.parse.urlsplit(GMAIL_API_BASE).path.rstrip("/")
+    parts = []
+    for index, message_id in enumerate(message_ids):
+        parts.append(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <item{index}>\r\n"
+            "\r\n"
+            f"GET {api_path}/users/me/messages/{urllib.parse.quote(message_id)}?format=full\r\n"
+            "\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n")
+    return "".join(parts).encode("utf-8")
+
+
+def parse_batch_response(content_type: str, body: bytes) -> dict[str, dict]:
+    """Parse a multipart/mixed batch response into ``{content_id: json_body}``.
+
+    Parts whose inner response is not a 2xx are mapped to ``{}``.
+    """
+    envelope = f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body
+    message = BytesParser(policy=policy.HTTP).parsebytes(envelope)
+    if not message.is_multipart():
+        raise RuntimeError("Batch response is not multipart")
+
+    results = {}
+    for part in message.iter_parts():
+        content_id = (part.get("Content-ID") or "").strip().strip("<>")
+        # Responses echo the request ID as "response-<id>"
+        if content_id.startswith("response-"):
+            content_id = content_id[len("response-"):]
+
+        raw = part.get_payload(decode=True) or b""
+        status_line, _, rest = raw.partition(b"\n")
+        status_fields = status_line.split()
+        status = int(status_fields[1]) if len(status_fields) > 1 and status_fields[1].isdigit() else 0
+        inner_body = re.split(rb"\r?\n\r?\n", rest, maxsplit=1)
+        payload = inner_body[1].strip() if len(inner_body) > 1 else b""
+
+        if 200 <= status < 300 and payload:
+            results[content_id] = json.loads(payload)
+        else:
+            logger.warning("Batch item %s failed with status %s", content_id, status)
+            results[content_id] = {}
+    return results
+
+
+def fetch_gmail_message_details_batch(
+    access_token: str,
+    message_ids: list[str],
+    account_id: int | None = None,
+    errors: dict[str, str] | None = None,
+) -> list[dict]:
+    """Fetch up to GMAIL_BATCH_MAX_SIZE message details in one /batch request.
+
+    Items that fail inside the batch (e.g. rate limited) are refetched one
+    by one, so every returned dict is a real message, or the failure is
+    raised (recorded in ``errors`` when given, as fetch_gmail_message_details).
+    """
+    if len(message_ids) > GMAIL_BATCH_MAX_SIZE:
+        raise ValueError(f"Gmail batch requests are limited to {GMAIL_BATCH_MAX_SIZE} calls")
+
+    boundary = f"batch_{uuid.uuid4().hex}"
+    logger.debug("Fetching %d message details in one batch request", len(message_ids))
+    res = http_client.request(
+        "POST",
+        GMAIL_BATCH_URL,
+        endpoint="batch",
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": f"multipart/mixed; boundary={boundary}",
+        },
+        data=build_batch_body(message_ids, boundary),
+        timeout=30,
+        quota_key=account_id if account_id is not None else access_token,
+        quota_units=QUOTA_MESSAGES_GET * len(message_ids),
+        # Only reads inside, so the POST is safe to repeat
+        idempotent=True,
+    )
+    _raise_for_gmail_status(res, "message batch")
+    items = parse_batch_response(res.headers.get("Content-Type", ""), res.content)
 
+    details = []
+    for index, message_id in enumerate(message_ids):
+        detail = items.get(f"item{index}")
+        if not detail:
+            detail = _fetch_detail(access_token, message_id, account_id, errors)
+        details.append(detail)
+    return details
@@ -0,0 +1,270 @@
+"""Shared outbound HTTP client for Google APIs.
+
+One keep-alive ``requests.Session`` with a sized connection pool is reused
+by every call; ``arequest`` is the async equivalent on a shared
+``httpx.AsyncClient``, for code running on the event loop. Requests are
+retried on 429/5xx and connection errors with exponential backoff and full
+jitter. Non-idempotent calls (POST unless the caller says otherwise, e.g.
+the single-use OAuth code exchange) are only retried when the server
+cannot have processed them: a failed connect or a 429. A ``Retry-After`` from the server is slept in full, or ends the
+retries when it is longer than HTTP_RETRY_AFTER_MAX. Gmail calls also draw from a per-account
+token bucket sized to the per-user quota, so concurrent syncs stay under the
+limit instead of being throttled.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from utils.metrics import GMAIL_API_RETRIES, GMAIL_API_SECONDS, record_stage
+
+logger = logging.getLogger("http_client")
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "64"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "32"))
+# Longer Retry-After waits fail the call instead of holding a worker
+HTTP_RETRY_AFTER_MAX = float(os.getenv("HTTP_RETRY_AFTER_MAX", "120"))
+
+# Gmail allows 250 quota units per user per second
+GMAIL_QUOTA_UNITS_PER_SECOND = float(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", "250"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Gmail also reports throttling as 403 with one of these reasons
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+
+# ---------- Quota ----------
+class TokenBucket:
+    """Blocking token bucket: ``rate`` units refill per second up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, units: float) -> float:
+        """Take ``units`` now, possibly into debt; returns seconds to wait before using them.
+
+        Callers queue in reservation order, and the wait can be slept
+        either blocking or on the event loop. Calls worth more than
+        ``capacity`` (large /batch requests) are charged in full; the debt
+        delays whoever comes next.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= units
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, units: float) -> None:
+        wait = self.reserve(units)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, units: float) -> None:
+        wait = self.reserve(units)
+        if wait:
+            await asyncio.sleep(wait)
+
+
+_buckets: dict = {}
+_buckets_lock = threading.Lock()
+
+
+def quota_bucket(key) -> TokenBucket:
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(GMAIL_QUOTA_UNITS_PER_SECOND, GMAIL_QUOTA_UNITS_PER_SECOND)
+            _buckets[key] = bucket
+        return bucket
+
+
+# ---------- Retries ----------
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def _retry_after(res: requests.Response | httpx.Response) -> float | None:
+    value = res.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_delay(res: requests.Response | httpx.Response, attempt: int) -> float | None:
+    """Seconds to wait before retrying ``res``, or None if the server asked for too long a wait."""
+    delay = _retry_after(res)
+    if delay is None:
+        return _backoff(attempt)
+    return delay if delay <= HTTP_RETRY_AFTER_MAX else None
+
+
+def _never_sent(error: Exception) -> bool:
+    """True if the request failed before reaching the server, so even a POST can be retried."""
+    if isinstance(error, (requests.ConnectTimeout, httpx.ConnectError, httpx.ConnectTimeout)):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    return False
+
+
+def _should_retry(res: requests.Response | httpx.Response, idempotent: bool = True) -> bool:
+    if res.status_code == 429 or (idempotent and res.status_code in RETRY_STATUSES):
+        return True
+    if res.status_code == 403:
+        try:
+            errors = res.json().get("error", {}).get("errors", [])
+        except ValueError:
+            return False
+        return any(e.get("reason") in RATE_LIMIT_REASONS for e in errors)
+    return False
+
+
+def _observe(endpoint: str, status: str, started: float) -> None:
+    elapsed = time.perf_counter() - started
+    GMAIL_API_SECONDS.observe(elapsed, endpoint=endpoint, status=status)
+    record_stage("gmail_api", elapsed)
+
+
+def request(
+    method: str,
+    url: str,
+    *,
+    quota_key=None,
+    quota_units: float = 0,
+    max_retries: int = HTTP_MAX_RETRIES,
+    endpoint: str = "other",
+    idempotent: bool | None = None,
+    **kwargs,
+) -> requests.Response:
+    """Send a request through the shared session, retrying transient failures.
+
+    Returns the final response, which may still be an error status once
+    retries are exhausted. ``quota_units`` are taken from the bucket for
+    ``quota_key`` before every attempt. Each attempt is timed into
+    gmail_api_request_seconds under ``endpoint``. ``idempotent`` defaults
+    to whether ``method`` is; pass True for POSTs that are safe to repeat.
+    """
+    kwargs.setdefault("timeout", 10)
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    for attempt in range(max_retries + 1):
+        if quota_key is not None and quota_units:
+            quota_bucket(quota_key).acquire(quota_units)
+
+        started = time.perf_counter()
+        try:
+            res = _session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _observe(endpoint, "error", started)
+            if attempt == max_retries or not (idempotent or _never_sent(e)):
+                raise
+            delay = _backoff(attempt)
+            GMAIL_API_RETRIES.inc(endpoint=endpoint, reason="connection")
+            logger.warning("%s %s failed (%s), retrying in %.2fs", method, url, e, delay)
+            time.sleep(delay)
+            continue
+        _observe(endpoint, str(res.status_code), started)
+
+        if attempt == max_retries or not _should_retry(res, idempotent):
+            return res
+
+        delay = _retry_delay(res, attempt)
+        if delay is None:
+            logger.warning("%s %s returned %s with a Retry-After over %.0fs, giving up",
+                           method, url, res.status_code, HTTP_RETRY_AFTER_MAX)
+            return res
+        GMAIL_API_RETRIES.inc(endpoint=endpoint, reason=str(res.status_code))
+        logger.warning("%s %s returned %s, retrying in %.2fs", method, url, res.status_code, delay)
+        time.sleep(delay)
+    return res
+
+
+# ---------- Async ----------
+_async_client: httpx.AsyncClient | None = None
+_async_client_loop = None
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    # Pooled connections belong to one event loop, so a new loop gets a new client
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def arequest(
+    method: str,
+    url: str,
+    *,
+    quota_key=None,
+    quota_units: float = 0,
+    max_retries: int = HTTP_MAX_RETRIES,
+    endpoint: str = "other",
+    idempotent: bool | None = None,
+    **kwargs,
+) -> httpx.Response:
+    """Async version of ``request`` with the same retry, quota and metrics behaviour."""
+    kwargs.setdefault("timeout", 10)
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    for attempt in range(max_retries + 1):
+        if quota_key is not None and quota_units:
+            await quota_bucket(quota_key).acquire_async(quota_units)
+
+        started = time.perf_counter()
+        try:
+            res = await _get_async_client().request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            _observe(endpoint, "error", started)
+            if attempt == max_retries or not (idempotent or _never_sent(e)):
+                raise
+            delay = _backoff(attempt)
+            GMAIL_API_RETRIES.inc(endpoint=endpoint, reason="connection")
+            logger.warning("%s %s failed (%s), retrying in %.2fs", method, url, e, delay)
+            await asyncio.sleep(delay)
+            continue
+        _observe(endpoint, str(res.status_code), started)
+
+        if attempt == max_retries or not _should_retry(res, idempotent):
+            return res
+
+        delay = _retry_delay(res, attempt)
+        if delay is None:
+            logger.warning("%s %s returned %s with a Retry-After over %.0fs, giving up",
+                           method, url, res.status_code, HTTP_RETRY_AFTER_MAX)
+            return res
+        GMAIL_API_RETRIES.inc(endpoint=endpoint, reason=str(res.status_code))
+        logger.warning("%s %s returned %s, retrying in %.2fs", method, url, res.status_code, delay)
+        await asyncio.sleep(delay)
+    return res
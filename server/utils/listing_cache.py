@@ -0,0 +1,41 @@
+"""ETags and a rendered-page cache for message listings.
+
+A listing's ETag is derived from the ids and ``version`` counters of the
+accounts it covers plus the request parameters, so it changes exactly when
+sync commits new or deleted messages. Rendered pages are cached under the
+same key.
+"""
+import hashlib
+import os
+
+from utils.cache import TTLCache
+from utils.metrics import register_cache
+
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", "2048"))
+LISTING_CACHE_TTL = float(os.getenv("LISTING_CACHE_TTL", "300"))
+
+listing_cache = TTLCache(maxsize=LISTING_CACHE_SIZE, ttl=LISTING_CACHE_TTL)
+register_cache("listing", listing_cache)
+
+
+def listing_etag(kind: str, accounts: list, **params) -> str:
+    state = ",".join(f"{a.id}:{a.version or 0}" for a in accounts)
+    query = "&".join(f"{k}={params[k]}" for k in sorted(params))
+    digest = hashlib.sha1(f"{kind}|{state}|{query}".encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in candidates
+
+
+def cache_key(etag: str, account_ids: list[int]) -> tuple:
+    return (etag, tuple(account_ids))
+
+
+def invalidate_account(gmail_account_id: int) -> None:
+    """Evict cached pages that include the given account."""
+    listing_cache.invalidate_where(lambda key: gmail_account_id in key[1])
@@ -0,0 +1,116 @@
+"""Parsed message content: rendering, the per-message cache and backfill.
+
+Subject, addresses, bodies and attachment metadata are parsed once at
+ingest into dedicated GmailMessage columns. Opening a message reads those
+columns only, and the rendered JSON is kept in an LRU cache keyed by
+``(gmail_account_id, gmail_message_id)``; stored content never changes, so
+entries are only dropped when sync deletes the message.
+
+Rows stored before parsing existed are parsed on first read and written
+back, or all at once with ``python -m utils.message_content``.
+"""
+import os
+
+from sqlalchemy.orm import Session
+
+from db import GmailMessage
+from utils.cache import TTLCache
+from utils.metrics import register_cache
+from utils.mime_utils import parse_message
+from utils.payload_archive import load_payload, payload_query, row_payload
+
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "512"))
+MESSAGE_CACHE_TTL = float(os.getenv("MESSAGE_CACHE_TTL", "600"))
+
+message_cache = TTLCache(maxsize=MESSAGE_CACHE_SIZE, ttl=MESSAGE_CACHE_TTL)
+register_cache("message", message_cache)
+
+# Everything the content endpoint needs, without the raw payload
+CONTENT_COLUMNS = (
+    GmailMessage.id,
+    GmailMessage.gmail_account_id,
+    GmailMessage.gmail_message_id,
+    GmailMessage.thread_id,
+    GmailMessage.internal_date,
+    GmailMessage.snippet,
+    GmailMessage.subject,
+    GmailMessage.sender,
+    GmailMessage.recipients,
+    GmailMessage.body_text,
+    GmailMessage.body_html,
+    GmailMessage.attachments,
+)
+PARSED_FIELDS = ("subject", "sender", "recipients", "body_text", "body_html", "attachments")
+
+
+def render_content(
+    row,
+    account_email: str,
+    parsed: dict | None = None,
+    attachment_ids: dict[str, int] | None = None,
+) -> dict:
+    """JSON body of GET /gmail/messages/{id}; ``parsed`` overrides the row's columns.
+
+    ``attachment_ids`` maps part ids to GmailAttachment ids for download links.
+    """
+    content = parsed or {field: getattr(row, field) for field in PARSED_FIELDS}
+    attachment_ids = attachment_ids or {}
+    return {
+        "id": row.gmail_message_id,
+        "thread_id": row.thread_id,
+        "account": account_email,
+        "date": row.internal_date,
+        "subject": content["subject"],
+        "from": content["sender"],
+        "to": content["recipients"],
+        "snippet": row.snippet,
+        "body_text": content["body_text"],
+        "body_html": content["body_html"],
+        "attachments": [
+            {**info, "id": attachment_ids.get(info.get("part_id"))} for info in content["attachments"] or []
+        ],
+    }
+
+
+def parse_stored_message(db: Session, message_id: int) -> dict:
+    """Parse a row stored before ingest-time parsing and write the result back."""
+    parsed = parse_message(load_payload(db, message_id) or {})
+    db.query(GmailMessage).filter(GmailMessage.id == message_id).update(parsed, synchronize_session=False)
+    db.commit()
+    return parsed
+
+
+def invalidate_message_content(gmail_account_id: int, gmail_message_ids: list[str]) -> None:
+    for gmail_message_id in gmail_message_ids:
+        message_cache.invalidate((gmail_account_id, gmail_message_id))
+
+
+def backfill_parsed_content(db: Session, gmail_account_id: int, batch_size: int = 200) -> int:
+    """Parse every unparsed message of an account into its content columns.
+
+    ``body_text`` is never NULL once parsed, so it marks unparsed rows.
+    """
+    count = 0
+    while True:
+        rows = payload_query(db, GmailMessage.id).filter(
+            GmailMessage.gmail_account_id == gmail_account_id,
+            GmailMessage.body_text.is_(None),
+        ).order_by(GmailMessage.id).limit(batch_size).all()
+        if not rows:
+            return count
+        for row in rows:
+            parsed = parse_message(row_payload(row) or {})
+            db.query(GmailMessage).filter(GmailMessage.id == row.id).update(parsed, synchronize_session=False)
+        db.commit()
+        count += len(rows)
+
+
+if __name__ == "__main__":
+    from db import SessionLocal, GmailAccount
+
+    session = SessionLocal()
+    try:
+        for (account_id,) in session.query(GmailAccount.id).all():
+            print(f"[CONTENT] Parsed {backfill_parsed_content(session, account_id)} messages of account {account_id}")
+    finally:
+        session.close()
@@ -0,0 +1,229 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+A deliberately small registry of labelled counters and histograms, enough
+for ``GET /metrics`` to be scraped by Prometheus without pulling in a client
+library. Values are per process: with several uvicorn workers or scheduler
+shards each one must be scraped on its own.
+
+Also holds the per-request stage timer behind the opt-in profiling hook:
+while a request is being profiled, Gmail API and DB time spent on its
+behalf is accumulated and reported back in a ``Server-Timing`` header.
+"""
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers fast cached queries through slow Gmail batch calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# ---------- Metric types ----------
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[n] for n in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> [bucket counts..., sum, count]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(tuple(labels[n] for n in self.labelnames))
+        return state[-1] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, state):
+                cumulative += hits
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}"
+
+
+class CacheMetric:
+    """One statistic of every registered in-process cache, read at scrape time."""
+
+    def __init__(self, name: str, documentation: str, type: str, field: str):
+        self.name = name
+        self.documentation = documentation
+        self.type = type
+        self._field = field
+
+    def samples(self):
+        with _caches_lock:
+            caches = sorted(_caches.items())
+        suffix = "_total" if self.type == "counter" else ""
+        for cache_name, cache in caches:
+            value = cache.stats()[self._field]
+            yield f"{self.name}{suffix}{_format_labels(('cache',), (cache_name,))} {_format_value(value)}"
+
+
+_caches: dict = {}
+_caches_lock = threading.Lock()
+
+
+def register_cache(name: str, cache) -> None:
+    """Export the hit, miss and size counters of a utils.cache.TTLCache."""
+    with _caches_lock:
+        _caches[name] = cache
+
+
+# ---------- Registry ----------
+_registry: dict[str, Counter | Histogram | CacheMetric] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return _register(Counter(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ---------- Application metrics ----------
+GMAIL_API_SECONDS = histogram(
+    "gmail_api_request_seconds", "Latency of Google API calls, per attempt", ("endpoint", "status")
+)
+GMAIL_API_RETRIES = counter("gmail_api_retries", "Google API attempts that were retried", ("endpoint", "reason"))
+DB_QUERY_SECONDS = histogram("db_query_seconds", "Time spent executing SQL statements", ("operation",))
+DB_COMMIT_SECONDS = histogram("db_commit_seconds", "Time spent committing ORM sessions")
+SYNC_STAGE_SECONDS = histogram("sync_stage_seconds", "Time spent per sync stage, per page", ("stage",))
+MESSAGES_STORED = counter("gmail_messages_stored", "Messages stored by sync")
+PAYLOADS_ARCHIVED = counter("gmail_payloads_archived", "Message payloads moved to the compressed archive")
+PAYLOAD_ARCHIVE_BYTES = counter(
+    "gmail_payload_archive_bytes", "Archived payload bytes, before (raw) and after (stored) compression", ("kind",)
+)
+TOKEN_REFRESHES = counter("gmail_token_refreshes", "OAuth access-token refreshes", ("result",))
+AUTH_FAILURES = counter("auth_failures", "Rejected API authentications", ("reason",))
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_seconds", "API request latency", ("method", "route", "status")
+)
+CACHE_HITS = _register(CacheMetric("cache_hits", "In-process cache hits", "counter", "hits"))
+CACHE_MISSES = _register(CacheMetric("cache_misses", "In-process cache misses", "counter", "misses"))
+CACHE_ENTRIES = _register(CacheMetric("cache_entries", "Entries held by in-process caches", "gauge", "size"))
+
+
+# ---------- Per-request profiling ----------
+_request_stages: contextvars.ContextVar = contextvars.ContextVar("request_stages", default=None)
+
+
+def start_request_profile() -> contextvars.Token:
+    """Start accumulating stage timings for the current request context."""
+    return _request_stages.set({})
+
+
+def finish_request_profile(token: contextvars.Token) -> dict:
+    stages = _request_stages.get() or {}
+    _request_stages.reset(token)
+    return stages
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add time to a stage of the profiled request, if there is one."""
+    stages = _request_stages.get()
+    if stages is not None:
+        total, calls = stages.get(stage, (0.0, 0))
+        stages[stage] = (total + seconds, calls + 1)
+
+
+def server_timing(stages: dict, total: float) -> str:
+    parts = [f'{name};dur={seconds * 1000:.2f};desc="{calls} calls"' for name, (seconds, calls) in sorted(stages.items())]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
@@ -0,0 +1,205 @@
+"""Helpers for walking Gmail ``format=full`` message payloads."""
+import base64
+import html
+import re
+from html.parser import HTMLParser
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_BLOCK_RE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def get_header(message: dict, name: str) -> str | None:
+    """Return the first header called ``name`` (case-insensitive), if any."""
+    name = name.lower()
+    for header in message.get("payload", {}).get("headers", []):
+        if header.get("name", "").lower() == name:
+            return header.get("value")
+    return None
+
+
+def decode_body_data(data: str | None) -> str:
+    """Decode a base64url part body as sent by the Gmail API."""
+    if not data:
+        return ""
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    return raw.decode("utf-8", errors="replace")
+
+
+def iter_parts(part: dict):
+    """Yield ``part`` and all of its nested MIME parts, depth first."""
+    yield part
+    for child in part.get("parts", []) or []:
+        yield from iter_parts(child)
+
+
+def html_to_text(markup: str) -> str:
+    text = _TAG_RE.sub(" ", _BLOCK_RE.sub(" ", markup))
+    return _SPACE_RE.sub(" ", html.unescape(text)).strip()
+
+
+def _body_parts(message: dict) -> tuple[list[str], list[str], list[dict]]:
+    """Decoded text/plain and text/html bodies, plus attachment parts."""
+    plain, markup, attachments = [], [], []
+    for part in iter_parts(message.get("payload", {})):
+        body = part.get("body", {})
+        if part.get("filename"):
+            attachments.append(part)
+            continue
+        mime_type = part.get("mimeType", "")
+        if mime_type == "text/plain":
+            plain.append(decode_body_data(body.get("data")))
+        elif mime_type == "text/html":
+            markup.append(decode_body_data(body.get("data")))
+    return plain, markup, attachments
+
+
+def extract_text_body(message: dict) -> str:
+    """Plain-text body of a message, falling back to its HTML part stripped of tags."""
+    plain, markup, _ = _body_parts(message)
+    if plain:
+        return "\n".join(plain).strip()
+    return "\n".join(html_to_text(m) for m in markup).strip()
+
+
+# ---------- HTML sanitizing ----------
+ALLOWED_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "caption", "center", "code", "col", "colgroup", "dd", "del",
+    "div", "dl", "dt", "em", "font", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "ins", "li",
+    "ol", "p", "pre", "q", "s", "small", "span", "strike", "strong", "sub", "sup", "table", "tbody",
+    "td", "tfoot", "th", "thead", "tr", "u", "ul",
+}
+ALLOWED_ATTRS = {
+    "a": {"href", "title"},
+    "img": {"src", "alt", "title", "width", "height"},
+    "font": {"color", "face", "size"},
+    "td": {"colspan", "rowspan", "align", "valign", "width"},
+    "th": {"colspan", "rowspan", "align", "valign", "width"},
+    "table": {"border", "cellpadding", "cellspacing", "width", "align"},
+    "col": {"span", "width"},
+    "colgroup": {"span", "width"},
+    "*": {"dir", "lang"},
+}
+URL_ATTRS = {"href", "src"}
+ALLOWED_SCHEMES = {"http", "https", "mailto", "cid"}
+# Elements dropped together with everything inside them
+DROPPED_TAGS = {"script", "style", "head", "title", "iframe", "object", "embed", "noscript", "template", "svg", "math"}
+VOID_TAGS = {"br", "col", "hr", "img"}
+
+
+_CONTROL_RE = re.compile(r"[\x00-\x20]")
+
+
+def _safe_url(value: str) -> bool:
+    # Browsers ignore whitespace and control characters inside a scheme
+    cleaned = _CONTROL_RE.sub("", value).lower()
+    scheme, sep, _ = cleaned.partition(":")
+    if not sep or any(c in scheme for c in "/?#"):
+        return True
+    return scheme in ALLOWED_SCHEMES
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: list[str] = []
+        self._dropped = 0
+        self._open: list[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            if tag not in VOID_TAGS:
+                self._dropped += 1
+            return
+        if self._dropped or tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRS.get(tag, set()) | ALLOWED_ATTRS["*"]
+        rendered = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRS and not _safe_url(value):
+                continue
+            rendered.append(f' {name}="{html.escape(value, quote=True)}"')
+        if tag == "a":
+            rendered.append(' rel="noopener noreferrer" target="_blank"')
+        self.out.append(f"<{tag}{''.join(rendered)}>")
+        if tag not in VOID_TAGS:
+            self._open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # A self-closed dropped tag has no content and no end tag to balance it
+        if tag in DROPPED_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self._open and self._open[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self._dropped = max(0, self._dropped - 1)
+            return
+        if self._dropped or tag not in self._open:
+            return
+        # Close anything left open inside this element so the output nests
+        while self._open:
+            current = self._open.pop()
+            self.out.append(f"</{current}>")
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if not self._dropped:
+            self.out.append(html.escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        self.out.extend(f"</{tag}>" for tag in reversed(self._open))
+        self._open.clear()
+
+
+def sanitize_html(markup: str) -> str:
+    """Allowlist-based cleanup of message HTML for rendering in the client.
+
+    Keeps formatting tags and safe link/image URLs; drops scripts, styles,
+    frames, event handlers and any other attribute not explicitly allowed.
+    """
+    if not markup:
+        return ""
+    sanitizer = _Sanitizer()
+    sanitizer.feed(markup)
+    sanitizer.close()
+    return "".join(sanitizer.out).strip()
+
+
+# ---------- Parsed content ----------
+def attachment_info(part: dict) -> dict:
+    body = part.get("body", {})
+    return {
+        "part_id": part.get("partId"),
+        "filename": part.get("filename"),
+        "mime_type": part.get("mimeType"),
+        "size": body.get("size", 0),
+        "attachment_id": body.get("attachmentId"),
+    }
+
+
+def parse_message(message: dict) -> dict:
+    """Headers, bodies and attachment metadata of a message, in one walk.
+
+    The result maps onto the parsed-content columns of GmailMessage.
+    """
+    plain, markup, attachments = _body_parts(message)
+    recipients = ", ".join(v for v in (get_header(message, "To"), get_header(message, "Cc")) if v)
+    if plain:
+        body_text = "\n".join(plain).strip()
+    else:
+        body_text = "\n".join(html_to_text(m) for m in markup).strip()
+    return {
+        "subject": get_header(message, "Subject"),
+        "sender": get_header(message, "From"),
+        "recipients": recipients or None,
+        "body_text": body_text,
+        "body_html": sanitize_html("\n".join(markup)) or None,
+        "attachments": [attachment_info(part) for part in attachments],
+    }
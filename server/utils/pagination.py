@@ -0,0 +1,57 @@
+"""Opaque keyset cursors for paginated listings."""
+import base64
+import heapq
+import json
+import math
+from datetime import datetime
+from itertools import islice
+
+from fastapi import HTTPException
+
+
+def encode_cursor(*values) -> str:
+    """Pack sort-key values (datetimes, numbers, strings) into an opaque token."""
+    packed = [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(packed, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _matches(value, kind: type) -> bool:
+    if isinstance(value, bool):
+        return False
+    if kind is datetime:
+        # Rows without a date encode it as null
+        return value is None or isinstance(value, datetime)
+    if kind is float:
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    return isinstance(value, kind)
+
+
+def decode_cursor(cursor: str, *types: type) -> list:
+    """Unpack a token produced by encode_cursor, raising 400 if it is malformed.
+
+    ``types`` gives the expected type of each value, in order.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = [
+            datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v
+            for v in json.loads(raw)
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(400, "Invalid cursor")
+    if len(values) != len(types) or not all(_matches(v, t) for v, t in zip(values, types)):
+        raise HTTPException(400, "Invalid cursor")
+    return values
+
+
+def merge_newest_first(streams: list, limit: int, date_field: str = "internal_date") -> list:
+    """K-way merge of row streams each sorted by (date_field, id) descending."""
+    if len(streams) == 1:
+        return list(islice(streams[0], limit))
+    merged = heapq.merge(
+        *streams,
+        key=lambda row: (getattr(row, date_field) or datetime.min, row.id),
+        reverse=True,
+    )
+    return list(islice(merged, limit))
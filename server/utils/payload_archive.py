@@ -0,0 +1,205 @@
+"""Hot/cold tiering of raw message payloads.
+
+Reads are served from the parsed columns, so the ``format=full`` JSON in
+GmailMessage.payload is only needed by exports and index rebuilds. After
+PAYLOAD_ARCHIVE_AFTER_DAYS it is moved into gmail_payload_archive as a
+compressed blob (zstd when the zstandard package is installed, gzip
+otherwise) and the hot column is set to NULL. This keeps gmail_messages
+rows, and every scan over them, small. Code that needs a payload reads
+it through ``payload_query``/``row_payload`` or ``load_payload``, which
+rehydrate archived rows transparently.
+
+Compaction runs as a worker.py process every PAYLOAD_ARCHIVE_INTERVAL_SECONDS,
+or once with ``python -m utils.payload_archive``. The freed space is
+reused by new rows; VACUUM (SQLite) or VACUUM FULL (Postgres) hands it
+back to the filesystem.
+"""
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from db import GmailMessage, GmailPayloadArchive
+from utils.metrics import PAYLOAD_ARCHIVE_BYTES, PAYLOADS_ARCHIVED
+
+try:
+    import zstandard
+except ImportError:  # optional; archives fall back to gzip
+    zstandard = None
+
+logger = logging.getLogger("payload_archive")
+
+PAYLOAD_ARCHIVE_AFTER_DAYS = int(os.getenv("PAYLOAD_ARCHIVE_AFTER_DAYS", "90"))
+PAYLOAD_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("PAYLOAD_ARCHIVE_INTERVAL_SECONDS", "3600"))
+PAYLOAD_ARCHIVE_BATCH_SIZE = int(os.getenv("PAYLOAD_ARCHIVE_BATCH_SIZE", "500"))
+PAYLOAD_ARCHIVE_CODEC = os.getenv("PAYLOAD_ARCHIVE_CODEC") or ("zstd" if zstandard else "gzip")
+
+ZSTD_LEVEL = 9
+GZIP_LEVEL = 6
+
+
+# ---------- Codecs ----------
+def _compressor(codec: str):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("PAYLOAD_ARCHIVE_CODEC is zstd but the zstandard package is not installed")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress
+    if codec == "gzip":
+        return lambda data: gzip.compress(data, GZIP_LEVEL, mtime=0)
+    raise RuntimeError(f"Unknown payload archive codec {codec!r}")
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Payload was archived with zstd but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    raise RuntimeError(f"Unknown payload archive codec {codec!r}")
+
+
+# ---------- Reads ----------
+def payload_query(db: Session, *columns):
+    """Query ``columns`` of GmailMessage together with its payload, hot or archived.
+
+    Read the payload of each result row with ``row_payload``.
+    """
+    return db.query(
+        *columns,
+        GmailMessage.payload,
+        GmailPayloadArchive.codec.label("archive_codec"),
+        GmailPayloadArchive.data.label("archive_data"),
+    ).outerjoin(GmailPayloadArchive, GmailPayloadArchive.message_id == GmailMessage.id)
+
+
+def row_payload(row) -> dict | None:
+    if row.payload is not None:
+        return row.payload
+    if row.archive_data is None:
+        return None
+    return orjson.loads(decompress(row.archive_codec, row.archive_data))
+
+
+def load_payload(db: Session, message_id: int) -> dict | None:
+    row = payload_query(db).filter(GmailMessage.id == message_id).first()
+    return row_payload(row) if row else None
+
+
+# ---------- Compaction ----------
+def archive_payloads(
+    db: Session,
+    older_than: datetime,
+    batch_size: int = PAYLOAD_ARCHIVE_BATCH_SIZE,
+    codec: str = PAYLOAD_ARCHIVE_CODEC,
+) -> dict:
+    """Move payloads of messages received before ``older_than`` to the archive.
+
+    Commits every ``batch_size`` messages. Returns how many were moved
+    and their size before (``raw_bytes``) and after (``stored_bytes``)
+    compression.
+    """
+    compress = _compressor(codec)
+    stats = {"messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+    last_id = 0
+    while True:
+        rows = db.query(GmailMessage.id, GmailMessage.payload).filter(
+            GmailMessage.id > last_id,
+            GmailMessage.internal_date < older_than,
+            GmailMessage.payload.isnot(None),
+        ).order_by(GmailMessage.id).limit(batch_size).all()
+        if not rows:
+            return stats
+        last_id = rows[-1].id
+
+        now = datetime.utcnow()
+        archived = []
+        for row in rows:
+            raw = orjson.dumps(row.payload)
+            archived.append({
+                "message_id": row.id, "codec": codec, "data": compress(raw),
+                "raw_size": len(raw), "archived_at": now,
+            })
+        db.execute(GmailPayloadArchive.__table__.insert(), archived)
+        db.execute(update(GmailMessage), [
+            {"id": row.id, "payload": None, "payload_archived_at": now} for row in rows
+        ])
+        db.commit()
+
+        raw_bytes = sum(a["raw_size"] for a in archived)
+        stored_bytes = sum(len(a["data"]) for a in archived)
+        stats["messages"] += len(rows)
+        stats["raw_bytes"] += raw_bytes
+        stats["stored_bytes"] += stored_bytes
+        PAYLOADS_ARCHIVED.inc(len(rows))
+        PAYLOAD_ARCHIVE_BYTES.inc(raw_bytes, kind="raw")
+        PAYLOAD_ARCHIVE_BYTES.inc(stored_bytes, kind="stored")
+
+
+def drop_archived_payloads(db: Session, message_ids: list[int]) -> None:
+    """Remove archived payloads of deleted messages. Postgres also does this via ON DELETE CASCADE."""
+    if message_ids:
+        db.query(GmailPayloadArchive).filter(
+            GmailPayloadArchive.message_id.in_(message_ids),
+        ).delete(synchronize_session=False)
+
+
+def archive_stats(db: Session) -> dict:
+    """Hot and archived message counts and the archive's raw and stored size."""
+    hot = db.query(func.count(GmailMessage.id)).filter(GmailMessage.payload.isnot(None)).scalar()
+    archived, raw_bytes, stored_bytes = db.query(
+        func.count(GmailPayloadArchive.message_id),
+        func.coalesce(func.sum(GmailPayloadArchive.raw_size), 0),
+        func.coalesce(func.sum(func.length(GmailPayloadArchive.data)), 0),
+    ).one()
+    return {"hot": hot, "archived": archived, "raw_bytes": int(raw_bytes), "stored_bytes": int(stored_bytes)}
+
+
+def _format_run(stats: dict) -> str:
+    ratio = stats["raw_bytes"] / stats["stored_bytes"] if stats["stored_bytes"] else 0.0
+    return (
+        f"{stats['messages']} payloads, {stats['raw_bytes'] / 2**20:.1f} MiB -> "
+        f"{stats['stored_bytes'] / 2**20:.1f} MiB ({ratio:.1f}x)"
+    )
+
+
+def compact_once(after_days: int = PAYLOAD_ARCHIVE_AFTER_DAYS) -> dict:
+    from db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return archive_payloads(db, datetime.utcnow() - timedelta(days=after_days))
+    finally:
+        db.close()
+
+
+def run_compaction(interval: int = PAYLOAD_ARCHIVE_INTERVAL_SECONDS) -> None:
+    logger.info("Payload compaction started, interval %ds, after %d days", interval, PAYLOAD_ARCHIVE_AFTER_DAYS)
+    while True:
+        try:
+            stats = compact_once()
+            if stats["messages"]:
+                logger.info("Archived %s", _format_run(stats))
+        except Exception:
+            logger.exception("Payload compaction failed")
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    from db import SessionLocal
+
+    print(f"[ARCHIVE] Archived {_format_run(compact_once())} using {PAYLOAD_ARCHIVE_CODEC}")
+    session = SessionLocal()
+    try:
+        totals = archive_stats(session)
+    finally:
+        session.close()
+    print(
+        f"[ARCHIVE] {totals['hot']} hot payloads, {totals['archived']} archived "
+        f"({totals['raw_bytes'] / 2**20:.1f} MiB raw, {totals['stored_bytes'] / 2**20:.1f} MiB stored)"
+    )
@@ -0,0 +1,12 @@
+"""Response classes shared by the API routes."""
+import orjson
+from fastapi import Response
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson, which natively handles datetimes."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,97 @@
+"""Periodic sync scheduler for the whole fleet of connected Gmail accounts.
+
+Accounts are spread over ``shard_count`` worker processes with a consistent
+hash ring, so adding or removing a worker only moves ~1/N of the accounts.
+Each shard enqueues its accounts least-recently-synced first and stops
+enqueueing once its local backlog reaches ``max_pending`` (backpressure).
+Because every account has at most one active job, a huge mailbox occupies
+a single pool worker while the others keep serving the rest of the shard.
+"""
+import bisect
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+
+from db import SessionLocal, GmailAccount, GmailToken, SyncJob
+from utils.sync_jobs import SYNC_WORKERS, enqueue_sync, pending_jobs, recover_jobs
+
+logger = logging.getLogger("scheduler")
+
+SCHEDULER_INTERVAL_SECONDS = int(os.getenv("SCHEDULER_INTERVAL_SECONDS", "300"))
+# Minimum time between two syncs of the same account
+SCHEDULER_MIN_SYNC_AGE_SECONDS = int(os.getenv("SCHEDULER_MIN_SYNC_AGE_SECONDS", "300"))
+SCHEDULER_MAX_PENDING = int(os.getenv("SCHEDULER_MAX_PENDING", str(SYNC_WORKERS * 4)))
+HASH_RING_REPLICAS = 160
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to shard indexes via virtual nodes."""
+
+    def __init__(self, shard_count: int, replicas: int = HASH_RING_REPLICAS):
+        points = sorted(
+            (_hash(f"shard-{shard}#{replica}"), shard)
+            for shard in range(shard_count)
+            for replica in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key) -> int:
+        index = bisect.bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._shards[index]
+
+
+def due_accounts(db, ring: HashRing, shard_index: int) -> list[GmailAccount]:
+    """This shard's connected accounts, least recently synced first."""
+    last_sync = db.query(
+        SyncJob.gmail_account_id,
+        func.max(SyncJob.created_at).label("last_sync"),
+    ).group_by(SyncJob.gmail_account_id).subquery()
+
+    # Job timestamps are naive UTC, so the cutoff must be too
+    cutoff = datetime.utcnow() - timedelta(seconds=SCHEDULER_MIN_SYNC_AGE_SECONDS)
+    accounts = db.query(GmailAccount).join(
+        GmailToken, GmailToken.gmail_account_id == GmailAccount.id
+    ).outerjoin(
+        last_sync, last_sync.c.gmail_account_id == GmailAccount.id
+    ).filter(
+        or_(last_sync.c.last_sync.is_(None), last_sync.c.last_sync < cutoff)
+    ).order_by(
+        # Never-synced accounts first
+        last_sync.c.last_sync.isnot(None), last_sync.c.last_sync, GmailAccount.id
+    ).all()
+    return [account for account in accounts if ring.shard_for(account.id) == shard_index]
+
+
+def schedule_once(ring: HashRing, shard_index: int, max_pending: int = SCHEDULER_MAX_PENDING) -> int:
+    """Enqueue due accounts for one shard; returns how many jobs were created."""
+    db = SessionLocal()
+    created = 0
+    try:
+        for account in due_accounts(db, ring, shard_index):
+            if pending_jobs() >= max_pending:
+                logger.info("Shard %d backlog full (%d), deferring the rest", shard_index, max_pending)
+                break
+            _, was_created = enqueue_sync(db, account)
+            created += int(was_created)
+    finally:
+        db.close()
+    return created
+
+
+def run_scheduler(shard_index: int, shard_count: int, interval: int = SCHEDULER_INTERVAL_SECONDS) -> None:
+    ring = HashRing(shard_count)
+    logger.info("Shard %d/%d started, interval %ds", shard_index, shard_count, interval)
+    while True:
+        recover_jobs(owns=lambda account_id: ring.shard_for(account_id) == shard_index)
+        created = schedule_once(ring, shard_index)
+        logger.info("Shard %d queued %d sync jobs, %d pending", shard_index, created, pending_jobs())
+        time.sleep(interval)
@@ -0,0 +1,261 @@
+"""Full-text search over stored messages.
+
+Postgres keeps a weighted ``tsvector`` per message in ``gmail_message_search``
+behind a GIN index on ``(gmail_account_id, document)``; SQLite uses an FTS5
+virtual table keyed by message id whose terms are prefixed with the owning
+account (``42_invoice``). Either way a query only reads, and ranks against,
+the searching user's mailboxes, so its cost does not grow with other users'
+mail. Rows are indexed incrementally by the sync path as messages are inserted.
+"""
+import logging
+import re
+
+from sqlalchemy import DateTime, Float, Integer, String, Text, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from utils.mime_utils import get_header, extract_text_body
+
+logger = logging.getLogger("search_utils")
+
+# Body text beyond this many characters is not indexed
+SEARCH_BODY_MAX_CHARS = 20_000
+
+# Word characters minus the underscore, which unicode61 also splits on
+_TERM_RE = re.compile(r"[^\W_]+")
+_FIELDS = ("subject", "sender", "snippet", "body")
+
+_POSTGRES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS gmail_message_search (
+        message_id INTEGER PRIMARY KEY REFERENCES gmail_messages(id) ON DELETE CASCADE,
+        gmail_account_id INTEGER NOT NULL,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    # btree_gin lets one GIN index cover the account equality and the match
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    """
+    CREATE INDEX IF NOT EXISTS ix_gmail_message_search_account_document
+    ON gmail_message_search USING GIN (gmail_account_id, document)
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_gmail_message_search_account ON gmail_message_search (gmail_account_id)",
+]
+
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS gmail_message_fts USING fts5(
+        subject, sender, snippet, body,
+        tokenize = "unicode61 remove_diacritics 2 tokenchars '_'"
+    )
+    """,
+]
+
+_SQLITE_INSERT = """
+    INSERT OR REPLACE INTO gmail_message_fts (rowid, subject, sender, snippet, body)
+    VALUES (:message_id, :subject, :sender, :snippet, :body)
+"""
+
+
+def _account_terms(gmail_account_id: int, value: str) -> str:
+    return " ".join(f"{gmail_account_id}_{term}" for term in _TERM_RE.findall(value))
+
+
+def _sqlite_row(row) -> dict:
+    account_id = row["gmail_account_id"]
+    return {"message_id": row["message_id"], **{f: _account_terms(account_id, row[f]) for f in _FIELDS}}
+
+
+def ensure_search_index(engine: Engine) -> None:
+    """Create the dialect-specific search structures if they do not exist."""
+    statements = {"postgresql": _POSTGRES_DDL, "sqlite": _SQLITE_DDL}.get(engine.dialect.name)
+    if statements is None:
+        logger.warning("Full-text search is not supported on %s", engine.dialect.name)
+        return
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+def search_document(detail: dict, content: dict | None = None) -> dict:
+    """Fields indexed for one Gmail message detail.
+
+    ``content`` is the detail's parse_message() result, when the caller
+    already has it, so the body is not decoded twice.
+    """
+    if content is not None:
+        return {
+            "subject": content["subject"] or "",
+            "sender": content["sender"] or "",
+            "snippet": detail.get("snippet") or "",
+            "body": (content["body_text"] or "")[:SEARCH_BODY_MAX_CHARS],
+        }
+    return {
+        "subject": get_header(detail, "Subject") or "",
+        "sender": get_header(detail, "From") or "",
+        "snippet": detail.get("snippet") or "",
+        "body": extract_text_body(detail)[:SEARCH_BODY_MAX_CHARS],
+    }
+
+
+def index_messages(db: Session, gmail_account_id: int, documents: dict[int, dict]) -> None:
+    """Add ``{message_id: search_document(...)}`` entries to the index."""
+    if not documents:
+        return
+
+    dialect = db.get_bind().dialect.name
+    rows = [{"message_id": message_id, "gmail_account_id": gmail_account_id, **doc} for message_id, doc in documents.items()]
+    if dialect == "postgresql":
+        db.execute(text("""
+            INSERT INTO gmail_message_search (message_id, gmail_account_id, document)
+            VALUES (
+                :message_id,
+                :gmail_account_id,
+                setweight(to_tsvector('english', :subject), 'A')
+                || setweight(to_tsvector('simple', :sender), 'B')
+                || setweight(to_tsvector('english', :snippet), 'C')
+                || setweight(to_tsvector('english', :body), 'D')
+            )
+            ON CONFLICT (message_id) DO NOTHING
+        """), rows)
+    elif dialect == "sqlite":
+        db.execute(text(_SQLITE_INSERT), [_sqlite_row(row) for row in rows])
+
+
+def unindex_messages(db: Session, message_ids: list[int]) -> None:
+    """Drop messages from the index. Postgres rows also go away via ON DELETE CASCADE."""
+    if not message_ids:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        db.execute(text("DELETE FROM gmail_message_fts WHERE rowid = :message_id"), [{"message_id": i} for i in message_ids])
+    elif dialect == "postgresql":
+        db.execute(text("DELETE FROM gmail_message_search WHERE message_id = :message_id"), [{"message_id": i} for i in message_ids])
+
+
+def _fts5_query(q: str, gmail_account_ids: list[int]) -> str:
+    # Quote every term so user input cannot inject FTS5 query syntax;
+    # the last term is a prefix match to support search-as-you-type.
+    # Terms carry the account, so "7_inv"* never expands into, or takes
+    # bm25 document counts from, another account's terms.
+    terms = _TERM_RE.findall(q)
+    if not terms:
+        return ""
+    groups = []
+    for account_id in gmail_account_ids:
+        quoted = [f'"{account_id}_{term}"' for term in terms]
+        quoted[-1] += "*"
+        groups.append(f"({' '.join(quoted)})")
+    return " OR ".join(groups)
+
+
+def search_messages(
+    db: Session,
+    gmail_account_ids: list[int],
+    q: str,
+    limit: int,
+    after: tuple[float, int] | None = None,
+) -> list:
+    """Ranked matches for ``q``, best first.
+
+    Each row has ``id, gmail_account_id, gmail_message_id, thread_id,
+    snippet, internal_date, score``; higher scores rank first. ``after`` is the ``(score, id)`` of
+    the last row of the previous page.
+    """
+    if not gmail_account_ids:
+        return []
+    dialect = db.get_bind().dialect.name
+    params = {"limit": limit}
+    keyset = ""
+    if after:
+        params["after_score"], params["after_id"] = after
+        keyset = "AND (score < :after_score OR (score = :after_score AND id < :after_id))"
+
+    if dialect == "postgresql":
+        # One equality per account rather than IN, so the planner can probe
+        # the (account, document) GIN index once per account
+        params.update({f"account_{i}": account_id for i, account_id in enumerate(gmail_account_ids)})
+        accounts = " OR ".join(f"s.gmail_account_id = :account_{i}" for i in range(len(gmail_account_ids)))
+        params["q"] = q
+        sql = f"""
+            SELECT * FROM (
+                SELECT m.id, m.gmail_account_id, m.gmail_message_id, m.thread_id, m.snippet, m.internal_date,
+                       ts_rank_cd(s.document, query)::float8 AS score
+                FROM gmail_message_search s
+                JOIN gmail_messages m ON m.id = s.message_id,
+                     websearch_to_tsquery('english', :q) AS query
+                WHERE ({accounts}) AND s.document @@ query
+            ) ranked
+            WHERE TRUE {keyset}
+            ORDER BY score DESC, id DESC
+            LIMIT :limit
+        """
+    elif dialect == "sqlite":
+        params["q"] = _fts5_query(q, gmail_account_ids)
+        if not params["q"]:
+            return []
+        # bm25() is lower-is-better, so negate it to get a descending score.
+        # The page is ranked and cut inside the index, so only ``limit`` rows
+        # are joined to gmail_messages.
+        sql = f"""
+            SELECT m.id, m.gmail_account_id, m.gmail_message_id, m.thread_id, m.snippet, m.internal_date, ranked.score
+            FROM (
+                SELECT id, score FROM (
+                    SELECT rowid AS id, -bm25(gmail_message_fts, 10.0, 5.0, 2.0, 1.0) AS score
+                    FROM gmail_message_fts
+                    WHERE gmail_message_fts MATCH :q
+                )
+                WHERE 1 = 1 {keyset}
+                ORDER BY score DESC, id DESC
+                LIMIT :limit
+            ) ranked
+            JOIN gmail_messages m ON m.id = ranked.id
+            ORDER BY ranked.score DESC, ranked.id DESC
+        """
+    else:
+        return []
+
+    stmt = text(sql).columns(
+        id=Integer,
+        gmail_account_id=Integer,
+        gmail_message_id=String,
+        thread_id=String,
+        snippet=Text,
+        internal_date=DateTime,
+        score=Float,
+    )
+    return db.execute(stmt, params).all()
+
+
+def rebuild_search_index(db: Session) -> int:
+    """Index every stored message; used to backfill existing mailboxes."""
+    from db import GmailMessage
+    from utils.payload_archive import payload_query, row_payload
+
+    indexed = 0
+    query = payload_query(db, GmailMessage.id, GmailMessage.gmail_account_id).order_by(GmailMessage.id)
+    batch: dict[int, dict[int, dict]] = {}
+    for row in query.yield_per(500):
+        batch.setdefault(row.gmail_account_id, {})[row.id] = search_document(row_payload(row))
+        indexed += 1
+        if indexed % 500 == 0:
+            for account, documents in batch.items():
+                unindex_messages(db, list(documents))
+                index_messages(db, account, documents)
+            batch = {}
+    for account, documents in batch.items():
+        unindex_messages(db, list(documents))
+        index_messages(db, account, documents)
+    db.commit()
+    return indexed
+
+
+if __name__ == "__main__":
+    from db import SessionLocal, engine
+
+    ensure_search_index(engine)
+    session = SessionLocal()
+    try:
+        print(f"[SEARCH] Indexed {rebuild_search_index(session)} messages")
+    finally:
+        session.close()
@@ -0,0 +1,263 @@
+"""Near-duplicate detection with MinHash signatures and an LSH bucket index.
+
+Each message gets a NUM_PERM-value MinHash signature over word 3-gram
+shingles of its snippet and decoded body, computed with NumPy for a whole
+batch at once (multiply-shift hashing, one ``minimum.reduceat`` per batch).
+The signature is cut into LSH_BANDS bands and every band hashes to a bucket
+key. Messages sharing a bucket are candidates, confirmed by comparing
+signatures.
+
+A message similar enough to an existing cluster joins it (``cluster_id``);
+otherwise it becomes the representative of a new cluster, and only
+representatives are written to gmail_lsh_buckets. A storm of thousands of
+identical notifications therefore costs one set of buckets, and a lookup
+is a few index probes on bucket keys and cluster_id, independent of
+mailbox size.
+"""
+import logging
+import os
+import re
+import zlib
+
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from db import GmailLshBucket, GmailMessage
+
+logger = logging.getLogger("similarity")
+
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 3
+# Enough of the body to tell templates apart without hashing whole newsletters
+MAX_TEXT_CHARS = 4000
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.8"))
+# Caps the work per lookup when a notification storm fills one bucket
+MAX_CANDIDATES = 500
+
+_WORD_RE = re.compile(r"\w+")
+
+# Fixed seeds so signatures stay comparable across processes and restarts
+_rng = np.random.default_rng(20240101)
+_PERM_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+_BAND_MULT = _rng.integers(1, 2**63, size=LSH_ROWS, dtype=np.uint64) | np.uint64(1)
+_BAND_SALT = _rng.integers(0, 2**63, size=LSH_BANDS, dtype=np.uint64)
+_EMPTY = np.iinfo(np.uint32).max
+
+
+def similarity_text(snippet: str | None, body_text: str | None) -> str:
+    return f"{snippet or ''} {(body_text or '')[:MAX_TEXT_CHARS]}"
+
+
+def _shingles(text: str) -> set[int]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        grams = words
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return {zlib.crc32(gram.encode("utf-8")) for gram in grams}
+
+
+def signatures(texts: list[str]) -> np.ndarray:
+    """MinHash signatures of a batch, shape ``(len(texts), NUM_PERM)``, uint32.
+
+    Texts without any words get an all-max signature and match nothing.
+    """
+    shingle_sets = [np.fromiter(_shingles(text), dtype=np.uint64) for text in texts]
+    out = np.full((len(texts), NUM_PERM), _EMPTY, dtype=np.uint32)
+    present = [i for i, s in enumerate(shingle_sets) if len(s)]
+    if not present:
+        return out
+
+    values = np.concatenate([shingle_sets[i] for i in present])
+    starts = np.cumsum([0] + [len(shingle_sets[i]) for i in present[:-1]])
+    # Multiply-shift hashing: uint64 arithmetic wraps, the high 32 bits are the hash
+    hashed = (_PERM_A[:, None] * values[None, :] + _PERM_B[:, None]) >> np.uint64(32)
+    out[present] = np.minimum.reduceat(hashed, starts, axis=1).T.astype(np.uint32)
+    return out
+
+
+def band_keys(sigs: np.ndarray) -> np.ndarray:
+    """One 63-bit bucket key per band, shape ``(len(sigs), LSH_BANDS)``."""
+    bands = sigs.astype(np.uint64).reshape(len(sigs), LSH_BANDS, LSH_ROWS)
+    keys = (bands * _BAND_MULT).sum(axis=2) ^ _BAND_SALT
+    return (keys >> np.uint64(1)).astype(np.int64)
+
+
+def estimated_similarity(sig: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity of one signature against each row of ``others``."""
+    return (others == sig).mean(axis=1)
+
+
+def _signature(blob: bytes | None) -> np.ndarray | None:
+    return np.frombuffer(blob, dtype=np.uint32) if blob else None
+
+
+def _is_empty(sig: np.ndarray) -> bool:
+    return bool((sig == _EMPTY).all())
+
+
+# ---------- Index ----------
+def _representatives(db: Session, gmail_account_id: int, keys) -> list:
+    """Cluster representatives sharing a bucket with any of ``keys``."""
+    keys = list({int(key) for key in keys})
+    if not keys:
+        return []
+    ids = db.query(GmailLshBucket.message_id).filter(
+        GmailLshBucket.gmail_account_id == gmail_account_id,
+        GmailLshBucket.bucket.in_(keys),
+    ).distinct().limit(MAX_CANDIDATES)
+    return db.query(GmailMessage.id, GmailMessage.minhash).filter(
+        GmailMessage.id.in_(ids.scalar_subquery()),
+        GmailMessage.minhash.isnot(None),
+    ).all()
+
+
+def index_similarity(db: Session, gmail_account_id: int, messages: list[tuple[int, str]]) -> None:
+    """Sign and cluster ``(message_id, text)`` pairs of one account; the caller commits.
+
+    Representatives created earlier in the batch are candidates for later
+    messages, so duplicates within one sync page cluster together too.
+    """
+    if not messages:
+        return
+    message_ids = [message_id for message_id, _ in messages]
+    sigs = signatures([text for _, text in messages])
+    keys = band_keys(sigs)
+
+    # One lookup for the whole batch; new representatives are added as we go
+    known = {row.id: _signature(row.minhash) for row in _representatives(db, gmail_account_id, keys.ravel())}
+    buckets: dict[int, set[int]] = {}
+    if known:
+        for row in db.query(GmailLshBucket.bucket, GmailLshBucket.message_id).filter(
+            GmailLshBucket.message_id.in_(list(known)),
+        ):
+            buckets.setdefault(row.bucket, set()).add(row.message_id)
+
+    clusters, new_buckets = {}, []
+    for message_id, sig, row_keys in zip(message_ids, sigs, keys.tolist()):
+        cluster_id, best = message_id, 0.0
+        if not _is_empty(sig):
+            candidates = set().union(*(buckets.get(key, ()) for key in row_keys))
+            for candidate in candidates:
+                score = float((known[candidate] == sig).mean())
+                if score >= SIMILARITY_THRESHOLD and score > best:
+                    best, cluster_id = score, candidate
+            if cluster_id == message_id:
+                known[message_id] = sig
+                for key in row_keys:
+                    buckets.setdefault(key, set()).add(message_id)
+                    new_buckets.append({"gmail_account_id": gmail_account_id, "bucket": key, "message_id": message_id})
+        clusters[message_id] = cluster_id
+
+    if new_buckets:
+        db.execute(GmailLshBucket.__table__.insert(), new_buckets)
+    db.execute(update(GmailMessage), [
+        {"id": message_id, "minhash": sig.tobytes(), "cluster_id": clusters[message_id]}
+        for message_id, sig in zip(message_ids, sigs)
+    ])
+
+
+def similar_messages(db: Session, message_id: int, gmail_account_id: int, limit: int = 20) -> list[tuple[int, float]]:
+    """``(message_id, similarity)`` of near-duplicates, most similar first.
+
+    Covers the message's own cluster and any other cluster whose
+    representative is similar to it.
+    """
+    row = db.query(GmailMessage.minhash, GmailMessage.cluster_id).filter(GmailMessage.id == message_id).first()
+    sig = _signature(row.minhash) if row else None
+    if sig is None or _is_empty(sig):
+        return []
+
+    cluster_ids = {row.cluster_id} if row.cluster_id else set()
+    for rep in _representatives(db, gmail_account_id, band_keys(sig[None, :])[0]):
+        if estimated_similarity(sig, _signature(rep.minhash)[None, :])[0] >= SIMILARITY_THRESHOLD:
+            cluster_ids.add(rep.id)
+    if not cluster_ids:
+        return []
+
+    members = db.query(GmailMessage.id, GmailMessage.minhash).filter(
+        GmailMessage.gmail_account_id == gmail_account_id,
+        GmailMessage.cluster_id.in_(list(cluster_ids)),
+        GmailMessage.id != message_id,
+        GmailMessage.minhash.isnot(None),
+    ).order_by(GmailMessage.internal_date.desc()).limit(MAX_CANDIDATES).all()
+    if not members:
+        return []
+    scores = estimated_similarity(sig, np.stack([_signature(m.minhash) for m in members]))
+    ranked = sorted(zip((m.id for m in members), scores.tolist()), key=lambda pair: -pair[1])
+    return ranked[:limit]
+
+
+def drop_similarity(db: Session, message_ids: list[int]) -> None:
+    """Remove bucket rows of messages about to be deleted; the caller deletes them.
+
+    A cluster whose representative goes but whose other members stay is
+    handed to its oldest surviving member, which takes over the bucket rows
+    so the cluster can still be found and joined.
+    """
+    if not message_ids:
+        return
+    orphaned = {row.id for row in db.query(GmailMessage.id).filter(
+        GmailMessage.id.in_(message_ids),
+        GmailMessage.cluster_id == GmailMessage.id,
+    )}
+    db.query(GmailLshBucket).filter(
+        GmailLshBucket.message_id.in_(message_ids),
+    ).delete(synchronize_session=False)
+    if not orphaned:
+        return
+
+    survivors = db.query(
+        GmailMessage.id, GmailMessage.gmail_account_id, GmailMessage.cluster_id, GmailMessage.minhash,
+    ).filter(
+        GmailMessage.cluster_id.in_(list(orphaned)),
+        GmailMessage.id.notin_(message_ids),
+    ).order_by(GmailMessage.id).all()
+    heirs = {}
+    for row in survivors:
+        heirs.setdefault(row.cluster_id, row)
+    if not heirs:
+        return
+
+    new_buckets = []
+    for heir in heirs.values():
+        sig = _signature(heir.minhash)
+        for key in band_keys(sig[None, :])[0].tolist():
+            new_buckets.append({"gmail_account_id": heir.gmail_account_id, "bucket": key, "message_id": heir.id})
+    db.execute(GmailLshBucket.__table__.insert(), new_buckets)
+    for old_id, heir in heirs.items():
+        db.query(GmailMessage).filter(
+            GmailMessage.cluster_id == old_id,
+            GmailMessage.id.notin_(message_ids),
+        ).update({GmailMessage.cluster_id: heir.id}, synchronize_session=False)
+    logger.debug("Handed %d clusters to new representatives", len(heirs))
+
+
+def backfill_similarity(db: Session, gmail_account_id: int, batch_size: int = 200) -> int:
+    """Index every message of an account stored before signatures existed, oldest first."""
+    count = 0
+    while True:
+        rows = db.query(GmailMessage.id, GmailMessage.snippet, GmailMessage.body_text).filter(
+            GmailMessage.gmail_account_id == gmail_account_id,
+            GmailMessage.minhash.is_(None),
+        ).order_by(GmailMessage.id).limit(batch_size).all()
+        if not rows:
+            return count
+        index_similarity(db, gmail_account_id, [(r.id, similarity_text(r.snippet, r.body_text)) for r in rows])
+        db.commit()
+        count += len(rows)
+
+
+if __name__ == "__main__":
+    from db import SessionLocal, GmailAccount
+
+    session = SessionLocal()
+    try:
+        for (account_id,) in session.query(GmailAccount.id).all():
+            print(f"[SIMILARITY] Indexed {backfill_similarity(session, account_id)} messages of account {account_id}")
+    finally:
+        session.close()
@@ -0,0 +1,234 @@
+"""In-process background queue for Gmail sync jobs.
+
+Jobs are persisted in the ``sync_jobs`` table so their progress can be
+polled from any request, and a partial unique index keeps at most one
+queued/running job per Gmail account.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, GmailAccount, SyncJob
+from utils import events
+from utils.gmail_sync import SyncProgress, sync_account
+
+logger = logging.getLogger("sync_jobs")
+
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "4"))
+# A running job's worker writes heartbeat_at this often, independent of
+# page progress, so a slow page or a long Retry-After does not look dead
+SYNC_JOB_HEARTBEAT_SECONDS = int(os.getenv("SYNC_JOB_HEARTBEAT_SECONDS", "30"))
+# Running jobs without a heartbeat for this long are considered dead
+SYNC_JOB_STALE_SECONDS = int(os.getenv("SYNC_JOB_STALE_SECONDS", "600"))
+ACTIVE_STATUSES = ("queued", "running")
+
+_executor = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="gmail-sync")
+_pending = 0
+_pending_lock = threading.Lock()
+# Job ids handed to _executor and not finished yet, so recover_jobs does
+# not submit a still-queued job again on every scheduler tick
+_submitted: set[int] = set()
+
+
+def pending_jobs() -> int:
+    """Jobs submitted to this process's pool that have not finished yet."""
+    return _pending
+
+
+def _submit(job_id: int) -> None:
+    global _pending
+    with _pending_lock:
+        if job_id in _submitted:
+            return
+        _submitted.add(job_id)
+        _pending += 1
+    _executor.submit(_run_job, job_id)
+
+
+def _active_job(db: Session, gmail_account_id: int) -> SyncJob | None:
+    return db.query(SyncJob).filter(
+        SyncJob.gmail_account_id == gmail_account_id,
+        SyncJob.status.in_(ACTIVE_STATUSES),
+    ).first()
+
+
+def _fail_stale_jobs(db: Session, gmail_account_id: int | None = None) -> None:
+    """Mark running jobs without a heartbeat for SYNC_JOB_STALE_SECONDS failed; commits."""
+    stale_before = datetime.utcnow() - timedelta(seconds=SYNC_JOB_STALE_SECONDS)
+    query = db.query(SyncJob).filter(
+        SyncJob.status == "running",
+        SyncJob.heartbeat_at < stale_before,
+    )
+    if gmail_account_id is not None:
+        query = query.filter(SyncJob.gmail_account_id == gmail_account_id)
+    query.update(
+        {"status": "failed", "error": "Worker stopped sending heartbeats", "finished_at": datetime.utcnow()},
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def enqueue_sync(db: Session, gmail: GmailAccount) -> tuple[SyncJob, bool]:
+    """Queue a sync for ``gmail``; returns ``(job, created)``.
+
+    If the account already has a queued or running job, that job is
+    returned instead of creating a second one. A running job whose worker
+    died (e.g. the process restarted) is failed here once it is stale, so
+    it cannot block the account forever.
+    """
+    _fail_stale_jobs(db, gmail.id)
+    existing = _active_job(db, gmail.id)
+    if existing:
+        return existing, False
+
+    job = SyncJob(gmail_account_id=gmail.id, status="queued")
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Lost the race against another request for the same account
+        db.rollback()
+        return _active_job(db, gmail.id), False
+
+    _submit(job.id)
+    logger.info("Queued sync job %s for account %s", job.id, gmail.id)
+    return job, True
+
+
+def _heartbeat(job_id: int, stop: threading.Event) -> None:
+    while not stop.wait(SYNC_JOB_HEARTBEAT_SECONDS):
+        db = SessionLocal()
+        try:
+            db.query(SyncJob).filter(SyncJob.id == job_id, SyncJob.status == "running").update(
+                {"heartbeat_at": datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        except Exception:
+            logger.exception("Heartbeat for sync job %s failed", job_id)
+        finally:
+            db.close()
+
+
+def _finish(db: Session, job_id: int, **values) -> None:
+    # Only while still running: a job failed as stale may since have been
+    # replaced by another sync of the account, and must stay failed
+    now = datetime.utcnow()
+    finished = db.query(SyncJob).filter(SyncJob.id == job_id, SyncJob.status == "running").update(
+        {**values, "finished_at": now, "updated_at": now}, synchronize_session=False
+    )
+    db.commit()
+    if finished:
+        _publish_status(db.get(SyncJob, job_id, populate_existing=True))
+    else:
+        logger.warning("Sync job %s was no longer running when it finished", job_id)
+
+
+def _run_job(job_id: int) -> None:
+    global _pending
+    db = SessionLocal()
+    stop = threading.Event()
+    try:
+        # Claim the job atomically; another process may have picked it up
+        now = datetime.utcnow()
+        claimed = db.query(SyncJob).filter(
+            SyncJob.id == job_id,
+            SyncJob.status == "queued",
+        ).update(
+            {"status": "running", "started_at": now, "updated_at": now, "heartbeat_at": now},
+            synchronize_session=False,
+        )
+        db.commit()
+        if not claimed:
+            return
+        threading.Thread(
+            target=_heartbeat, args=(job_id, stop), name=f"sync-heartbeat-{job_id}", daemon=True,
+        ).start()
+        job = db.get(SyncJob, job_id)
+        _publish_status(job)
+
+        def report(progress: SyncProgress) -> None:
+            updated = db.query(SyncJob).filter(SyncJob.id == job_id, SyncJob.status == "running").update({
+                "mode": progress.mode,
+                "pages_done": progress.pages_done,
+                "messages_seen": progress.messages_seen,
+                "messages_stored": progress.messages_stored,
+                "messages_total": progress.messages_total,
+                "updated_at": datetime.utcnow(),
+            }, synchronize_session=False)
+            db.commit()
+            if not updated:
+                # Failed as stale; stop rather than race the sync that replaced it
+                raise RuntimeError(f"Sync job {job_id} is no longer running")
+            db.refresh(job)
+            _publish_status(job)
+
+        progress = sync_account(db, job.gmail_account, SyncProgress(on_update=report))
+        report(progress)
+        _finish(db, job_id, status="done")
+    except Exception as e:
+        logger.exception("Sync job %s failed", job_id)
+        db.rollback()
+        _finish(db, job_id, status="failed", error=str(e))
+    finally:
+        stop.set()
+        db.close()
+        with _pending_lock:
+            _pending -= 1
+            _submitted.discard(job_id)
+
+
+def _publish_status(job: SyncJob) -> None:
+    gmail = job.gmail_account
+    events.publish(gmail.user_id, "sync_progress", {**job_status(job), "email": gmail.google_email})
+
+
+def job_status(job: SyncJob) -> dict:
+    """Serialize a job with its throughput and estimated time remaining."""
+    rate = None
+    eta_seconds = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+        if elapsed > 0:
+            rate = job.messages_seen / elapsed
+        if job.status == "running" and rate and job.messages_total is not None:
+            eta_seconds = max(job.messages_total - job.messages_seen, 0) / rate
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "mode": job.mode,
+        "pages_done": job.pages_done,
+        "messages_seen": job.messages_seen,
+        "messages_stored": job.messages_stored,
+        "messages_total": job.messages_total,
+        "rate": round(rate, 2) if rate is not None else None,
+        "eta_seconds": round(eta_seconds, 1) if eta_seconds is not None else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def recover_jobs(owns: Callable[[int], bool] | None = None) -> None:
+    """Fail jobs whose worker died and pick up queued jobs nobody is running.
+
+    ``owns`` limits the queued jobs picked up to the accounts it accepts,
+    so scheduler shards only take their own.
+    """
+    db = SessionLocal()
+    try:
+        _fail_stale_jobs(db)
+        for job_id, gmail_account_id in db.query(SyncJob.id, SyncJob.gmail_account_id).filter(
+            SyncJob.status == "queued",
+        ).all():
+            if owns is None or owns(gmail_account_id):
+                _submit(job_id)
+    finally:
+        db.close()
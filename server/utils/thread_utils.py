@@ -0,0 +1,170 @@
+"""Maintenance of the materialized ``gmail_threads`` table."""
+from datetime import datetime
+from email.utils import getaddresses
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from db import GmailMessage, GmailThread
+from utils.mime_utils import get_header
+from utils.payload_archive import payload_query, row_payload
+
+# Participant lists are capped so huge mailing-list threads stay small
+THREAD_MAX_PARTICIPANTS = 50
+
+
+def message_participants(detail: dict) -> list[str]:
+    """Lower-cased addresses from the From, To and Cc headers of a message."""
+    values = [get_header(detail, name) or "" for name in ("From", "To", "Cc")]
+    return [address.lower() for _, address in getaddresses(values) if address]
+
+
+def _merge_participants(current: list[str], new: list[str]) -> list[str]:
+    merged = list(current)
+    for address in new:
+        if address not in merged:
+            merged.append(address)
+    return merged[:THREAD_MAX_PARTICIPANTS]
+
+
+def apply_new_messages(db: Session, gmail_account_id: int, details: list[dict]) -> None:
+    """Fold newly stored message details into their thread summaries."""
+    if not details:
+        return
+
+    by_thread: dict[str, list[dict]] = {}
+    for detail in details:
+        by_thread.setdefault(detail["threadId"], []).append(detail)
+
+    existing = {
+        t.thread_id: t
+        for t in db.query(GmailThread).filter(
+            GmailThread.gmail_account_id == gmail_account_id,
+            GmailThread.thread_id.in_(list(by_thread)),
+        )
+    }
+
+    for thread_id, messages in by_thread.items():
+        thread = existing.get(thread_id)
+        if thread is None:
+            thread = GmailThread(
+                gmail_account_id=gmail_account_id,
+                thread_id=thread_id,
+                message_count=0,
+                participants=[],
+            )
+            db.add(thread)
+
+        latest = max(messages, key=lambda d: int(d.get("internalDate", 0)))
+        latest_date = datetime.utcfromtimestamp(int(latest.get("internalDate", 0)) / 1000)
+        if thread.last_message_date is None or latest_date >= thread.last_message_date:
+            thread.last_message_date = latest_date
+            thread.snippet = latest.get("snippet")
+
+        thread.message_count = (thread.message_count or 0) + len(messages)
+        participants = [address for detail in messages for address in message_participants(detail)]
+        thread.participants = _merge_participants(thread.participants or [], participants)
+
+
+def _stored_participants(db: Session, gmail_account_id: int, thread_ids: set[str]) -> dict[str, list[str]]:
+    """Participants of each thread from its stored messages, oldest message first.
+
+    Uses the parsed From/To/Cc columns, reading the payload only for rows
+    stored before ingest-time parsing.
+    """
+    rows = db.query(
+        GmailMessage.id,
+        GmailMessage.thread_id,
+        GmailMessage.sender,
+        GmailMessage.recipients,
+        GmailMessage.body_text.is_(None).label("unparsed"),
+    ).filter(
+        GmailMessage.gmail_account_id == gmail_account_id,
+        GmailMessage.thread_id.in_(list(thread_ids)),
+    ).order_by(GmailMessage.internal_date, GmailMessage.id).all()
+
+    unparsed = [row.id for row in rows if row.unparsed]
+    details = {}
+    if unparsed:
+        details = {
+            row.id: row_payload(row) or {}
+            for row in payload_query(db, GmailMessage.id).filter(GmailMessage.id.in_(unparsed))
+        }
+
+    participants: dict[str, list[str]] = {}
+    for row in rows:
+        if row.id in details:
+            addresses = message_participants(details[row.id])
+        else:
+            addresses = [a.lower() for _, a in getaddresses([row.sender or "", row.recipients or ""]) if a]
+        participants[row.thread_id] = _merge_participants(participants.get(row.thread_id, []), addresses)
+    return participants
+
+
+def refresh_threads(db: Session, gmail_account_id: int, thread_ids: set[str]) -> None:
+    """Recompute counts, dates, snippets and participants after messages were removed."""
+    if not thread_ids:
+        return
+
+    stats = {
+        row.thread_id: row
+        for row in db.query(
+            GmailMessage.thread_id,
+            func.count(GmailMessage.id).label("message_count"),
+            func.max(GmailMessage.internal_date).label("last_message_date"),
+        ).filter(
+            GmailMessage.gmail_account_id == gmail_account_id,
+            GmailMessage.thread_id.in_(list(thread_ids)),
+        ).group_by(GmailMessage.thread_id)
+    }
+
+    participants = _stored_participants(db, gmail_account_id, thread_ids)
+
+    threads = db.query(GmailThread).filter(
+        GmailThread.gmail_account_id == gmail_account_id,
+        GmailThread.thread_id.in_(list(thread_ids)),
+    ).all()
+    for thread in threads:
+        row = stats.get(thread.thread_id)
+        if row is None:
+            db.delete(thread)
+            continue
+        thread.message_count = row.message_count
+        thread.participants = participants.get(thread.thread_id, [])
+        if thread.last_message_date != row.last_message_date:
+            thread.last_message_date = row.last_message_date
+            thread.snippet = db.query(GmailMessage.snippet).filter(
+                GmailMessage.gmail_account_id == gmail_account_id,
+                GmailMessage.thread_id == thread.thread_id,
+            ).order_by(GmailMessage.internal_date.desc()).limit(1).scalar()
+
+
+def rebuild_threads(db: Session, gmail_account_id: int) -> int:
+    """Rebuild every thread summary of an account from its stored messages."""
+    db.query(GmailThread).filter(GmailThread.gmail_account_id == gmail_account_id).delete(synchronize_session=False)
+    batch = []
+    query = payload_query(db, GmailMessage.id).filter(
+        GmailMessage.gmail_account_id == gmail_account_id
+    ).order_by(GmailMessage.id)
+    count = 0
+    for row in query.yield_per(500):
+        batch.append(row_payload(row))
+        count += 1
+        if len(batch) == 500:
+            apply_new_messages(db, gmail_account_id, batch)
+            db.flush()
+            batch = []
+    apply_new_messages(db, gmail_account_id, batch)
+    db.commit()
+    return count
+
+
+if __name__ == "__main__":
+    from db import SessionLocal, GmailAccount
+
+    session = SessionLocal()
+    try:
+        for (account_id,) in session.query(GmailAccount.id).all():
+            print(f"[THREADS] Rebuilt account {account_id} from {rebuild_threads(session, account_id)} messages")
+    finally:
+        session.close()
@@ -0,0 +1,78 @@
+"""In-memory access-token cache for connected Gmail accounts.
+
+Access tokens are served from memory until they come within
+TOKEN_REFRESH_MARGIN of expiry, then refreshed ahead of time. Refreshes are
+single-flight per account: concurrent callers wait for the one refresh in
+progress instead of each hitting the OAuth endpoint.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from db import SessionLocal, GmailToken
+from utils.gmail_utils import refresh_access_token
+from utils.metrics import TOKEN_REFRESHES
+
+logger = logging.getLogger("token_manager")
+
+TOKEN_REFRESH_MARGIN = timedelta(seconds=int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300")))
+
+
+class TokenManager:
+    def __init__(self, margin: timedelta = TOKEN_REFRESH_MARGIN):
+        self.margin = margin
+        self.refreshes = 0
+        self._tokens: dict[int, tuple[str, datetime]] = {}
+        self._locks: dict[int, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, gmail_account_id: int) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(gmail_account_id, threading.Lock())
+
+    def _fresh(self, expires_at: datetime) -> bool:
+        return expires_at - self.margin > datetime.utcnow()
+
+    def get_access_token(self, gmail_account_id: int) -> str:
+        """Return a valid access token for the account, refreshing it if needed."""
+        cached = self._tokens.get(gmail_account_id)
+        if cached and self._fresh(cached[1]):
+            return cached[0]
+
+        with self._lock_for(gmail_account_id):
+            # Another thread may have refreshed while we waited for the lock
+            cached = self._tokens.get(gmail_account_id)
+            if cached and self._fresh(cached[1]):
+                return cached[0]
+
+            db = SessionLocal()
+            try:
+                token = db.get(GmailToken, gmail_account_id)
+                if token is None:
+                    raise RuntimeError(f"Gmail account {gmail_account_id} has no stored token")
+
+                # Another process may already have stored a fresh token
+                if not self._fresh(token.expires_at):
+                    logger.info("Refreshing access token for account %s", gmail_account_id)
+                    try:
+                        new_token = refresh_access_token(token.refresh_token)
+                    except Exception:
+                        TOKEN_REFRESHES.inc(result="error")
+                        raise
+                    token.access_token = new_token["access_token"]
+                    token.expires_at = new_token["expires_at"]
+                    db.commit()
+                    self.refreshes += 1
+                    TOKEN_REFRESHES.inc(result="ok")
+
+                self._tokens[gmail_account_id] = (token.access_token, token.expires_at)
+                return token.access_token
+            finally:
+                db.close()
+
+    def invalidate(self, gmail_account_id: int) -> None:
+        self._tokens.pop(gmail_account_id, None)
+
+
+token_manager = TokenManager()
@@ -0,0 +1,54 @@
+"""Background sync workers.
+
+Starts one process per shard; each process runs the periodic scheduler for
+its slice of the connected accounts and syncs them with its own job pool.
+One more process periodically moves old message payloads to the
+compressed archive (utils.payload_archive).
+
+    python worker.py --processes 4 --archive-interval 3600
+"""
+import argparse
+import logging
+import multiprocessing
+
+# Shards and the compaction process report through logging
+logging.basicConfig(level=logging.INFO)
+
+
+def _run_shard(shard_index: int, shard_count: int, interval: int) -> None:
+    from utils.scheduler import run_scheduler
+
+    run_scheduler(shard_index, shard_count, interval)
+
+
+def _run_compaction(interval: int) -> None:
+    from utils.payload_archive import run_compaction
+
+    run_compaction(interval)
+
+
+if __name__ == "__main__":
+    from utils.payload_archive import PAYLOAD_ARCHIVE_INTERVAL_SECONDS
+    from utils.scheduler import SCHEDULER_INTERVAL_SECONDS
+
+    parser = argparse.ArgumentParser(description="Run Gmail sync worker processes")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--interval", type=int, default=SCHEDULER_INTERVAL_SECONDS, help="seconds between scheduling passes")
+    parser.add_argument(
+        "--archive-interval", type=int, default=PAYLOAD_ARCHIVE_INTERVAL_SECONDS,
+        help="seconds between payload compaction passes; 0 disables compaction",
+    )
+    args = parser.parse_args()
+
+    processes = [
+        multiprocessing.Process(target=_run_shard, args=(i, args.processes, args.interval), name=f"sync-shard-{i}")
+        for i in range(args.processes)
+    ]
+    if args.archive_interval > 0:
+        processes.append(multiprocessing.Process(
+            target=_run_compaction, args=(args.archive_interval,), name="payload-archive",
+        ))
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()